@@ -18,16 +18,8 @@ def _debut_fin_mois(date):
 
 
 def _base_ctx(request):
-    """Contexte commun à tous les dashboards (notifications)."""
-    ctx = {'aujourd_hui': timezone.now().date(), 'unread_notifications_count': 0, 'notifications': []}
-    try:
-        from apps.notifs.models import Notification
-        notifs = Notification.objects.filter(destinataire=request.user, est_lue=False)
-        ctx['unread_notifications_count'] = notifs.count()
-        ctx['notifications'] = notifs.order_by('-date_creation')[:5]
-    except Exception:
-        pass
-    return ctx
+    """Contexte commun à tous les dashboards (les notifications viennent du context processor)."""
+    return {'aujourd_hui': timezone.now().date()}
 
 
 # ============================================
@@ -57,7 +49,7 @@ def admin_dashboard(request):
 
     from apps.accounts.models import Utilisateur, Direction, Agence
     from apps.tickets.models import Ticket
-    from apps.transactions.models import TransactionTicket
+    from apps.transactions.models import TransactionTicket, StatistiqueJournaliere
     from apps.restaurants.models import Restaurant
 
     aujourd_hui = timezone.now().date()
@@ -89,11 +81,9 @@ def admin_dashboard(request):
 
     # ── Graphe 30 jours — tickets vendus ──────────────────
     graph_labels, graph_values = [], []
-    for i in range(29, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = Ticket.objects.filter(valide_de=j).count()
-        graph_labels.append(j.strftime('%d/%m'))
-        graph_values.append(nb)
+    for ligne in StatistiqueJournaliere.serie(30, 'tickets_vendus', fin=aujourd_hui):
+        graph_labels.append(ligne['date'].strftime('%d/%m'))
+        graph_values.append(ligne['tickets_vendus'])
 
     # ── Transactions récentes ─────────────────────────────
     transactions_recentes = TransactionTicket.objects.select_related(
@@ -142,7 +132,7 @@ def caissier_dashboard(request):
     if not (request.user.est_caissier or request.user.est_admin):
         return redirect('accounts:client_dashboard')
 
-    from apps.transactions.models import TransactionTicket
+    from apps.transactions.models import TransactionTicket, StatistiqueJournaliere
     from apps.tickets.models import Ticket, CodeQR
 
     aujourd_hui = timezone.now().date()
@@ -171,14 +161,10 @@ def caissier_dashboard(request):
 
     # ── Graphe 30 jours ────────────────────────────────────
     graph_labels, graph_tickets, graph_montants = [], [], []
-    for i in range(29, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        agg = mes_transactions.filter(
-            statut='TERMINEE', date_transaction__date=j
-        ).aggregate(t=Sum('nombre_tickets'), s=Sum('montant_total'))
-        graph_labels.append(j.strftime('%d/%m'))
-        graph_tickets.append(agg['t'] or 0)
-        graph_montants.append(float(agg['s'] or 0))
+    for ligne in StatistiqueJournaliere.serie(30, 'tickets_vendus', 'montant', fin=aujourd_hui, caissier=request.user):
+        graph_labels.append(ligne['date'].strftime('%d/%m'))
+        graph_tickets.append(ligne['tickets_vendus'])
+        graph_montants.append(float(ligne['montant']))
 
     # ── Transactions récentes ─────────────────────────────
     recentes = mes_transactions.select_related('client').order_by('-date_transaction')[:10]
@@ -234,6 +220,7 @@ def gestionnaire_dashboard(request):
         return redirect('accounts:profile')
 
     from apps.restaurants.models import Menu, Reservation
+    from apps.transactions.models import StatistiqueJournaliere
 
     aujourd_hui = timezone.now().date()
     debut_mois, _ = _debut_fin_mois(aujourd_hui)
@@ -261,11 +248,9 @@ def gestionnaire_dashboard(request):
 
     # ── Graphe 14 jours ───────────────────────────────────
     graph_labels, graph_values = [], []
-    for i in range(13, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = tickets_qs.filter(date_consommation__date=j).count()
-        graph_labels.append(j.strftime('%d/%m'))
-        graph_values.append(nb)
+    for ligne in StatistiqueJournaliere.serie(14, 'tickets_consommes', fin=aujourd_hui, restaurant=restaurant):
+        graph_labels.append(ligne['date'].strftime('%d/%m'))
+        graph_values.append(ligne['tickets_consommes'])
 
     # ── Derniers scans ────────────────────────────────────
     derniers_scans = tickets_qs.filter(
@@ -305,7 +290,8 @@ def gestionnaire_dashboard(request):
 # ============================================================
 @login_required
 def client_dashboard(request):
-    from apps.tickets.models import Ticket, CodeQR
+    from apps.tickets.models import Ticket, CodeQR, PorteMonnaieTicket
+    from apps.settings.series import serie_temporelle
     from apps.restaurants.models import Reservation, Menu
 
     aujourd_hui = timezone.now().date()
@@ -313,17 +299,14 @@ def client_dashboard(request):
 
     mes_tickets = Ticket.objects.filter(proprietaire=request.user)
 
-    # ── Stats ──────────────────────────────────────────────
-    tickets_disponibles = mes_tickets.filter(statut='DISPONIBLE').count()
-    tickets_consommes   = mes_tickets.filter(statut='CONSOMME').count()
-    tickets_expires     = mes_tickets.filter(statut='EXPIRE').count()
-    total_tickets       = mes_tickets.count()
-
-    valeur_disponible = mes_tickets.filter(
-        statut='DISPONIBLE'
-    ).aggregate(s=Sum('prix_paye'))['s'] or 0
-
-    valeur_totale = mes_tickets.aggregate(s=Sum('prix_paye'))['s'] or 0
+    # ── Stats (porte-monnaie, toutes périodes : une requête) ──
+    solde = PorteMonnaieTicket.solde(request.user)
+    tickets_disponibles = solde.disponibles
+    tickets_consommes   = solde.consommes
+    tickets_expires     = solde.expires
+    total_tickets       = solde.total
+    valeur_disponible   = solde.valeur_disponible
+    valeur_totale       = solde.valeur_totale
 
     # ── Réservations ─────────────────────────────────────
     mes_reservations = Reservation.objects.filter(
@@ -368,11 +351,12 @@ def client_dashboard(request):
 
     # ── Graphe 7 jours consommations ─────────────────────
     graph_labels, graph_values = [], []
-    for i in range(6, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = mes_tickets.filter(statut='CONSOMME', date_consommation__date=j).count()
-        graph_labels.append(j.strftime('%a'))
-        graph_values.append(nb)
+    for ligne in serie_temporelle(
+        mes_tickets.filter(statut='CONSOMME'), 'date_consommation',
+        aujourd_hui - timezone.timedelta(days=6), aujourd_hui,
+    ):
+        graph_labels.append(ligne['periode'].strftime('%a'))
+        graph_values.append(ligne['total'])
 
     ctx = _base_ctx(request)
     ctx.update({
@@ -1,13 +1,16 @@
 """
 accounts/exports.py
-Gestion centralisée de tous les exports (PDF / Excel) pour l'application accounts.
+Gestion centralisée de tous les exports (PDF / Excel / CSV) pour l'application accounts.
+Excel et CSV passent par le moteur d'export en flux (apps.settings.exportation).
+Les PDF sont construits en tâche de fond (apps.settings.rapports_pdf) : la vue
+crée ou réutilise la tâche, puis renvoie vers sa page de suivi.
 """
-from io import BytesIO
-from django.http import HttpResponse
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 
+from apps.settings.exportation import TAILLE_PAQUET, exporter, format_demande
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Utilitaires communs
@@ -38,40 +41,6 @@ def _get_reportlab():
         raise ImportError("ReportLab n'est pas installé. Exécutez : pip install reportlab")
 
 
-def _get_openpyxl():
-    """Import lazy de openpyxl pour éviter les erreurs si non installé."""
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        return {
-            'Workbook': Workbook, 'Font': Font, 'PatternFill': PatternFill,
-            'Alignment': Alignment, 'Border': Border, 'Side': Side,
-            'get_column_letter': get_column_letter,
-        }
-    except ImportError:
-        raise ImportError("openpyxl n'est pas installé. Exécutez : pip install openpyxl")
-
-
-def _pdf_response(buffer, filename):
-    """Retourne une HttpResponse PDF à télécharger."""
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
-
-
-def _excel_response(buffer, filename):
-    """Retourne une HttpResponse Excel à télécharger."""
-    buffer.seek(0)
-    response = HttpResponse(
-        buffer,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
-
-
 def _build_pdf_doc(buffer, title_text, rl):
     """Crée un document PDF avec un style de titre commun."""
     doc = rl['SimpleDocTemplate'](
@@ -140,89 +109,93 @@ def _table_style(rl, header_rows=1):
     ])
 
 
-def _excel_header_style(xl):
-    """Style d'en-tête commun pour les fichiers Excel."""
-    return {
-        'font': xl['Font'](bold=True, color='FFFFFF', size=10),
-        'fill': xl['PatternFill'](start_color='1e5c3a', end_color='1e5c3a', fill_type='solid'),
-        'alignment': xl['Alignment'](horizontal='center', vertical='center', wrap_text=True),
-    }
+def version_comptes():
+    """Nombre et dernière modification des utilisateurs, directions et agences : change dès qu'un export PDF changerait"""
+    from .models import Utilisateur, Direction, Agence
+    from django.db.models import Count, Max
 
+    return '|'.join(
+        '{n}:{maj}'.format(**modele.objects.aggregate(n=Count('pk'), maj=Max('date_modification')))
+        for modele in (Utilisateur, Direction, Agence)
+    )
 
-def _excel_apply_header(ws, headers, xl):
-    """Applique les en-têtes Excel avec le style LONAB."""
-    style = _excel_header_style(xl)
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = style['font']
-        cell.fill = style['fill']
-        cell.alignment = style['alignment']
 
+def _construire_pdf(destination, titre, resume, entete, rangees, largeurs, total, progression):
+    """
+    Écrit le PDF dans `destination` : tableaux de TAILLE_TABLEAU lignes.
+    Progression : lecture des lignes jusqu'à 30 %, mise en page ensuite.
+    """
+    from apps.settings.rapports_pdf import TAILLE_TABLEAU, tableaux_par_lots
 
-def _excel_add_alt_rows(ws, start_row, xl):
-    """Ajoute des lignes alternées pour une meilleure lisibilité."""
-    alt_fill = xl['PatternFill'](start_color='f2faf5', end_color='f2faf5', fill_type='solid')
-    for i, row in enumerate(ws.iter_rows(min_row=start_row, max_row=ws.max_row)):
-        for cell in row:
-            if i % 2 == 1:
-                cell.fill = alt_fill
-            cell.alignment = xl['Alignment'](vertical='center', wrap_text=False)
+    rl = _get_reportlab()
+    doc, elements = _build_pdf_doc(destination, titre, rl)
+    elements.append(rl['Paragraph'](resume, rl['getSampleStyleSheet']()['Normal']))
+    elements.append(rl['Spacer'](1, 12))
+
+    tableaux = []
+    for n, tableau in enumerate(tableaux_par_lots(rl, entete, rangees, largeurs, _table_style(rl)), 1):
+        tableaux.append(tableau)
+        progression(min(30, 30 * n * TAILLE_TABLEAU // max(total, 1)))
+    elements.extend(tableaux)
+
+    places = [0]
+    def _apres(flowable):
+        # Un tableau coupé en fin de page compte plusieurs fois : plafonné à 99
+        if isinstance(flowable, rl['Table']):
+            places[0] += 1
+            progression(min(99, 30 + 70 * places[0] // max(len(tableaux), 1)))
+    doc.afterFlowable = _apres
+    doc.build(elements)
 
 
-def _excel_set_widths(ws, widths):
-    """Définit la largeur des colonnes Excel."""
-    from openpyxl.utils import get_column_letter
-    for i, w in enumerate(widths, 1):
-        ws.column_dimensions[get_column_letter(i)].width = w
-    # Hauteur de la ligne d'en-tête
-    ws.row_dimensions[1].height = 24
+def _rapport_pdf(request, type_rapport):
+    """Tâche de rapport pour les filtres courants : téléchargement direct si déjà prêt, sinon suivi"""
+    from apps.settings.rapports_pdf import demander_rapport
+
+    tache = demander_rapport(type_rapport, request.GET, request.user)
+    if tache.est_disponible:
+        return redirect('settings:telecharger_rapport', pk=tache.pk)
+    return redirect('settings:rapport_tache', pk=tache.pk)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Exports Utilisateurs
 # ──────────────────────────────────────────────────────────────────────────────
 
-@login_required
-def export_users_pdf(request):
-    """Exporter la liste des utilisateurs en PDF."""
-    if not request.user.est_admin:
-        return redirect('accounts:users_list')
-
+def _filtrer_utilisateurs(params):
+    """Utilisateurs filtrés comme dans la liste (type, direction, agence, statut, recherche)."""
     from .models import Utilisateur
-    rl = _get_reportlab()
-    buffer = BytesIO()
-    doc, elements = _build_pdf_doc(buffer, 'Liste des Utilisateurs', rl)
+    from .recherche import filtre_recherche
 
-    # Filtres appliqués (mêmes que la vue)
     qs = Utilisateur.objects.all().select_related('direction', 'agence')
-    type_filter = request.GET.get('type')
+    type_filter = params.get('type')
     if type_filter:
         qs = qs.filter(type_utilisateur=type_filter)
-    direction_filter = request.GET.get('direction')
+    direction_filter = params.get('direction')
     if direction_filter:
         qs = qs.filter(direction_id=direction_filter)
-    agence_filter = request.GET.get('agence')
+    agence_filter = params.get('agence')
     if agence_filter:
         qs = qs.filter(agence_id=agence_filter)
-    statut_filter = request.GET.get('statut')
+    statut_filter = params.get('statut')
     if statut_filter == 'actif':
         qs = qs.filter(est_actif=True)
     elif statut_filter == 'inactif':
         qs = qs.filter(est_actif=False)
-    from django.db.models import Q
-    search = request.GET.get('search')
+    search = params.get('search')
     if search:
-        qs = qs.filter(Q(prenom__icontains=search)|Q(nom__icontains=search)|Q(email__icontains=search)|Q(matricule__icontains=search))
+        qs = qs.filter(filtre_recherche(search))
+    return qs
 
-    # Compteur de résumé
-    elements.append(rl['Paragraph'](f'{qs.count()} utilisateur(s) exporté(s)', rl['getSampleStyleSheet']()['Normal']))
-    elements.append(rl['Spacer'](1, 12))
 
-    # Tableau
-    headers = ['#', 'Nom complet', 'Email', 'Type', 'Matricule', 'Direction', 'Agence', 'Statut']
-    data = [headers]
-    for idx, user in enumerate(qs.order_by('-date_inscription'), 1):
-        data.append([
+def pdf_utilisateurs(destination, params, progression):
+    """Constructeur du rapport UTILISATEURS_PDF (appelé par le worker)."""
+    from reportlab.lib.units import inch
+
+    qs = _filtrer_utilisateurs(params).order_by('-date_inscription')
+    total = qs.count()
+    rangees = (
+        [
             str(idx),
             user.get_full_name(),
             user.email,
@@ -231,265 +204,220 @@ def export_users_pdf(request):
             user.direction.nom if user.direction else '—',
             user.agence.nom if user.agence else '—',
             'Actif' if user.est_actif else 'Inactif',
-        ])
-
-    col_widths = [0.4 * rl['inch'], 1.5 * rl['inch'], 2 * rl['inch'], 1.2 * rl['inch'],
-                  0.9 * rl['inch'], 1.2 * rl['inch'], 1.2 * rl['inch'], 0.7 * rl['inch']]
-    table = rl['Table'](data, colWidths=col_widths, repeatRows=1)
-    table.setStyle(_table_style(rl))
-    elements.append(table)
-    doc.build(elements)
-
-    filename = f"utilisateurs_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
-    return _pdf_response(buffer, filename)
+        ]
+        for idx, user in enumerate(qs.iterator(chunk_size=TAILLE_PAQUET), 1)
+    )
+    _construire_pdf(
+        destination, 'Liste des Utilisateurs', f'{total} utilisateur(s) exporté(s)',
+        ['#', 'Nom complet', 'Email', 'Type', 'Matricule', 'Direction', 'Agence', 'Statut'], rangees,
+        [0.4 * inch, 1.5 * inch, 2 * inch, 1.2 * inch, 0.9 * inch, 1.2 * inch, 1.2 * inch, 0.7 * inch],
+        total, progression,
+    )
 
 
 @login_required
-def export_users_excel(request):
-    """Exporter la liste des utilisateurs en Excel."""
+def export_users_pdf(request):
+    """Exporter la liste des utilisateurs en PDF (tâche de fond)."""
     if not request.user.est_admin:
         return redirect('accounts:users_list')
+    return _rapport_pdf(request, 'UTILISATEURS_PDF')
 
-    from .models import Utilisateur
-    xl = _get_openpyxl()
-    wb = xl['Workbook']()
-    ws = wb.active
-    ws.title = 'Utilisateurs'
-
-    # Filtres (mêmes que la vue)
-    qs = Utilisateur.objects.all().select_related('direction', 'agence')
-    type_filter = request.GET.get('type')
-    if type_filter:
-        qs = qs.filter(type_utilisateur=type_filter)
-    direction_filter = request.GET.get('direction')
-    if direction_filter:
-        qs = qs.filter(direction_id=direction_filter)
-    agence_filter = request.GET.get('agence')
-    if agence_filter:
-        qs = qs.filter(agence_id=agence_filter)
-    statut_filter = request.GET.get('statut')
-    if statut_filter == 'actif':
-        qs = qs.filter(est_actif=True)
-    elif statut_filter == 'inactif':
-        qs = qs.filter(est_actif=False)
-    from django.db.models import Q
-    search = request.GET.get('search')
-    if search:
-        qs = qs.filter(Q(prenom__icontains=search)|Q(nom__icontains=search)|Q(email__icontains=search)|Q(matricule__icontains=search))
 
-    headers = ['#', 'Prénom', 'Nom', 'Email', 'Téléphone', 'Type', 'Matricule',
-               'Département', 'Poste', 'Direction', 'Agence', 'Statut', 'Inscrit le']
-    _excel_apply_header(ws, headers, xl)
+COLONNES_UTILISATEURS = [
+    ('Prénom',      lambda u: u.prenom),
+    ('Nom',         lambda u: u.nom),
+    ('Email',       lambda u: u.email),
+    ('Téléphone',   lambda u: u.telephone or '—'),
+    ('Type',        lambda u: u.get_type_utilisateur_display()),
+    ('Matricule',   lambda u: u.matricule or '—'),
+    ('Département', lambda u: u.departement or '—'),
+    ('Poste',       lambda u: u.poste or '—'),
+    ('Direction',   lambda u: u.direction.nom if u.direction else '—'),
+    ('Agence',      lambda u: u.agence.nom if u.agence else '—'),
+    ('Statut',      lambda u: 'Actif' if u.est_actif else 'Inactif'),
+    ('Inscrit le',  lambda u: u.date_inscription.strftime('%d/%m/%Y') if u.date_inscription else '—'),
+]
 
-    for idx, user in enumerate(qs.order_by('-date_inscription'), 1):
-        ws.append([
-            idx, user.prenom, user.nom, user.email,
-            user.telephone or '—', user.get_type_utilisateur_display(),
-            user.matricule or '—', user.departement or '—', user.poste or '—',
-            user.direction.nom if user.direction else '—',
-            user.agence.nom if user.agence else '—',
-            'Actif' if user.est_actif else 'Inactif',
-            user.date_inscription.strftime('%d/%m/%Y') if user.date_inscription else '—',
-        ])
 
-    _excel_add_alt_rows(ws, 2, xl)
-    _excel_set_widths(ws, [5, 16, 16, 28, 16, 22, 14, 18, 18, 22, 22, 10, 14])
+@login_required
+def export_users_excel(request):
+    """Exporter la liste des utilisateurs en Excel (?format=csv pour du CSV)."""
+    if not request.user.est_admin:
+        return redirect('accounts:users_list')
 
-    buffer = BytesIO()
-    wb.save(buffer)
-    filename = f"utilisateurs_{timezone.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    return _excel_response(buffer, filename)
+    return exporter(
+        _filtrer_utilisateurs(request.GET).order_by('-date_inscription'), COLONNES_UTILISATEURS,
+        'utilisateurs', format_demande(request, 'xlsx'), titre='Utilisateurs', numeroter=True,
+        largeurs=[5, 16, 16, 28, 16, 22, 14, 18, 18, 22, 22, 10, 14],
+    )
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Exports Directions
 # ──────────────────────────────────────────────────────────────────────────────
 
-@login_required
-def export_directions_pdf(request):
-    """Exporter la liste des directions en PDF."""
-    if not request.user.est_admin:
-        return redirect('accounts:directions_list')
-
+def _filtrer_directions(params):
+    """Directions annotées (employés actifs, agences), filtrées par recherche et statut."""
     from .models import Direction
     from django.db.models import Count, Q
-    rl = _get_reportlab()
-    buffer = BytesIO()
-    doc, elements = _build_pdf_doc(buffer, 'Liste des Directions', rl)
 
-    directions = Direction.objects.all().annotate(
-        nombre_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True)),
-        nombre_agences=Count('agences', filter=Q(agences__est_active=True)),
+    directions = Direction.objects.all().select_related('directeur').annotate(
+        nombre_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True), distinct=True),
+        nombre_agences=Count('agences', filter=Q(agences__est_active=True), distinct=True),
     ).order_by('nom')
 
-    search = request.GET.get('search')
+    search = params.get('search')
     if search:
         directions = directions.filter(Q(nom__icontains=search)|Q(code__icontains=search))
-    statut = request.GET.get('statut')
+    statut = params.get('statut')
     if statut == 'actif':
         directions = directions.filter(est_active=True)
     elif statut == 'inactif':
         directions = directions.filter(est_active=False)
+    return directions
 
-    elements.append(rl['Paragraph'](f'{directions.count()} direction(s) exportée(s)', rl['getSampleStyleSheet']()['Normal']))
-    elements.append(rl['Spacer'](1, 12))
 
-    headers = ['#', 'Nom', 'Code', 'Directeur', 'Employés actifs', 'Agences', 'Statut']
-    data = [headers]
-    for idx, d in enumerate(directions, 1):
-        data.append([
+def pdf_directions(destination, params, progression):
+    """Constructeur du rapport DIRECTIONS_PDF (appelé par le worker)."""
+    from reportlab.lib.units import inch
+
+    directions = _filtrer_directions(params)
+    total = directions.count()
+    rangees = (
+        [
             str(idx), d.nom, d.code,
             d.directeur.get_full_name() if d.directeur else '—',
             str(d.nombre_employes), str(d.nombre_agences),
             'Active' if d.est_active else 'Inactive',
-        ])
-
-    col_widths = [0.4 * rl['inch'], 2.2 * rl['inch'], 0.9 * rl['inch'], 1.5 * rl['inch'],
-                  1.1 * rl['inch'], 0.8 * rl['inch'], 0.8 * rl['inch']]
-    table = rl['Table'](data, colWidths=col_widths, repeatRows=1)
-    table.setStyle(_table_style(rl))
-    elements.append(table)
-    doc.build(elements)
-
-    filename = f"directions_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
-    return _pdf_response(buffer, filename)
+        ]
+        for idx, d in enumerate(directions.iterator(chunk_size=TAILLE_PAQUET), 1)
+    )
+    _construire_pdf(
+        destination, 'Liste des Directions', f'{total} direction(s) exportée(s)',
+        ['#', 'Nom', 'Code', 'Directeur', 'Employés actifs', 'Agences', 'Statut'], rangees,
+        [0.4 * inch, 2.2 * inch, 0.9 * inch, 1.5 * inch, 1.1 * inch, 0.8 * inch, 0.8 * inch],
+        total, progression,
+    )
 
 
 @login_required
-def export_directions_excel(request):
-    """Exporter la liste des directions en Excel."""
+def export_directions_pdf(request):
+    """Exporter la liste des directions en PDF (tâche de fond)."""
     if not request.user.est_admin:
         return redirect('accounts:directions_list')
+    return _rapport_pdf(request, 'DIRECTIONS_PDF')
 
-    from .models import Direction
-    from django.db.models import Count, Q
-    xl = _get_openpyxl()
-    wb = xl['Workbook']()
-    ws = wb.active
-    ws.title = 'Directions'
-
-    directions = Direction.objects.all().annotate(
-        nombre_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True)),
-        nombre_agences=Count('agences', filter=Q(agences__est_active=True)),
-    ).order_by('nom')
 
-    headers = ['#', 'Nom', 'Code', 'Description', 'Directeur', 'Téléphone', 'Email',
-               'Employés actifs', 'Agences liées', 'Statut', 'Créée le']
-    _excel_apply_header(ws, headers, xl)
+COLONNES_DIRECTIONS = [
+    ('Nom',             lambda d: d.nom),
+    ('Code',            lambda d: d.code),
+    ('Description',     lambda d: d.description or '—'),
+    ('Directeur',       lambda d: d.directeur.get_full_name() if d.directeur else '—'),
+    ('Téléphone',       lambda d: d.telephone or '—'),
+    ('Email',           lambda d: d.email or '—'),
+    ('Employés actifs', lambda d: d.nombre_employes),
+    ('Agences liées',   lambda d: d.nombre_agences),
+    ('Statut',          lambda d: 'Active' if d.est_active else 'Inactive'),
+    ('Créée le',        lambda d: d.date_creation.strftime('%d/%m/%Y') if d.date_creation else '—'),
+]
 
-    for idx, d in enumerate(directions, 1):
-        ws.append([
-            idx, d.nom, d.code, d.description or '—',
-            d.directeur.get_full_name() if d.directeur else '—',
-            d.telephone or '—', d.email or '—',
-            d.nombre_employes, d.nombre_agences,
-            'Active' if d.est_active else 'Inactive',
-            d.date_creation.strftime('%d/%m/%Y') if d.date_creation else '—',
-        ])
 
-    _excel_add_alt_rows(ws, 2, xl)
-    _excel_set_widths(ws, [5, 28, 12, 35, 22, 16, 24, 14, 14, 10, 14])
+@login_required
+def export_directions_excel(request):
+    """Exporter la liste des directions en Excel (?format=csv pour du CSV)."""
+    if not request.user.est_admin:
+        return redirect('accounts:directions_list')
 
-    buffer = BytesIO()
-    wb.save(buffer)
-    filename = f"directions_{timezone.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    return _excel_response(buffer, filename)
+    return exporter(
+        _filtrer_directions(request.GET), COLONNES_DIRECTIONS, 'directions', format_demande(request, 'xlsx'),
+        titre='Directions', numeroter=True, largeurs=[5, 28, 12, 35, 22, 16, 24, 14, 14, 10, 14],
+    )
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Exports Agences
 # ──────────────────────────────────────────────────────────────────────────────
 
-@login_required
-def export_agencies_pdf(request):
-    """Exporter la liste des agences en PDF."""
-    if not request.user.est_admin:
-        return redirect('accounts:agences_list')
-
+def _filtrer_agences(params):
+    """Agences annotées (employés actifs), filtrées par recherche, type et statut."""
     from .models import Agence
     from django.db.models import Count, Q
-    rl = _get_reportlab()
-    buffer = BytesIO()
-    doc, elements = _build_pdf_doc(buffer, 'Liste des Agences', rl)
 
     agences = Agence.objects.all().select_related('direction', 'responsable').annotate(
         nombre_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True))
     ).order_by('nom')
 
-    search = request.GET.get('search')
+    search = params.get('search')
     if search:
         agences = agences.filter(Q(nom__icontains=search)|Q(code__icontains=search)|Q(ville__icontains=search))
-    type_f = request.GET.get('type')
+    type_f = params.get('type')
     if type_f:
         agences = agences.filter(type_agence=type_f)
-    statut = request.GET.get('statut')
+    statut = params.get('statut')
     if statut == 'actif':
         agences = agences.filter(est_active=True)
     elif statut == 'inactif':
         agences = agences.filter(est_active=False)
+    return agences
 
-    elements.append(rl['Paragraph'](f'{agences.count()} agence(s) exportée(s)', rl['getSampleStyleSheet']()['Normal']))
-    elements.append(rl['Spacer'](1, 12))
 
-    headers = ['#', 'Nom', 'Code', 'Type', 'Ville', 'Direction', 'Responsable', 'Employés', 'Statut']
-    data = [headers]
-    for idx, a in enumerate(agences, 1):
-        data.append([
+def pdf_agences(destination, params, progression):
+    """Constructeur du rapport AGENCES_PDF (appelé par le worker)."""
+    from reportlab.lib.units import inch
+
+    agences = _filtrer_agences(params)
+    total = agences.count()
+    rangees = (
+        [
             str(idx), a.nom, a.code, a.get_type_agence_display(),
             a.ville, a.direction.nom if a.direction else '—',
             a.responsable.get_full_name() if a.responsable else '—',
             str(a.nombre_employes), 'Active' if a.est_active else 'Inactive',
-        ])
+        ]
+        for idx, a in enumerate(agences.iterator(chunk_size=TAILLE_PAQUET), 1)
+    )
+    _construire_pdf(
+        destination, 'Liste des Agences', f'{total} agence(s) exportée(s)',
+        ['#', 'Nom', 'Code', 'Type', 'Ville', 'Direction', 'Responsable', 'Employés', 'Statut'], rangees,
+        [0.4 * inch, 1.8 * inch, 0.8 * inch, 1 * inch, 0.9 * inch, 1.2 * inch, 1.2 * inch, 0.7 * inch, 0.7 * inch],
+        total, progression,
+    )
 
-    col_widths = [0.4 * rl['inch'], 1.8 * rl['inch'], 0.8 * rl['inch'], 1 * rl['inch'],
-                  0.9 * rl['inch'], 1.2 * rl['inch'], 1.2 * rl['inch'], 0.7 * rl['inch'], 0.7 * rl['inch']]
-    table = rl['Table'](data, colWidths=col_widths, repeatRows=1)
-    table.setStyle(_table_style(rl))
-    elements.append(table)
-    doc.build(elements)
 
-    filename = f"agences_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
-    return _pdf_response(buffer, filename)
+@login_required
+def export_agencies_pdf(request):
+    """Exporter la liste des agences en PDF (tâche de fond)."""
+    if not request.user.est_admin:
+        return redirect('accounts:agences_list')
+    return _rapport_pdf(request, 'AGENCES_PDF')
+
+
+COLONNES_AGENCES = [
+    ('Nom',         lambda a: a.nom),
+    ('Code',        lambda a: a.code),
+    ('Type',        lambda a: a.get_type_agence_display()),
+    ('Adresse',     lambda a: a.adresse or '—'),
+    ('Ville',       lambda a: a.ville),
+    ('Région',      lambda a: a.region or '—'),
+    ('Téléphone',   lambda a: a.telephone or '—'),
+    ('Email',       lambda a: a.email or '—'),
+    ('Direction',   lambda a: a.direction.nom if a.direction else '—'),
+    ('Responsable', lambda a: a.responsable.get_full_name() if a.responsable else '—'),
+    ('Employés',    lambda a: a.nombre_employes),
+    ('Statut',      lambda a: 'Active' if a.est_active else 'Inactive'),
+    ('Ouverte le',  lambda a: a.date_ouverture.strftime('%d/%m/%Y') if a.date_ouverture else '—'),
+]
 
 
 @login_required
 def export_agencies_excel(request):
-    """Exporter la liste des agences en Excel."""
+    """Exporter la liste des agences en Excel (?format=csv pour du CSV)."""
     if not request.user.est_admin:
         return redirect('accounts:agences_list')
 
-    from .models import Agence
-    from django.db.models import Count, Q
-    xl = _get_openpyxl()
-    wb = xl['Workbook']()
-    ws = wb.active
-    ws.title = 'Agences'
-
-    agences = Agence.objects.all().select_related('direction', 'responsable').annotate(
-        nombre_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True))
-    ).order_by('nom')
-
-    headers = ['#', 'Nom', 'Code', 'Type', 'Adresse', 'Ville', 'Région',
-               'Téléphone', 'Email', 'Direction', 'Responsable', 'Employés', 'Statut', 'Ouverte le']
-    _excel_apply_header(ws, headers, xl)
+    return exporter(
+        _filtrer_agences(request.GET), COLONNES_AGENCES, 'agences', format_demande(request, 'xlsx'),
+        titre='Agences', numeroter=True, largeurs=[5, 22, 10, 14, 28, 16, 16, 16, 24, 22, 22, 10, 10, 14],
+    )
 
-    for idx, a in enumerate(agences, 1):
-        ws.append([
-            idx, a.nom, a.code, a.get_type_agence_display(),
-            a.adresse or '—', a.ville, a.region or '—',
-            a.telephone or '—', a.email or '—',
-            a.direction.nom if a.direction else '—',
-            a.responsable.get_full_name() if a.responsable else '—',
-            a.nombre_employes,
-            'Active' if a.est_active else 'Inactive',
-            a.date_ouverture.strftime('%d/%m/%Y') if a.date_ouverture else '—',
-        ])
-
-    _excel_add_alt_rows(ws, 2, xl)
-    _excel_set_widths(ws, [5, 22, 10, 14, 28, 16, 16, 16, 24, 22, 22, 10, 10, 14])
-
-    buffer = BytesIO()
-    wb.save(buffer)
-    filename = f"agences_{timezone.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    return _excel_response(buffer, filename)
 
@@ -0,0 +1,29 @@
+"""
+Recalcule le texte de recherche et les trigrammes de tous les utilisateurs.
+
+À lancer après un import en masse (bulk_create / update ne passent pas par save()).
+
+    python manage.py reindexer_recherche
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.recherche import reindexer_tout
+from apps.transactions.selection_clients import invalider
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche des utilisateurs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=1000,
+                            help='Utilisateurs traités par lot (défaut 1000)')
+
+    def handle(self, *args, **options):
+        debut = time.monotonic()
+        total = reindexer_tout(taille_lot=options['taille_lot'])
+        invalider()  # sélecteurs de clients de la vente
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} utilisateur(s) réindexé(s) en {time.monotonic() - debut:.1f} s."
+        ))
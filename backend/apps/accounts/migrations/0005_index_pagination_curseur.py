@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_utilisateur_type_utilisateur'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('restaurants', '0004_valeurs_parametres_systeme'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='utilisateur',
+            index=models.Index(fields=['date_inscription', 'id'], name='accounts_ut_date_in_3c3ef3_idx'),
+        ),
+    ]
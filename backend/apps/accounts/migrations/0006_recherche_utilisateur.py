@@ -0,0 +1,68 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from apps.accounts.recherche import ngrammes_texte, plier
+
+
+def remplir_recherche(apps, schema_editor):
+    """Texte de recherche et trigrammes des utilisateurs existants"""
+    Utilisateur = apps.get_model('accounts', 'Utilisateur')
+    TrigrammeUtilisateur = apps.get_model('accounts', 'TrigrammeUtilisateur')
+    avec_trigrammes = schema_editor.connection.vendor != 'postgresql'
+
+    utilisateurs = list(Utilisateur.objects.only('prenom', 'nom', 'email', 'matricule', 'telephone'))
+    for u in utilisateurs:
+        u.recherche = plier(' '.join(filter(None, [u.prenom, u.nom, u.email, u.matricule, u.telephone])))
+    Utilisateur.objects.bulk_update(utilisateurs, ['recherche'], batch_size=1000)
+    if avec_trigrammes:
+        TrigrammeUtilisateur.objects.bulk_create([
+            TrigrammeUtilisateur(utilisateur_id=u.pk, trigramme=t)
+            for u in utilisateurs for t in ngrammes_texte(u.recherche)
+        ], batch_size=2000)
+
+
+def index_trigrammes_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS accounts_utilisateur_recherche_trgm '
+            'ON accounts_utilisateur USING gin (recherche gin_trgm_ops)'
+        )
+
+
+def supprimer_index_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS accounts_utilisateur_recherche_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_index_pagination_curseur'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='recherche',
+            field=models.CharField(blank=True, editable=False, max_length=400, verbose_name='Texte de recherche'),
+        ),
+        migrations.CreateModel(
+            name='TrigrammeUtilisateur',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigramme', models.CharField(max_length=3, verbose_name='Trigramme')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrammes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trigramme de recherche',
+                'verbose_name_plural': 'Trigrammes de recherche',
+                'indexes': [models.Index(fields=['trigramme', 'utilisateur'], name='accounts_tr_trigram_98ac6b_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_recherche, migrations.RunPython.noop),
+        migrations.RunPython(index_trigrammes_postgres, supprimer_index_postgres),
+    ]
@@ -134,6 +134,9 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
     derniere_connexion = models.DateTimeField("Dernière connexion", blank=True, null=True)
     date_modification = models.DateTimeField("Modifié le", auto_now=True)
 
+    # Recherche : prénom, nom, email, matricule, téléphone pliés (voir recherche.py)
+    recherche = models.CharField("Texte de recherche", max_length=400, blank=True, editable=False)
+
     # Manager
     objects = GestionnaireUtilisateur()
 
@@ -148,6 +151,7 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
             models.Index(fields=['email']),
             models.Index(fields=['matricule']),
             models.Index(fields=['type_utilisateur']),
+            models.Index(fields=['date_inscription', 'id']),  # pagination par curseur
         ]
 
     def __str__(self):
@@ -161,10 +165,18 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
         """Retourne le prénom de l'utilisateur"""
         return self.prenom
 
+    CHAMPS_RECHERCHE = ('prenom', 'nom', 'email', 'matricule', 'telephone')
+
     def save(self, *args, **kwargs):
         """Surcharge de la sauvegarde pour générer le nom d'utilisateur depuis l'email si non fourni"""
+        from .recherche import texte_recherche
+
         if not self.nom_utilisateur:
             self.nom_utilisateur = self.email.split('@')[0]
+        self.recherche = texte_recherche(self)
+        champs = kwargs.get('update_fields')
+        if champs is not None and set(champs) & set(self.CHAMPS_RECHERCHE):
+            kwargs['update_fields'] = {*champs, 'recherche'}
         super().save(*args, **kwargs)
 
     # CORRECTION : Propriétés avec setters pour Django Admin
@@ -220,9 +232,9 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
 
     @property
     def tickets_disponibles(self):
-        """Retourne le nombre de tickets disponibles pour l'utilisateur"""
-        from apps.tickets.models import Ticket
-        return Ticket.objects.filter(proprietaire=self, statut='DISPONIBLE').count()
+        """Retourne le nombre de tickets disponibles pour l'utilisateur (porte-monnaie)"""
+        from apps.tickets.models import PorteMonnaieTicket
+        return PorteMonnaieTicket.solde(self).disponibles
 
 
 class Direction(models.Model):
@@ -391,6 +403,27 @@ class Agence(models.Model):
         return sous_agences
 
 
+class TrigrammeUtilisateur(models.Model):
+    """Index de recherche SQLite / MySQL : un trigramme du texte de recherche d'un utilisateur"""
+
+    utilisateur = models.ForeignKey(
+        Utilisateur,
+        on_delete=models.CASCADE,
+        related_name='trigrammes'
+    )
+    trigramme = models.CharField("Trigramme", max_length=3)
+
+    class Meta:
+        verbose_name = "Trigramme de recherche"
+        verbose_name_plural = "Trigrammes de recherche"
+        indexes = [
+            models.Index(fields=['trigramme', 'utilisateur']),
+        ]
+
+    def __str__(self):
+        return f"{self.trigramme} → {self.utilisateur_id}"
+
+
 class ProfilUtilisateur(models.Model):
     """Profil étendu de l'utilisateur"""
 
@@ -0,0 +1,180 @@
+"""
+Recherche de personnes (et des tickets / transactions qui s'y rattachent).
+
+Chaque Utilisateur porte une colonne `recherche` : prénom, nom, email,
+matricule et téléphone en minuscules, sans accents (« Zoé Ouédraogo » est
+trouvée par « oued »). Selon la base :
+
+  - PostgreSQL : index GIN pg_trgm sur `recherche` (migration 0006), le
+    LIKE '%…%' passe par l'index ;
+  - SQLite / MySQL : table TrigrammeUtilisateur (trigrammes de chaque mot),
+    tenue à jour à l'enregistrement. Pour un mot de 3 lettres ou plus, les
+    candidats sont ceux qui portent son trigramme le plus rare (index), puis
+    `recherche` confirme la sous-chaîne. Un mot trop courant est cherché par
+    simple parcours : les correspondances abondent, LIMIT s'arrête vite.
+
+Raccourcis : un numéro de ticket / transaction ou un matricule saisi en
+entier (ou son début) est cherché par préfixe sur la colonne indexée.
+
+    qs.filter(filtre_recherche(terme))                                       # utilisateurs
+    qs.filter(filtre_recherche(terme, 'proprietaire__', numero='numero_ticket'))
+"""
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+
+LONGUEUR_NGRAMME = 3
+_NUMERO = re.compile(r'^\d{6}(-\d*)?$|^\d{8}-[\d-]*$')  # 202610-00042, 20261017-083012-15
+_MATRICULE = re.compile(r'^(?=.*\d)[A-Za-z0-9/_.-]{3,}$')
+
+
+def plier(texte):
+    """Minuscules, sans accents, espaces normalisés"""
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return ' '.join(texte.lower().split())
+
+
+def texte_recherche(utilisateur):
+    return plier(' '.join(filter(None, [
+        utilisateur.prenom, utilisateur.nom, utilisateur.email,
+        utilisateur.matricule, utilisateur.telephone,
+    ])))
+
+
+def ngrammes(mot, n=LONGUEUR_NGRAMME):
+    return {mot[i:i + n] for i in range(len(mot) - n + 1)}
+
+
+def ngrammes_texte(texte):
+    """Trigrammes de chaque mot (une recherche ne traverse pas les espaces)"""
+    resultat = set()
+    for mot in texte.split():
+        resultat |= ngrammes(mot)
+    return resultat
+
+
+def index_trigrammes():
+    """False si la base sait indexer LIKE '%…%' elle-même (pg_trgm)"""
+    return connection.vendor != 'postgresql'
+
+
+# ════════════════════════════════════════════════════════════════
+# Index de trigrammes
+# ════════════════════════════════════════════════════════════════
+def indexer(utilisateurs):
+    """(Ré)écrit les trigrammes des utilisateurs donnés (objets avec .recherche à jour)"""
+    from .models import TrigrammeUtilisateur
+
+    utilisateurs = list(utilisateurs)
+    if not utilisateurs or not index_trigrammes():
+        return
+    TrigrammeUtilisateur.objects.filter(utilisateur__in=[u.pk for u in utilisateurs]).delete()
+    TrigrammeUtilisateur.objects.bulk_create([
+        TrigrammeUtilisateur(utilisateur_id=u.pk, trigramme=t)
+        for u in utilisateurs
+        for t in ngrammes_texte(u.recherche)
+    ], batch_size=2000)
+
+
+def reindexer_tout(taille_lot=1000):
+    """Recalcule `recherche` et les trigrammes de tous les utilisateurs ; retourne le nombre traité"""
+    from apps.settings.exportation import parcourir_par_cle
+    from .models import Utilisateur
+
+    lot, total = [], 0
+    for u in parcourir_par_cle(Utilisateur.objects.all(), taille_lot):
+        u.recherche = texte_recherche(u)
+        lot.append(u)
+        if len(lot) == taille_lot:
+            Utilisateur.objects.bulk_update(lot, ['recherche'])
+            indexer(lot)
+            total, lot = total + len(lot), []
+    if lot:
+        Utilisateur.objects.bulk_update(lot, ['recherche'])
+        indexer(lot)
+        total += len(lot)
+    return total
+
+
+# ════════════════════════════════════════════════════════════════
+# Filtres
+# ════════════════════════════════════════════════════════════════
+SEUIL_SELECTIF = 2000      # au-delà, le mot est trop courant : un parcours s'arrête plus vite
+DUREE_CACHE_FREQUENCES = 600
+
+
+def frequences(trigrammes):
+    """{trigramme: nombre d'utilisateurs} — mis en cache, les fréquences bougent lentement"""
+    from .models import TrigrammeUtilisateur
+
+    cles = {t: f'recherche:freq:{t}' for t in trigrammes}
+    en_cache = cache.get_many(cles.values())
+    resultat = {t: en_cache[cle] for t, cle in cles.items() if cle in en_cache}
+    manquants = [t for t in trigrammes if t not in resultat]
+    if manquants:
+        comptes = dict(
+            TrigrammeUtilisateur.objects.filter(trigramme__in=manquants)
+            .values('trigramme').annotate(nb=Count('id')).values_list('trigramme', 'nb')
+        )
+        calcules = {t: comptes.get(t, 0) for t in manquants}
+        cache.set_many({cles[t]: n for t, n in calcules.items()}, DUREE_CACHE_FREQUENCES)
+        resultat.update(calcules)
+    return resultat
+
+
+def _q_mot(mot, chemin):
+    """
+    Condition pour un mot plié, sur l'utilisateur atteint par `chemin`.
+    Mot sélectif : candidats = liste du trigramme le plus rare (index),
+    confirmés par `recherche`. Mot courant : simple parcours de `recherche`.
+    """
+    from .models import TrigrammeUtilisateur
+
+    q = Q(**{f'{chemin}recherche__contains': mot})
+    trigrammes = ngrammes(mot)
+    if not trigrammes or not index_trigrammes():
+        return q
+    freq = frequences(trigrammes)
+    plus_rare = min(trigrammes, key=lambda t: (freq[t], t))
+    if freq[plus_rare] > SEUIL_SELECTIF:
+        return q
+    candidats = TrigrammeUtilisateur.objects.filter(trigramme=plus_rare).values('utilisateur_id')
+    return Q(**{f'{chemin}pk__in': candidats}) & q
+
+
+def _matricule_existe(terme):
+    from .models import Utilisateur
+    return Utilisateur.objects.filter(matricule__istartswith=terme).exists()
+
+
+def filtre_personnes(terme, chemin=''):
+    """Q : tous les mots du terme se retrouvent dans la fiche de la personne"""
+    terme = (terme or '').strip()
+    # Raccourci : début de matricule connu → index du matricule seul
+    if _MATRICULE.match(terme) and _matricule_existe(terme):
+        return Q(**{f'{chemin}matricule__istartswith': terme})
+    q = Q()
+    for mot in plier(terme).split():
+        q &= _q_mot(mot, chemin)
+    return q
+
+
+def filtre_recherche(terme, chemin='', numero=None):
+    """
+    Q de recherche pour une liste : personne atteinte par `chemin`
+    ('' pour Utilisateur, 'client__', 'proprietaire__'…), ou le champ
+    `numero` cherché par préfixe quand le terme a la forme d'un numéro.
+    """
+    terme = (terme or '').strip()
+    if not terme:
+        return Q()
+    if numero and _NUMERO.match(terme):
+        return Q(**{f'{numero}__startswith': terme})
+    q = filtre_personnes(terme, chemin)
+    if numero and any(c.isdigit() for c in terme):
+        q |= Q(**{f'{numero}__contains': terme.upper()})  # morceau de numéro (« 00042 »)
+    return q
@@ -1,9 +1,11 @@
 """
 Signaux pour la gestion des comptes utilisateurs
 """
+import logging
 import secrets
 import string
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
@@ -12,6 +14,8 @@ from django.utils import timezone
 
 from .models import Utilisateur, ProfilUtilisateur
 
+logger = logging.getLogger(__name__)
+
 
 def generer_mot_de_passe(longueur=12):
     """Génère un mot de passe sécurisé"""
@@ -28,6 +32,31 @@ def generer_mot_de_passe(longueur=12):
     return ''.join(mdp)
 
 
+@receiver(post_save, sender=Utilisateur)
+def indexer_recherche(sender, instance, created, update_fields=None, **kwargs):
+    """Trigrammes de recherche, seulement si le texte de recherche a pu changer"""
+    from .recherche import indexer
+
+    if created or update_fields is None or 'recherche' in update_fields:
+        indexer([instance])
+
+
+# Champs lus par le sélecteur de clients de la vente (apps.transactions.selection_clients)
+CHAMPS_SELECTION_CLIENTS = {'type_utilisateur', 'est_actif', 'agence', 'recherche'}
+
+
+@receiver(post_save, sender=Utilisateur)
+@receiver(post_delete, sender=Utilisateur)
+def invalider_selection_clients(sender, instance, update_fields=None, **kwargs):
+    """Index des clients de l'agence à reconstruire (après le commit, pour relire l'état final)"""
+    from apps.transactions.selection_clients import TOUTES, invalider
+
+    if update_fields is not None and not CHAMPS_SELECTION_CLIENTS & set(update_fields):
+        return
+    perimetre = instance.agence_id or TOUTES
+    transaction.on_commit(lambda: invalider(perimetre))
+
+
 @receiver(post_save, sender=Utilisateur)
 def creer_profil_utilisateur(sender, instance, created, **kwargs):
     """Créer automatiquement le profil lors de la création d'un utilisateur"""
@@ -48,41 +77,38 @@ def sauvegarder_profil_utilisateur(sender, instance, **kwargs):
 def envoyer_email_bienvenue(sender, instance, created, **kwargs):
     """
     Envoyer un email de bienvenue avec identifiants lors de la création du compte.
-    Le mot de passe temporaire est généré et défini ici.
+    Le mot de passe temporaire est généré et défini par la tâche d'envoi,
+    après le commit : la requête n'attend pas le serveur SMTP.
     """
     if not created or not instance.email:
         return
 
-    # Vérifier si un mdp temporaire a été mis en session (transmis via signal)
-    mot_de_passe = getattr(instance, '_mot_de_passe_temporaire', None)
-    if not mot_de_passe:
-        # Générer un nouveau mot de passe si non fourni
-        mot_de_passe = generer_mot_de_passe()
-        instance.set_password(mot_de_passe)
-        # Sauvegarder sans déclencher le signal à nouveau
-        Utilisateur.objects.filter(pk=instance.pk).update(
-            password=instance.password
-        )
+    from .tasks import envoyer_identifiants
 
-    try:
-        url_connexion = getattr(settings, 'SITE_URL', 'http://localhost:8000') + '/accounts/login/'
-
-        # Contexte pour le template
-        contexte = {
-            'prenom': instance.prenom,
-            'nom': instance.nom,
-            'email': instance.email,
-            'mot_de_passe': mot_de_passe,
-            'type_utilisateur': instance.get_type_utilisateur_display(),
-            'url_connexion': url_connexion,
-            'annee': timezone.now().year,
-        }
-
-        # Rendu du template HTML
-        html_content = render_to_string('emails/bienvenue.html', contexte)
-
-        # Version texte simple
-        text_content = f"""
+    pk = instance.pk
+    transaction.on_commit(lambda: envoyer_identifiants.delay([pk]))
+
+
+def message_bienvenue(instance, mot_de_passe, connexion=None):
+    """Email de bienvenue (texte + HTML) avec les identifiants, non envoyé"""
+    url_connexion = getattr(settings, 'SITE_URL', 'http://localhost:8000') + '/accounts/login/'
+
+    # Contexte pour le template
+    contexte = {
+        'prenom': instance.prenom,
+        'nom': instance.nom,
+        'email': instance.email,
+        'mot_de_passe': mot_de_passe,
+        'type_utilisateur': instance.get_type_utilisateur_display(),
+        'url_connexion': url_connexion,
+        'annee': timezone.now().year,
+    }
+
+    # Rendu du template HTML
+    html_content = render_to_string('emails/bienvenue.html', contexte)
+
+    # Version texte simple
+    text_content = f"""
 Bonjour {instance.get_full_name()},
 
 Votre compte MUTRALO/LONAB a été créé avec succès.
@@ -100,52 +126,22 @@ Cordialement,
 L'équipe MUTRALO/LONAB
 """
 
-        msg = EmailMultiAlternatives(
-            subject="Bienvenue sur MUTRALO – Vos identifiants de connexion",
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[instance.email],
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
-
-    except Exception as erreur:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Erreur envoi email bienvenue pour {instance.email}: {erreur}")
-
-def envoyer_email_avec_mdp(instance, mot_de_passe):
-    """Fonction standalone pour envoyer l'email avec le mdp connu"""
+    msg = EmailMultiAlternatives(
+        subject="Bienvenue sur MUTRALO – Vos identifiants de connexion",
+        body=text_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[instance.email],
+        connection=connexion,
+    )
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+def envoyer_email_avec_mdp(instance, mot_de_passe, connexion=None):
+    """Envoi synchrone de l'email avec un mdp connu ; retourne True si envoyé"""
     try:
-        url_connexion = getattr(settings, 'SITE_URL', 'http://localhost:8000') + '/accounts/login/'
-        contexte = {
-            'prenom': instance.prenom,
-            'nom': instance.nom,
-            'email': instance.email,
-            'mot_de_passe': mot_de_passe,
-            'type_utilisateur': instance.get_type_utilisateur_display(),
-            'url_connexion': url_connexion,
-            'annee': timezone.now().year,
-        }
-        html_content = render_to_string('emails/bienvenue.html', contexte)
-        text_content = (
-            f"Bonjour {instance.get_full_name()},\n\n"
-            f"Vos identifiants MUTRALO/LONAB :\n"
-            f"  Email : {instance.email}\n"
-            f"  Mot de passe : {mot_de_passe}\n\n"
-            f"Connectez-vous sur : {url_connexion}\n\n"
-            f"Modifiez votre mot de passe dès la première connexion.\n\n"
-            f"L'équipe MUTRALO/LONAB"
-        )
-        msg = EmailMultiAlternatives(
-            subject="Bienvenue sur MUTRALO – Vos identifiants de connexion",
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[instance.email],
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
+        message_bienvenue(instance, mot_de_passe, connexion).send(fail_silently=False)
+        return True
     except Exception as e:
-        import logging
-        logging.getLogger(__name__).error(f"Erreur email bienvenue {instance.email}: {e}")
-
+        logger.error(f"Erreur email bienvenue {instance.email}: {e}")
+        return False
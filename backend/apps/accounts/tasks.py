@@ -0,0 +1,42 @@
+"""
+Tâches de fond de l'application accounts — emails de bienvenue avec identifiants
+"""
+import logging
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import get_connection
+
+from apps.notifs.tasks import reessayer_plus_tard
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=settings.EMAIL_MAX_RETRIES)
+def envoyer_identifiants(self, utilisateur_ids):
+    """
+    Génère un mot de passe temporaire pour chaque utilisateur et le lui envoie,
+    une seule connexion SMTP pour tout le lot. Le mot de passe n'est défini
+    qu'au moment de l'envoi : il ne transite jamais par la file de tâches.
+    """
+    from .models import Utilisateur
+    from .signals import envoyer_email_avec_mdp, generer_mot_de_passe
+
+    utilisateurs = list(Utilisateur.objects.filter(pk__in=utilisateur_ids).exclude(email=''))
+    envoyes = set()
+    try:
+        with get_connection() as connexion:
+            for utilisateur in utilisateurs:
+                mot_de_passe = generer_mot_de_passe()
+                utilisateur.set_password(mot_de_passe)
+                Utilisateur.objects.filter(pk=utilisateur.pk).update(password=utilisateur.password)
+                if envoyer_email_avec_mdp(utilisateur, mot_de_passe, connexion):
+                    envoyes.add(utilisateur.pk)
+    except (SMTPException, OSError) as e:
+        logger.warning(f"Connexion SMTP impossible : {e}")
+
+    echecs = [u.pk for u in utilisateurs if u.pk not in envoyes]
+    if echecs:
+        reessayer_plus_tard(self, echecs)
+    return len(envoyes)
@@ -1,3 +1,137 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.models import Q
 from django.test import TestCase
+from django.urls import reverse
+
+from . import recherche
+from .models import Agence, Direction, TrigrammeUtilisateur, Utilisateur
+
+
+class ListesAdministrationTests(TestCase):
+    """Listes paginées des directions et agences (écran administrateur)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            'admin@lonab.bf', 'secret', prenom='Awa', nom='Admin', type_utilisateur='ADMIN',
+        )
+        direction = None
+        for i in range(12):
+            direction = Direction.objects.create(nom=f'Direction {i:02d}', code=f'D{i:02d}')
+            Agence.objects.create(
+                nom=f'Agence {i:02d}', code=f'A{i:02d}', adresse='Avenue Kwame Nkrumah',
+                ville='Ouagadougou', telephone='+22625000000', direction=direction,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_liste_directions(self):
+        for page in ('1', '2'):
+            reponse = self.client.get(reverse('accounts:directions_list'), {'page': page})
+            self.assertEqual(reponse.status_code, 200)
+            self.assertTrue(reponse.context['is_paginated'])
+
+    def test_liste_agences(self):
+        for page in ('1', '2'):
+            reponse = self.client.get(reverse('accounts:agences_list'), {'page': page})
+            self.assertEqual(reponse.status_code, 200)
+            self.assertTrue(reponse.context['is_paginated'])
+
+    def test_liste_non_paginee(self):
+        Direction.objects.filter(code__gt='D05').delete()
+        reponse = self.client.get(reverse('accounts:directions_list'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertFalse(reponse.context['is_paginated'])
+
+
+class RechercheTests(TestCase):
+    """Recherche de personnes : texte plié, trigrammes, raccourcis numéro / matricule"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zoe = Utilisateur.objects.create_user(
+            'zoe@lonab.bf', 'secret', prenom='Zoé', nom='Ouédraogo', type_utilisateur='CLIENT',
+            matricule='MAT-0042', telephone='+22670112233',
+        )
+        cls.ali = Utilisateur.objects.create_user(
+            'ali@lonab.bf', 'secret', prenom='Ali', nom='Traoré', type_utilisateur='CLIENT',
+            matricule='MAT-0107',
+        )
+        cls.awa = Utilisateur.objects.create_user(
+            'awa@lonab.bf', 'secret', prenom='Awa', nom='Ouattara', type_utilisateur='CLIENT',
+        )
+
+    def setUp(self):
+        cache.clear()  # fréquences des trigrammes
+
+    def trouves(self, terme):
+        return set(Utilisateur.objects.filter(recherche.filtre_recherche(terme)).values_list('email', flat=True))
+
+    def test_texte_plie(self):
+        self.assertEqual(recherche.plier('  Zoé   OUÉDRAOGO '), 'zoe ouedraogo')
+        self.assertEqual(self.zoe.recherche, 'zoe ouedraogo zoe@lonab.bf mat-0042 +22670112233')
+
+    def test_accents_et_casse_ignores(self):
+        self.assertEqual(self.trouves('oued'), {'zoe@lonab.bf'})
+        self.assertEqual(self.trouves('OUÉD'), {'zoe@lonab.bf'})
+        self.assertEqual(self.trouves('traore'), {'ali@lonab.bf'})
+        self.assertEqual(self.trouves('ou'), {'zoe@lonab.bf', 'awa@lonab.bf'})  # mot court : parcours
+        # Tous les mots doivent se retrouver dans la fiche
+        self.assertEqual(self.trouves('awa ouat'), {'awa@lonab.bf'})
+        self.assertEqual(self.trouves('awa oued'), set())
+        self.assertEqual(self.trouves(''), {'zoe@lonab.bf', 'ali@lonab.bf', 'awa@lonab.bf'})
+
+    def test_trigramme_le_plus_rare(self):
+        self.assertEqual(
+            set(self.zoe.trigrammes.values_list('trigramme', flat=True)),
+            recherche.ngrammes_texte(self.zoe.recherche),
+        )
+        q = recherche.filtre_recherche('ouedr')
+        self.assertIn('pk__in', str(q))
+        # Mot trop courant : même résultat par simple parcours
+        with mock.patch.object(recherche, 'SEUIL_SELECTIF', 0):
+            self.assertNotIn('pk__in', str(recherche.filtre_recherche('ouedr')))
+            self.assertEqual(self.trouves('ouedr'), {'zoe@lonab.bf'})
+        self.assertEqual(self.trouves('ouedr'), {'zoe@lonab.bf'})
+
+    def test_frequences_en_cache(self):
+        recherche.frequences({'oue', 'tra'})
+        with self.assertNumQueries(1):  # lecture du cache seule
+            self.assertEqual(recherche.frequences({'oue', 'tra'}), {'oue': 1, 'tra': 1})
+
+    def test_raccourci_matricule(self):
+        self.assertEqual(recherche.filtre_recherche('MAT-00'), Q(matricule__istartswith='MAT-00'))
+        self.assertEqual(self.trouves('mat-0042'), {'zoe@lonab.bf'})
+        self.assertEqual(self.trouves('MAT-0'), {'zoe@lonab.bf', 'ali@lonab.bf'})
+        # Matricule inconnu : recherche ordinaire dans le texte
+        self.assertEqual(self.trouves('70112233'), {'zoe@lonab.bf'})
+
+    def test_raccourci_numero(self):
+        self.assertEqual(
+            recherche.filtre_recherche('202610-00042', 'proprietaire__', numero='numero_ticket'),
+            Q(numero_ticket__startswith='202610-00042'),
+        )
+        self.assertEqual(
+            recherche.filtre_recherche('20261017-083012', 'client__', numero='numero_transaction'),
+            Q(numero_transaction__startswith='20261017-083012'),
+        )
+        # Morceau de numéro : la personne ou le numéro
+        q = recherche.filtre_recherche('00042', 'proprietaire__', numero='numero_ticket')
+        self.assertIn(('numero_ticket__contains', '00042'), q.children)
+
+    def test_index_suit_les_modifications(self):
+        self.zoe.nom = 'Kaboré'
+        self.zoe.save(update_fields=['nom'])
+        self.assertEqual(self.trouves('kabore'), {'zoe@lonab.bf'})
+        self.assertEqual(self.trouves('ouedr'), set())
+        self.assertNotIn('oue', set(self.zoe.trigrammes.values_list('trigramme', flat=True)))
 
-# Create your tests here.
+    def test_reindexer_tout(self):
+        TrigrammeUtilisateur.objects.all().delete()
+        Utilisateur.objects.update(recherche='')
+        self.assertEqual(recherche.reindexer_tout(taille_lot=2), 3)
+        self.assertEqual(Utilisateur.objects.get(pk=self.ali.pk).recherche, 'ali traore ali@lonab.bf mat-0107')
+        self.assertEqual(self.trouves('traor'), {'ali@lonab.bf'})
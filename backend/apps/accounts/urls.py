@@ -90,10 +90,10 @@ urlpatterns = [
     # ============================================
     # EXPORTS
     # ============================================
-    path('export/users/pdf/', views.export_users_pdf, name='export_users_pdf'),
-    path('export/users/excel/', views.export_users_excel, name='export_users_excel'),
-    path('export/directions/pdf/', views.export_directions_pdf, name='export_directions_pdf'),
-    path('export/agencies/excel/', views.export_agencies_excel, name='export_agencies_excel'),
+    path('export/users/pdf/', exports.export_users_pdf, name='export_users_pdf'),
+    path('export/users/excel/', exports.export_users_excel, name='export_users_excel'),
+    path('export/directions/pdf/', exports.export_directions_pdf, name='export_directions_pdf'),
+    path('export/agencies/excel/', exports.export_agencies_excel, name='export_agencies_excel'),
 
     # ============================================
     # API ENDPOINTS
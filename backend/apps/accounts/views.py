@@ -19,7 +19,6 @@ from django.views.decorators.cache import never_cache
 from django.http import JsonResponse, HttpResponse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from datetime import datetime, timedelta
-from io import BytesIO
 import json
 
 from rest_framework import viewsets, status
@@ -211,8 +210,6 @@ def dashboard_client(request):
 
     contexte.update({
         'annee_courante': timezone.now().year,
-        'notifications': [],
-        'nombre_notifications_non_lues': 0,
     })
 
     return render(request, 'dashboards/client_dashboard.html', contexte)
@@ -286,8 +283,6 @@ def dashboard_caissier(request):
 
     contexte.update({
         'annee_courante': timezone.now().year,
-        'notifications': [],
-        'nombre_notifications_non_lues': 0,
     })
 
     return render(request, 'dashboards/caissier_dashboard.html', contexte)
@@ -359,8 +354,6 @@ def dashboard_restaurant(request):
 
     contexte.update({
         'annee_courante': timezone.now().year,
-        'notifications': [],
-        'nombre_notifications_non_lues': 0,
     })
 
     return render(request, 'dashboards/restaurant_dashboard.html', contexte)
@@ -474,8 +467,6 @@ def dashboard_admin(request):
 
     contexte.update({
         'annee_courante': timezone.now().year,
-        'notifications': [],
-        'nombre_notifications_non_lues': 0,
     })
 
     return render(request, 'dashboards/admin_dashboard.html', contexte)
@@ -533,8 +524,8 @@ def users_list(request):
         messages.warning(request, "Vous n'avez pas accès à cette section.")
         return redirect('accounts:dashboard')
 
-    from django.db.models import Q
     from .models import Utilisateur, Direction, Agence
+    from .recherche import filtre_recherche
 
     qs = Utilisateur.objects.all().select_related('direction', 'agence', 'restaurant_gere')
 
@@ -559,29 +550,17 @@ def users_list(request):
 
     search = request.GET.get('search', '').strip()
     if search:
-        qs = qs.filter(
-            Q(prenom__icontains=search) | Q(nom__icontains=search) |
-            Q(email__icontains=search) | Q(matricule__icontains=search)
-        )
-
-    qs = qs.order_by('-date_inscription')
+        qs = qs.filter(filtre_recherche(search))
 
-    # Pagination — 10 par page
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(qs, 10)
-    page = request.GET.get('page')
-    try:
-        users_page = paginator.page(page)
-    except PageNotAnInteger:
-        users_page = paginator.page(1)
-    except EmptyPage:
-        users_page = paginator.page(paginator.num_pages)
+    # Pagination par curseur — 10 par page, (date_inscription, id) décroissants
+    from apps.settings.pagination import paginer_par_curseur
+    users_page = paginer_par_curseur(request, qs, 'date_inscription', 10)
 
     from django.utils import timezone
     context = {
         'users': users_page,  # ← paginated queryset (legacy)
         'page_obj': users_page,  # ← pour le composant pagination.html
-        'is_paginated': paginator.num_pages > 1,
+        'is_paginated': users_page.has_other_pages(),
         'directions': Direction.objects.filter(est_active=True).order_by('nom'),
         'agences': Agence.objects.filter(est_active=True).order_by('nom'),
         'types_utilisateur': Utilisateur.TYPES_UTILISATEUR,
@@ -670,9 +649,7 @@ def user_create(request):
         user.save()
         ProfilUtilisateur.objects.get_or_create(utilisateur=user)
 
-        # Envoyer email avec les identifiants
-        from .signals import envoyer_email_avec_mdp
-        envoyer_email_avec_mdp(user, mot_de_passe)
+        # Email avec les identifiants : envoyé en tâche de fond par le signal post_save
 
         return JsonResponse({
             'success': True,
@@ -820,8 +797,6 @@ def profile_view(request):
 
     context = {
         'annee_courante': timezone.now().year,
-        'notifications': [],
-        'nombre_notifications_non_lues': 0,
     }
 
     return render(request, 'accounts/profile.html', context)
@@ -972,7 +947,7 @@ def directions_list(request):
     context = {
         'directions': directions_page,  # ← paginated queryset
         'page_obj': directions_page,  # ← pour le composant pagination.html
-        'is_paginated': paginator.num_pages > 1,
+        'is_paginated': directions_page.has_other_pages(),
         'annee_courante': timezone.now().year,
         'utilisateurs': Utilisateur.objects.filter(
             type_utilisateur='ADMIN', est_actif=True
@@ -1181,7 +1156,7 @@ def agences_list(request):
     context = {
         'agences': agences_page,  # ← paginated queryset
         'page_obj': agences_page,  # ← pour le composant pagination.html
-        'is_paginated': paginator.num_pages > 1,
+        'is_paginated': agences_page.has_other_pages(),
         'directions': Direction.objects.filter(est_active=True),
         'annee_courante': timezone.now().year,
         'responsables': __import__('apps.accounts.models', fromlist=['Utilisateur']).Utilisateur.objects.filter(
@@ -1356,284 +1331,6 @@ def agence_detail(request, pk):
     return render(request, 'accounts/agence_detail.html', context)
 
 
-# ============================================
-# VUES D'EXPORT
-# ============================================
-
-@login_required
-def export_users_pdf(request):
-    """Exporter la liste des utilisateurs en PDF"""
-    if not request.user.est_admin:
-        messages.warning(request, 'Vous n\'avez pas accès à cette fonction.')
-        return redirect('accounts:users_list')
-
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER
-
-    # Créer le buffer
-    buffer = BytesIO()
-
-    # Créer le document PDF
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#1a472a'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-
-    # Titre
-    title = Paragraph("Liste des Utilisateurs", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    # Récupérer les utilisateurs
-    users = Utilisateur.objects.all().select_related('direction', 'agence')
-
-    # Données du tableau
-    data = [['#', 'Nom', 'Email', 'Type', 'Direction', 'Statut']]
-
-    for idx, user in enumerate(users, 1):
-        data.append([
-            str(idx),
-            user.get_full_name(),
-            user.email,
-            user.get_type_utilisateur_display(),
-            user.direction.nom if user.direction else '-',
-            'Actif' if user.est_actif else 'Inactif'
-        ])
-
-    # Créer le tableau
-    table = Table(data, colWidths=[0.5 * inch, 1.5 * inch, 2 * inch, 1.5 * inch, 1.5 * inch, 1 * inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a472a')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-    ]))
-
-    elements.append(table)
-
-    # Construire le PDF
-    doc.build(elements)
-
-    # Retourner la réponse
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="utilisateurs_{timezone.now().strftime("%Y%m%d")}.pdf"'
-
-    return response
-
-@login_required
-def export_users_excel(request):
-    """Exporter la liste des utilisateurs en Excel"""
-    if not request.user.est_admin:
-        messages.warning(request, 'Vous n\'avez pas accès à cette fonction.')
-        return redirect('accounts:users_list')
-
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-
-    # Créer le workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Utilisateurs"
-
-    # Style pour l'en-tête
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="1a472a", end_color="1a472a", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    # En-têtes
-    headers = ['#', 'Prénom', 'Nom', 'Email', 'Téléphone', 'Type', 'Matricule',
-               'Direction', 'Agence', 'Statut', 'Date d\'inscription']
-    ws.append(headers)
-
-    # Appliquer le style aux en-têtes
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-
-    # Récupérer les utilisateurs
-    users = Utilisateur.objects.all().select_related('direction', 'agence')
-
-    # Ajouter les données
-    for idx, user in enumerate(users, 1):
-        ws.append([
-            idx,
-            user.prenom,
-            user.nom,
-            user.email,
-            user.telephone,
-            user.get_type_utilisateur_display(),
-            user.matricule or '-',
-            user.direction.nom if user.direction else '-',
-            user.agence.nom if user.agence else '-',
-            'Actif' if user.est_actif else 'Inactif',
-            user.date_inscription.strftime('%d/%m/%Y') if user.date_inscription else '-'
-        ])
-
-    # Ajuster la largeur des colonnes
-    column_widths = [5, 15, 15, 25, 15, 20, 15, 20, 20, 10, 15]
-    for idx, width in enumerate(column_widths, 1):
-        ws.column_dimensions[chr(64 + idx)].width = width
-
-    # Sauvegarder dans un buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    # Retourner la réponse
-    response = HttpResponse(
-        buffer,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="utilisateurs_{timezone.now().strftime("%Y%m%d")}.xlsx"'
-
-    return response
-
-@login_required
-def export_directions_pdf(request):
-    """Exporter la liste des directions en PDF"""
-    if not request.user.est_admin:
-        messages.warning(request, 'Vous n\'avez pas accès à cette fonction.')
-        return redirect('accounts:directions_list')
-
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#1a472a'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-
-    title = Paragraph("Liste des Directions", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    directions = Direction.objects.all()
-
-    data = [['#', 'Nom', 'Code', 'Directeur', 'Employés', 'Statut']]
-
-    for idx, direction in enumerate(directions, 1):
-        data.append([
-            str(idx),
-            direction.nom,
-            direction.code,
-            direction.directeur.get_full_name() if direction.directeur else '-',
-            str(direction.total_employes),
-            'Active' if direction.est_active else 'Inactive'
-        ])
-
-    table = Table(data, colWidths=[0.5 * inch, 2 * inch, 1 * inch, 1.5 * inch, 1 * inch, 1 * inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a472a')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-    ]))
-
-    elements.append(table)
-    doc.build(elements)
-
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="directions_{timezone.now().strftime("%Y%m%d")}.pdf"'
-
-    return response
-
-@login_required
-def export_agencies_excel(request):
-    """Exporter la liste des agences en Excel"""
-    if not request.user.est_admin:
-        messages.warning(request, 'Vous n\'avez pas accès à cette fonction.')
-        return redirect('accounts:agencies_list')
-
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Agences"
-
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="1a472a", end_color="1a472a", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    headers = ['#', 'Nom', 'Code', 'Type', 'Ville', 'Direction', 'Responsable', 'Employés', 'Statut']
-    ws.append(headers)
-
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-
-    agences = Agence.objects.all().select_related('direction', 'responsable')
-
-    for idx, agence in enumerate(agences, 1):
-        ws.append([
-            idx,
-            agence.nom,
-            agence.code,
-            agence.get_type_agence_display(),
-            agence.ville,
-            agence.direction.nom if agence.direction else '-',
-            agence.responsable.get_full_name() if agence.responsable else '-',
-            agence.total_employes,
-            'Active' if agence.est_active else 'Inactive'
-        ])
-
-    column_widths = [5, 20, 10, 15, 15, 20, 20, 10, 10]
-    for idx, width in enumerate(column_widths, 1):
-        ws.column_dimensions[chr(64 + idx)].width = width
-
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    response = HttpResponse(
-        buffer,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="agences_{timezone.now().strftime("%Y%m%d")}.xlsx"'
-
-    return response
-
-
 # ============================================
 # API ViewSets
 # ============================================
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class NotifsConfig(AppConfig):
     name = 'apps.notifs'
+
+    def ready(self):
+        import apps.notifs.signals
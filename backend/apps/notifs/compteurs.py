@@ -0,0 +1,155 @@
+"""
+Compteur de notifications non lues et 5 dernières non lues, par utilisateur, en cache.
+
+Les valeurs sont tenues à jour au fil de l'eau (création, lecture, suppression)
+après le commit de la transaction, y compris pour les opérations de masse
+(envoi groupé, « tout marquer lu ») : seuls les destinataires concernés sont
+ajustés. Si une clé manque, elle est recalculée depuis la base.
+Chaque changement est aussi diffusé aux flux ouverts (voir flux.py).
+
+invalider_tout() reste disponible pour une remise à zéro exceptionnelle : la
+génération des clés est relue dans le cache partagé au plus toutes les
+DELAI_GENERATION secondes, pas à chaque page.
+"""
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import flux
+
+NB_DERNIERES = 5
+DUREE_CACHE = 600
+CLE_GENERATION = 'notifs:generation'
+DELAI_GENERATION = 30
+_generation_locale = {'valeur': None, 'verifiee_le': 0.0}
+
+
+def _generation():
+    maintenant = time.monotonic()
+    if _generation_locale['valeur'] is None or maintenant - _generation_locale['verifiee_le'] > DELAI_GENERATION:
+        _generation_locale.update(valeur=cache.get(CLE_GENERATION) or 1, verifiee_le=maintenant)
+    return _generation_locale['valeur']
+
+
+def _cles(utilisateur_id):
+    prefixe = f'notifs:{_generation()}:{utilisateur_id}'
+    return f'{prefixe}:non_lues', f'{prefixe}:dernieres'
+
+
+def _resume(n):
+    """Ce que la navbar affiche d'une notification (types simples, sérialisables)"""
+    return {
+        'id':                n.id,
+        'titre':             n.titre,
+        'message':           n.message[:80],
+        'type_notification': n.type_notification,
+        'priorite':          n.priorite,
+        'lien':              n.lien,
+        'cree_le':           n.cree_le,
+    }
+
+
+# ── Lecture ───────────────────────────────────────────────────────
+def etat_notifications(utilisateur):
+    """(nombre de non lues, 5 dernières non lues) — aucune requête si le cache est chaud"""
+    from .models import Notification
+
+    cle_nombre, cle_dernieres = _cles(utilisateur.pk)
+    valeurs = cache.get_many([cle_nombre, cle_dernieres])
+    nombre, dernieres = valeurs.get(cle_nombre), valeurs.get(cle_dernieres)
+
+    non_lues = Notification.objects.filter(destinataire_id=utilisateur.pk, est_lu=False)
+    if nombre is None:
+        nombre = non_lues.count()
+        cache.set(cle_nombre, nombre, DUREE_CACHE)
+    if dernieres is None:
+        dernieres = [_resume(n) for n in non_lues.order_by('-cree_le')[:NB_DERNIERES]]
+        cache.set(cle_dernieres, dernieres, DUREE_CACHE)
+    return nombre, dernieres
+
+
+def contexte_notifications(utilisateur):
+    """Variables attendues par la navbar des dashboards"""
+    nombre, dernieres = etat_notifications(utilisateur)
+    return {'unread_notifications_count': nombre, 'notifications': dernieres}
+
+
+# ── Mises à jour incrémentales ────────────────────────────────────
+def _ajuster(utilisateur_id, delta, invalider_dernieres=True):
+    cle_nombre, cle_dernieres = _cles(utilisateur_id)
+    try:
+        if cache.incr(cle_nombre, delta) < 0:
+            cache.delete(cle_nombre)
+    except ValueError:
+        pass  # clé absente : recalculée à la prochaine lecture
+    if invalider_dernieres:
+        cache.delete(cle_dernieres)
+
+
+def _ajuster_et_diffuser(utilisateur_id, delta, evenement=None):
+    _ajuster(utilisateur_id, delta)
+    flux.publier(utilisateur_id, evenement or {'type': 'etat'})
+
+
+def notification_creee(notification):
+    if not notification.est_lu:
+        uid = notification.destinataire_id
+        resume = {**_resume(notification), 'cree_le': notification.cree_le.isoformat()}
+        evenement = {'type': 'nouvelle', 'notification': resume}
+        transaction.on_commit(lambda: _ajuster_et_diffuser(uid, 1, evenement))
+
+
+def notification_lue(notification):
+    uid = notification.destinataire_id
+    transaction.on_commit(lambda: _ajuster_et_diffuser(uid, -1))
+
+
+def notification_supprimee(notification):
+    if not notification.est_lu:
+        uid = notification.destinataire_id
+        transaction.on_commit(lambda: _ajuster_et_diffuser(uid, -1))
+
+
+def notifications_creees(destinataires_ids):
+    """Envoi groupé (bulk_create, sans signal) : +1 non lue par notification, pour ses seuls destinataires"""
+    deltas = Counter(destinataires_ids)
+
+    def _ajuster_groupe():
+        cles = {_cles(uid)[0]: delta for uid, delta in deltas.items()}
+        # Seules les clés présentes sont ajustées : une clé absente sera recalculée à la lecture
+        cache.set_many({cle: nombre + cles[cle] for cle, nombre in cache.get_many(list(cles)).items()}, DUREE_CACHE)
+        cache.delete_many([_cles(uid)[1] for uid in deltas])
+        flux.publier(None, {'type': 'rafraichir'})
+    if deltas:
+        transaction.on_commit(_ajuster_groupe)
+
+
+def tout_lu(*utilisateurs_ids):
+    """Toutes les notifications de ces utilisateurs viennent d'être lues"""
+    def _remettre_a_zero():
+        valeurs = {}
+        for uid in utilisateurs_ids:
+            cle_nombre, cle_dernieres = _cles(uid)
+            valeurs.update({cle_nombre: 0, cle_dernieres: []})
+        cache.set_many(valeurs, DUREE_CACHE)
+        if len(utilisateurs_ids) == 1:
+            flux.publier(utilisateurs_ids[0], {'type': 'etat'})
+        else:
+            flux.publier(None, {'type': 'rafraichir'})
+    if utilisateurs_ids:
+        transaction.on_commit(_remettre_a_zero)
+
+
+def invalider_tout():
+    """Remise à zéro exceptionnelle : nouvelle génération, toutes les clés sont recalculées"""
+    def _nouvelle_generation():
+        try:
+            valeur = cache.incr(CLE_GENERATION)
+        except ValueError:
+            valeur = _generation() + 1
+            cache.set(CLE_GENERATION, valeur, None)
+        _generation_locale.update(valeur=valeur, verifiee_le=time.monotonic())
+        flux.publier(None, {'type': 'rafraichir'})
+    transaction.on_commit(_nouvelle_generation)
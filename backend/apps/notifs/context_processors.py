@@ -0,0 +1,13 @@
+"""
+Processeur de contexte : badge et liste de la navbar sur toutes les pages
+"""
+from .compteurs import contexte_notifications
+
+
+def notifications(request):
+    if not getattr(request, 'user', None) or not request.user.is_authenticated:
+        return {}
+    try:
+        return contexte_notifications(request.user)
+    except Exception:
+        return {'unread_notifications_count': 0, 'notifications': []}
@@ -0,0 +1,146 @@
+"""
+Envoi groupé des emails de notification en attente.
+
+Les notifications (envoyer_email=True, email_envoye=False) sont lues par
+lots ordonnés par clé primaire (pagination par clé, pas d'OFFSET). Chaque lot
+part sur une seule connexion ouverte par get_connection(), et les lignes
+envoyées sont marquées en un seul bulk_update. Quand un ModeleEmail actif
+correspond au type de notification, le lot est rendu par ModeleEmail.rendre_lot
+(gabarits compilés une fois pour tout l'envoi).
+
+    envoyer_emails_en_attente(taille_lot=500)
+    → {'envoyes': 49800, 'echecs': 200, 'lots': 100, 'duree_s': 41.2, 'messages_par_seconde': 1208.7}
+"""
+import logging
+import time
+from smtplib import SMTPException, SMTPServerDisconnected
+
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 500
+CLE_VERROU = 'notifs:envoi_groupe'
+DUREE_VERROU = 3600
+
+# Type de notification → type de ModeleEmail qui la met en forme
+MODELES_PAR_TYPE = {
+    'ACHAT': 'CONFIRMATION_ACHAT',
+    'CONSOMMATION': 'CONFIRMATION_CONSOMMATION',
+    'PROGRAMMATION': 'NOTIFICATION_PROGRAMMATION',
+    'MENU': 'NOTIFICATION_MENU',
+}
+
+
+def notifications_en_attente():
+    from .models import Notification
+
+    return (
+        Notification.objects
+        .filter(envoyer_email=True, email_envoye=False)
+        .exclude(destinataire__email='')
+        .select_related('destinataire')
+        .only('id', 'titre', 'message', 'type_notification', 'lien', 'texte_lien', 'envoyer_email',
+              'email_envoye', 'destinataire__email', 'destinataire__prenom', 'destinataire__nom')
+        .order_by('pk')
+    )
+
+
+def modeles_actifs():
+    """{type de notification: ModeleEmail actif} — une requête par envoi"""
+    from .models import ModeleEmail
+
+    modeles = {}
+    for modele in ModeleEmail.objects.filter(actif=True, type_modele__in=MODELES_PAR_TYPE.values()):
+        modeles.setdefault(modele.type_modele, modele)
+    return {type_n: modeles[type_m] for type_n, type_m in MODELES_PAR_TYPE.items() if type_m in modeles}
+
+
+def rendus_par_modele(notifications, modeles):
+    """
+    {pk: (sujet, texte, html)} des notifications dont le type a un modèle,
+    chaque modèle rendant tous ses contextes du lot en un appel à rendre_lot.
+    Les autres notifications partent avec leur titre et leur message.
+    """
+    par_modele = {}
+    for n in notifications:
+        if n.type_notification in modeles:
+            par_modele.setdefault(n.type_notification, []).append(n)
+
+    rendus = {}
+    for type_n, groupe in par_modele.items():
+        contextes = [
+            {
+                'titre': n.titre, 'message': n.message, 'lien': n.lien, 'texte_lien': n.texte_lien,
+                'prenom': n.destinataire.prenom, 'nom': n.destinataire.nom,
+            }
+            for n in groupe
+        ]
+        rendus.update(zip([n.pk for n in groupe], modeles[type_n].rendre_lot(contextes)))
+    return rendus
+
+
+def _envoyer_lot(lot, connexion, modeles):
+    """Envoie le lot sur la connexion ; retourne les notifications effectivement envoyées"""
+    rendus = rendus_par_modele(lot, modeles)
+    envoyees = []
+    for n in lot:
+        try:
+            if connexion.send_messages([n.message_email(rendu=rendus.get(n.pk))]):
+                envoyees.append(n)
+        except SMTPServerDisconnected as e:
+            logger.warning(f"Connexion SMTP perdue, reste du lot reporté : {e}")
+            break
+        except (SMTPException, OSError) as e:
+            logger.warning(f"Erreur d'envoi d'email (notification {n.pk}) : {e}")
+    return envoyees
+
+
+def envoyer_emails_en_attente(taille_lot=TAILLE_LOT):
+    """
+    Envoie toutes les notifications en attente. Un seul envoi groupé à la fois
+    (retourne None si un autre est en cours) ; retourne les compteurs et le débit.
+    Les échecs restent en attente pour le prochain passage.
+    """
+    from .models import Notification
+
+    if not cache.add(CLE_VERROU, 1, DUREE_VERROU):
+        logger.info("Envoi groupé déjà en cours, ignoré")
+        return None
+
+    stats = {'envoyes': 0, 'echecs': 0, 'lots': 0}
+    debut = time.monotonic()
+    try:
+        qs, dernier = notifications_en_attente(), 0
+        modeles = modeles_actifs()
+        while True:
+            lot = list(qs.filter(pk__gt=dernier)[:taille_lot])
+            if not lot:
+                break
+            dernier = lot[-1].pk
+
+            try:
+                with get_connection() as connexion:
+                    envoyees = _envoyer_lot(lot, connexion, modeles)
+            except (SMTPException, OSError) as e:
+                logger.error(f"Connexion SMTP impossible, envoi interrompu : {e}")
+                stats['echecs'] += len(lot)
+                break
+
+            maintenant = timezone.now()
+            for n in envoyees:
+                n.email_envoye, n.email_envoye_le = True, maintenant
+            Notification.objects.bulk_update(envoyees, ['email_envoye', 'email_envoye_le'])
+
+            stats['lots'] += 1
+            stats['envoyes'] += len(envoyees)
+            stats['echecs'] += len(lot) - len(envoyees)
+    finally:
+        cache.delete(CLE_VERROU)
+
+    stats['duree_s'] = round(time.monotonic() - debut, 3)
+    stats['messages_par_seconde'] = round(stats['envoyes'] / stats['duree_s'], 1) if stats['duree_s'] else 0.0
+    logger.info(f"Envoi groupé des emails : {stats}")
+    return stats
@@ -0,0 +1,180 @@
+"""
+Diffusion des notifications en direct (Server-Sent Events sur l'application ASGI).
+
+Le bus relie les écritures (vues synchrones, signaux) aux flux ouverts par les
+navigateurs. Un abonné au repos n'attend que sa file : aucune requête en base
+tant que rien ne change pour lui.
+
+    publier(utilisateur_id, {'type': 'etat'})     # un utilisateur
+    publier(None, {'type': 'rafraichir'})         # tous les abonnés du processus
+
+Le bus est choisi par settings.NOTIFICATIONS_BUS :
+  - BusRedis (défaut dès qu'une URL Redis est configurée) : les notifications
+    créées par n'importe quel worker web ou Celery atteignent tous les flux ;
+  - BusMemoire (sans Redis) : seuls les flux du processus qui publie.
+"""
+import asyncio
+import json
+import logging
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TAILLE_FILE = 50
+CANAL_TOUS = 'notifs:flux:tous'
+
+
+def _canal(utilisateur_id):
+    return f'notifs:flux:{utilisateur_id}'
+
+
+# ════════════════════════════════════════════════════════════════
+# Bus en mémoire — un processus
+# ════════════════════════════════════════════════════════════════
+class BusMemoire:
+    """Une asyncio.Queue par flux ouvert ; publication possible depuis n'importe quel thread"""
+
+    def __init__(self):
+        self._abonnes = {}  # utilisateur_id -> {(boucle, file)}
+        self._verrou = Lock()
+
+    def abonner(self, utilisateur_id):
+        """`async with bus.abonner(uid) as file:` — file d'événements de l'utilisateur"""
+        return _Abonnement(self._ajouter, self._retirer, utilisateur_id)
+
+    async def _ajouter(self, utilisateur_id):
+        abonne = (asyncio.get_running_loop(), asyncio.Queue(TAILLE_FILE))
+        with self._verrou:
+            self._abonnes.setdefault(utilisateur_id, set()).add(abonne)
+        return abonne
+
+    async def _retirer(self, utilisateur_id, abonne):
+        with self._verrou:
+            restants = self._abonnes.get(utilisateur_id, set())
+            restants.discard(abonne)
+            if not restants:
+                self._abonnes.pop(utilisateur_id, None)
+
+    def publier(self, utilisateur_id, evenement):
+        with self._verrou:
+            if utilisateur_id is None:
+                cibles = [a for abonnes in self._abonnes.values() for a in abonnes]
+            else:
+                cibles = list(self._abonnes.get(utilisateur_id, ()))
+        for boucle, file in cibles:
+            try:
+                boucle.call_soon_threadsafe(_deposer, file, evenement)
+            except RuntimeError:
+                pass  # boucle fermée : l'abonné est en train de partir
+
+    def nombre_abonnes(self):
+        with self._verrou:
+            return sum(len(abonnes) for abonnes in self._abonnes.values())
+
+
+class _Abonnement:
+    """Contexte async d'un flux : inscrit l'abonné à l'entrée, le retire à la sortie"""
+
+    def __init__(self, ajouter, retirer, utilisateur_id):
+        self._ajouter, self._retirer = ajouter, retirer
+        self.utilisateur_id = utilisateur_id
+        self._abonne = None
+
+    async def __aenter__(self):
+        self._abonne = await self._ajouter(self.utilisateur_id)
+        return self._abonne[-1]
+
+    async def __aexit__(self, *exc):
+        await self._retirer(self.utilisateur_id, self._abonne)
+
+
+def _deposer(file, evenement):
+    """Ajoute l'événement ; file pleine → le client est en retard, un simple rafraîchissement suffit"""
+    if file.full():
+        while not file.empty():
+            file.get_nowait()
+        evenement = {'type': 'rafraichir'}
+    file.put_nowait(evenement)
+
+
+# ════════════════════════════════════════════════════════════════
+# Bus Redis — plusieurs processus
+# ════════════════════════════════════════════════════════════════
+class BusRedis(BusMemoire):
+    """
+    Même interface que BusMemoire, via PUBLISH/SUBSCRIBE (settings.NOTIFICATIONS_REDIS_URL).
+    Une seule connexion d'écoute par processus, quel que soit le nombre de flux
+    ouverts : elle reçoit tous les canaux notifs:flux:* et les redistribue aux
+    files en mémoire des abonnés locaux.
+    """
+
+    DELAI_RECONNEXION = 2
+
+    def __init__(self):
+        super().__init__()
+        import redis
+        self.url = getattr(settings, 'NOTIFICATIONS_REDIS_URL', '') or 'redis://localhost:6379/0'
+        self._client = redis.Redis.from_url(self.url)
+        self._relais = None
+
+    async def _ajouter(self, utilisateur_id):
+        relais = self._relais
+        if relais is None or relais.done() or relais.get_loop() is not asyncio.get_running_loop():
+            self._relais = asyncio.create_task(self._relayer())
+        return await super()._ajouter(utilisateur_id)
+
+    async def _relayer(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.psubscribe(_canal('*'))
+                async for message in pubsub.listen():
+                    canal = message['channel'].decode()
+                    destinataire = None if canal == CANAL_TOUS else int(canal.rsplit(':', 1)[1])
+                    BusMemoire.publier(self, destinataire, json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Écoute Redis des notifications interrompue : {e}")
+                await asyncio.sleep(self.DELAI_RECONNEXION)
+            finally:
+                await client.aclose()
+
+    def publier(self, utilisateur_id, evenement):
+        # Les abonnés de ce processus reçoivent aussi l'événement par Redis
+        canal = CANAL_TOUS if utilisateur_id is None else _canal(utilisateur_id)
+        try:
+            self._client.publish(canal, json.dumps(evenement, default=str))
+        except Exception as e:
+            logger.warning(f"Publication notification impossible ({canal}) : {e}")
+
+
+# ════════════════════════════════════════════════════════════════
+# Accès au bus configuré
+# ════════════════════════════════════════════════════════════════
+_bus = None
+_verrou_bus = Lock()
+
+
+def bus():
+    global _bus
+    if _bus is None:
+        with _verrou_bus:
+            if _bus is None:
+                chemin = getattr(settings, 'NOTIFICATIONS_BUS', 'apps.notifs.flux.BusMemoire')
+                _bus = import_string(chemin)()
+    return _bus
+
+
+def publier(utilisateur_id, evenement):
+    """Ne lève jamais : une notification écrite en base reste visible au prochain chargement"""
+    try:
+        bus().publier(utilisateur_id, evenement)
+    except Exception as e:
+        logger.warning(f"Diffusion notification impossible : {e}")
@@ -0,0 +1,28 @@
+"""
+Envoie les emails des notifications en attente, par lots.
+
+    python manage.py envoyer_emails
+    python manage.py envoyer_emails --taille-lot 1000
+"""
+from django.core.management.base import BaseCommand
+
+from apps.notifs.envoi import TAILLE_LOT, envoyer_emails_en_attente
+
+
+class Command(BaseCommand):
+    help = "Envoie par lots les emails des notifications en attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT,
+                            help=f'Notifications par connexion SMTP (défaut {TAILLE_LOT})')
+
+    def handle(self, *args, **options):
+        stats = envoyer_emails_en_attente(taille_lot=options['taille_lot'])
+        if stats is None:
+            self.stdout.write(self.style.WARNING("Un envoi groupé est déjà en cours."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['envoyes']} email(s) envoyé(s) en {stats['lots']} lot(s), "
+            f"{stats['echecs']} échec(s) — {stats['duree_s']} s, {stats['messages_par_seconde']} msg/s."
+        ))
@@ -1,10 +1,16 @@
 """
 Modèles pour la gestion des notifications et des templates d'email
 """
+import logging
+from collections import OrderedDict
+from threading import Lock
+
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 
 class Notification(models.Model):
     """Modèle pour les notifications des utilisateurs"""
@@ -79,30 +85,50 @@ class Notification(models.Model):
     def marquer_comme_lu(self):
         """Marquer la notification comme lue"""
         if not self.est_lu:
+            from .compteurs import notification_lue
+
             self.est_lu = True
             self.lu_le = timezone.now()
-            self.save(update_fields=['est_lu', 'lu_le'])
-
-    def envoyer_email_notification(self):
-        """Envoyer la notification par email"""
+            # UPDATE conditionnel : une lecture concurrente ne décompte pas deux fois
+            if Notification.objects.filter(pk=self.pk, est_lu=False).update(est_lu=True, lu_le=self.lu_le):
+                notification_lue(self)
+
+    def message_email(self, connexion=None, rendu=None):
+        """
+        Email de la notification (non envoyé). `rendu` : (sujet, texte, html)
+        issu d'un ModeleEmail (voir envoi.rendus_par_modele), sinon titre et message.
+        """
+        from django.core.mail import EmailMultiAlternatives
+
+        sujet, texte, html = rendu or (self.titre, self.message, '')
+        message = EmailMultiAlternatives(
+            subject=sujet,
+            body=texte,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[self.destinataire.email],
+            connection=connexion,
+        )
+        if html:
+            message.attach_alternative(html, 'text/html')
+        return message
+
+    def envoyer_email_notification(self, connexion=None, rendu=None):
+        """
+        Envoyer la notification par email (sur `connexion` si fournie, pour
+        réutiliser une connexion SMTP le temps d'un lot). Retourne True si envoyé.
+        """
         if self.envoyer_email and not self.email_envoye:
-            from django.core.mail import send_mail
-
             try:
-                send_mail(
-                    subject=self.titre,
-                    message=self.message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[self.destinataire.email],
-                    fail_silently=False,
-                )
-                self.email_envoye = True
-                self.email_envoye_le = timezone.now()
-                self.save(update_fields=['email_envoye', 'email_envoye_le'])
-                return True
+                self.message_email(connexion, rendu).send(fail_silently=False)
             except Exception as e:
-                print(f"Erreur d'envoi d'email : {e}")
+                logger.warning(f"Erreur d'envoi d'email (notification {self.pk}) : {e}")
                 return False
+            self.email_envoye = True
+            self.email_envoye_le = timezone.now()
+            Notification.objects.filter(pk=self.pk).update(
+                email_envoye=True, email_envoye_le=self.email_envoye_le,
+            )
+            return True
         return False
 
 
@@ -146,14 +172,65 @@ class ModeleEmail(models.Model):
     def __str__(self):
         return f"{self.nom} ({self.get_type_modele_display()})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        _oublier_gabarits(self.pk)
+
+    def gabarits(self):
+        """(sujet, texte, html ou None) compilés, en cache par (pk, modifie_le)"""
+        from django.template import Template
+
+        cle = (self.pk, self.modifie_le)
+        with _verrou_gabarits:
+            if cle in _gabarits_compiles:
+                _gabarits_compiles.move_to_end(cle)
+                return _gabarits_compiles[cle]
+
+        compiles = (
+            Template(self.sujet),
+            Template(self.corps_texte),
+            Template(self.corps_html) if self.corps_html else None,
+        )
+        if self.pk is None:
+            return compiles
+
+        with _verrou_gabarits:
+            _gabarits_compiles[cle] = compiles
+            while len(_gabarits_compiles) > TAILLE_CACHE_GABARITS:
+                _gabarits_compiles.popitem(last=False)
+        return compiles
+
     def rendre(self, contexte):
         """Rendre le template avec le contexte"""
-        from django.template import Context, Template
-
-        sujet_template = Template(self.sujet)
-        corps_template = Template(self.corps_texte)
-
-        rendu_sujet = sujet_template.render(Context(contexte))
-        rendu_corps = corps_template.render(Context(contexte))
-
-        return rendu_sujet, rendu_corps
+        sujet, texte, _ = self.rendre_lot([contexte])[0]
+        return sujet, texte
+
+    def rendre_lot(self, contextes):
+        """
+        Rendre le modèle pour chaque contexte (envoi de masse) : les gabarits ne
+        sont compilés qu'une fois. Retourne [(sujet, texte, html ou ''), …].
+        """
+        from django.template import Context
+
+        sujet_t, texte_t, html_t = self.gabarits()
+        rendus = []
+        for contexte in contextes:
+            ctx = Context(contexte)
+            rendus.append((
+                sujet_t.render(ctx).strip(),
+                texte_t.render(ctx),
+                html_t.render(ctx) if html_t else '',
+            ))
+        return rendus
+
+
+# Gabarits compilés des ModeleEmail, partagés par les envois du processus
+TAILLE_CACHE_GABARITS = 128
+_gabarits_compiles = OrderedDict()
+_verrou_gabarits = Lock()
+
+
+def _oublier_gabarits(pk):
+    with _verrou_gabarits:
+        for cle in [c for c in _gabarits_compiles if c[0] == pk]:
+            del _gabarits_compiles[cle]
@@ -0,0 +1,22 @@
+"""
+Signaux de l'application notifs — compteur de non lues en cache, envoi des emails
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import compteurs
+from .models import Notification
+from .tasks import planifier_emails
+
+
+@receiver(post_save, sender=Notification)
+def notification_enregistree(sender, instance, created, **kwargs):
+    if created:
+        compteurs.notification_creee(instance)
+        if instance.envoyer_email:
+            planifier_emails([instance.pk])
+
+
+@receiver(post_delete, sender=Notification)
+def notification_supprimee(sender, instance, **kwargs):
+    compteurs.notification_supprimee(instance)
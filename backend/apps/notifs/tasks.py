@@ -0,0 +1,77 @@
+"""
+Tâches de fond de l'application notifs — envoi des emails de notification.
+
+Un lot partage une seule connexion SMTP ; les messages en échec sont
+réessayés seuls, avec un délai croissant. Exécutée sur place (mode eager,
+sans worker), une tâche ne réessaie pas : l'échec est journalisé.
+"""
+import logging
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def delai_nouvel_essai(tentative):
+    """Backoff exponentiel : 30 s, 1 min, 2 min… plafonné à 1 h"""
+    return min(30 * 2 ** tentative, 3600)
+
+
+def reessayer_plus_tard(tache, echecs):
+    """
+    Remet les `echecs` en file avec backoff. En mode eager, les nouveaux essais
+    s'enchaîneraient dans la requête HTTP : on journalise et on abandonne.
+    """
+    if tache.request.is_eager:
+        logger.error(f"{tache.name} : {len(echecs)} email(s) non envoyé(s), pas de nouvel essai en mode eager : {echecs}")
+        return
+    raise tache.retry(args=[echecs], countdown=delai_nouvel_essai(tache.request.retries))
+
+
+def planifier_emails(notification_ids):
+    """Met l'envoi en file après le commit (les lignes doivent être visibles du worker)"""
+    ids = list(notification_ids)
+    if ids:
+        transaction.on_commit(lambda: envoyer_emails_notifications.delay(ids))
+
+
+@shared_task(bind=True, max_retries=settings.EMAIL_MAX_RETRIES)
+def envoyer_emails_notifications(self, notification_ids):
+    """Envoie les emails en attente parmi `notification_ids` ; retourne le nombre envoyé"""
+    from .envoi import modeles_actifs, rendus_par_modele
+    from .models import Notification
+
+    notifications = list(
+        Notification.objects
+        .filter(pk__in=notification_ids, envoyer_email=True, email_envoye=False)
+        .exclude(destinataire__email='')
+        .select_related('destinataire')
+    )
+    if not notifications:
+        return 0
+
+    rendus = rendus_par_modele(notifications, modeles_actifs())
+    try:
+        with get_connection() as connexion:
+            echecs = [
+                n.pk for n in notifications if not n.envoyer_email_notification(connexion, rendus.get(n.pk))
+            ]
+    except (SMTPException, OSError) as e:
+        logger.warning(f"Connexion SMTP impossible : {e}")
+        echecs = [n.pk for n in notifications if not n.email_envoye]
+
+    if echecs:
+        reessayer_plus_tard(self, echecs)
+    return len(notifications) - len(echecs)
+
+
+@shared_task
+def envoyer_emails_en_attente():
+    """Envoi groupé de tous les emails de notification en attente (voir envoi.py)"""
+    from .envoi import envoyer_emails_en_attente as envoyer
+
+    return envoyer()
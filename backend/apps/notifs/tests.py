@@ -1,3 +1,309 @@
-from django.test import TestCase
+import asyncio
+import os
+import runpy
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.template import Template
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.accounts.models import Utilisateur
+from . import compteurs, envoi, flux, views
+from .models import ModeleEmail, Notification
+from .tasks import envoyer_emails_notifications
+
+
+class EnvoiEmailsTests(TestCase):
+    """Tâche d'envoi des emails de notification"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+        cls.notification = Notification.objects.create(
+            destinataire=cls.utilisateur, type_notification='SYSTEME',
+            titre='Maintenance', message='Service interrompu ce soir', envoyer_email=True,
+        )
+
+    def test_envoi(self):
+        resultat = envoyer_emails_notifications.apply(args=[[self.notification.pk]])
+        self.assertEqual(resultat.get(), 1)
+        self.notification.refresh_from_db()
+        self.assertTrue(self.notification.email_envoye)
+
+    def test_smtp_injoignable_sans_nouvel_essai_en_mode_eager(self):
+        with mock.patch('apps.notifs.tasks.get_connection', side_effect=OSError('Connexion refusée')), \
+                mock.patch.object(envoyer_emails_notifications, 'retry') as retry:
+            resultat = envoyer_emails_notifications.apply(args=[[self.notification.pk]])
+
+        self.assertTrue(resultat.successful())
+        self.assertEqual(resultat.get(), 0)
+        retry.assert_not_called()
+        self.notification.refresh_from_db()
+        self.assertFalse(self.notification.email_envoye)
+
+
+class ConfigurationCeleryTests(SimpleTestCase):
+    """Hors DEBUG, les tâches doivent partir vers un broker que le worker et beat lisent"""
+
+    def charger_settings(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(str(settings.BASE_DIR / 'config' / 'settings.py'))
+
+    def test_broker_en_memoire_refuse_hors_debug(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.charger_settings(DEBUG='False', CELERY_BROKER_URL='memory://')
+
+    def test_broker_partage(self):
+        valeurs = self.charger_settings(DEBUG='False', CELERY_BROKER_URL='redis://localhost:6379/1')
+        self.assertFalse(valeurs['CELERY_TASK_ALWAYS_EAGER'])
+
+    def test_execution_sur_place_en_developpement(self):
+        valeurs = self.charger_settings(DEBUG='True', CELERY_BROKER_URL='memory://')
+        self.assertTrue(valeurs['CELERY_TASK_ALWAYS_EAGER'])
+
+
+class CompteursNotificationsTests(TestCase):
+    """Badge de la navbar : compteurs tenus à jour par destinataire, aucune requête de notification à chaud"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            'admin@lonab.bf', 'secret', prenom='Awa', nom='Admin', type_utilisateur='ADMIN',
+        )
+        cls.clients = [
+            Utilisateur.objects.create_user(
+                f'client{i}@lonab.bf', 'secret', prenom='Client', nom=str(i), type_utilisateur='CLIENT',
+            )
+            for i in range(2)
+        ]
+        cls.caissier = Utilisateur.objects.create_user(
+            'caissier@lonab.bf', 'secret', prenom='Issa', nom='Caisse', type_utilisateur='CAISSIER',
+        )
+
+    def setUp(self):
+        cache.clear()
+        compteurs._generation_locale.update(valeur=None, verifiee_le=0.0)
+
+    def nombre(self, utilisateur):
+        return compteurs.etat_notifications(utilisateur)[0]
+
+    def notifier(self, utilisateur):
+        with self.captureOnCommitCallbacks(execute=True):
+            return views.creer_notification(utilisateur, 'Menu du jour', 'Riz sauce arachide')
+
+    def test_cache_chaud_sans_requete_de_notification(self):
+        compteurs.contexte_notifications(self.caissier)
+        with CaptureQueriesContext(connection) as requetes:
+            contexte = compteurs.contexte_notifications(self.caissier)
+        self.assertEqual(contexte['unread_notifications_count'], 0)
+        self.assertEqual(len(requetes), 1)  # une lecture groupée du cache
+        self.assertFalse([r for r in requetes.captured_queries if 'notifs_notification' in r['sql']])
+
+    def test_creation_lecture_suppression(self):
+        client = self.clients[0]
+        self.assertEqual(self.nombre(client), 0)
+        premiere, seconde = self.notifier(client), self.notifier(client)
+        self.assertEqual(self.nombre(client), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            premiere.marquer_comme_lu()
+        self.assertEqual(self.nombre(client), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            seconde.delete()
+        self.assertEqual(self.nombre(client), 0)
+        self.assertEqual(compteurs.etat_notifications(client)[1], [])
+
+    def test_envoi_groupe_ajuste_les_destinataires(self):
+        for utilisateur in (*self.clients, self.caissier):
+            self.nombre(utilisateur)
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notifs:envoyer'), {'cible': 'clients', 'titre': 'Info', 'message': 'Fermeture'})
+
+        self.assertEqual([self.nombre(c) for c in self.clients], [1, 1])
+        self.assertEqual(compteurs.etat_notifications(self.clients[0])[1][0]['titre'], 'Info')
+        self.assertEqual(compteurs._generation(), 1)
+        with self.assertNumQueries(1):  # le caissier n'est pas concerné : son cache reste chaud
+            self.assertEqual(self.nombre(self.caissier), 0)
+
+    def test_tout_marquer_lu_par_l_admin(self):
+        for client in self.clients:
+            self.notifier(client)
+        self.nombre(self.caissier)
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notifs:marquer_tout_lu'))
+
+        with self.assertNumQueries(3):  # une lecture du cache par utilisateur, rien à recalculer
+            self.assertEqual([self.nombre(c) for c in (*self.clients, self.caissier)], [0, 0, 0])
+        self.assertFalse(Notification.objects.filter(est_lu=False).exists())
+
+    def test_generation_lue_au_plus_une_fois_par_delai(self):
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                compteurs._generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            compteurs.invalider_tout()
+        with self.assertNumQueries(0):
+            self.assertEqual(compteurs._generation(), 2)
+
+
+class EnvoiGroupeTests(TestCase):
+    """Envoi de masse : une connexion SMTP et deux requêtes par lot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        destinataires = [
+            Utilisateur.objects.create_user(
+                f'client{i}@lonab.bf', 'secret', prenom='Client', nom=str(i), type_utilisateur='CLIENT',
+            )
+            for i in range(12)
+        ]
+        Notification.objects.bulk_create([
+            Notification(destinataire=d, type_notification='MENU', titre='Menu du jour',
+                         message='Riz sauce arachide', envoyer_email=True)
+            for d in destinataires
+        ])
+
+    def test_envoi_par_lots(self):
+        with mock.patch.object(envoi, 'get_connection', wraps=envoi.get_connection) as connexions, \
+                CaptureQueriesContext(connection) as requetes:
+            stats = envoi.envoyer_emails_en_attente(taille_lot=5)
+
+        self.assertEqual((stats['envoyes'], stats['echecs'], stats['lots']), (12, 0, 3))
+        self.assertEqual(connexions.call_count, 3)
+        self.assertEqual(len(mail.outbox), 12)
+        # Par lot : lecture + bulk_update ; puis la lecture vide qui termine
+        self.assertEqual(sum('notifs_notification' in r['sql'] for r in requetes.captured_queries), 7)
+        self.assertFalse(Notification.objects.filter(email_envoye=False).exists())
+
+    def test_lots_rendus_par_le_modele(self):
+        ModeleEmail.objects.create(
+            nom='Menu du jour', type_modele='NOTIFICATION_MENU',
+            sujet='{{ titre }} — LONAB', corps_texte='Bonjour {{ prenom }} {{ nom }}, {{ message }}',
+            corps_html='<p>{{ message }}</p>',
+        )
+        with mock.patch.object(ModeleEmail, 'rendre_lot', autospec=True, side_effect=ModeleEmail.rendre_lot) as rendre_lot, \
+                mock.patch('django.template.Template', wraps=Template) as compiler:
+            stats = envoi.envoyer_emails_en_attente(taille_lot=5)
+
+        self.assertEqual(stats['envoyes'], 12)
+        self.assertEqual(rendre_lot.call_count, 3)  # un appel par lot
+        self.assertEqual(compiler.call_count, 3)    # sujet, texte, HTML : compilés une fois pour tout l'envoi
+        premier = mail.outbox[0]
+        self.assertEqual(premier.subject, 'Menu du jour — LONAB')
+        self.assertEqual(premier.body, 'Bonjour Client 0, Riz sauce arachide')
+        self.assertEqual(premier.alternatives[0][0], '<p>Riz sauce arachide</p>')
+
+
+class FluxNotificationsTests(TestCase):
+    """Flux SSE : état initial, puis un événement par changement, rien en base entre deux"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+
+    def creer_notification(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            views.creer_notification(self.utilisateur, 'Menu du jour', 'Riz sauce arachide')
+
+    @mock.patch.object(views, 'DELAI_PING', 0.05)
+    def test_flux(self):
+        async def scenario():
+            requetes = sync_to_async(lambda: len(connection.queries))
+            flux = views._evenements(self.utilisateur)
+            morceaux = [await flux.__anext__()]
+
+            avant = await requetes()
+            morceaux.append(await flux.__anext__())
+            requetes_au_repos = await requetes() - avant
+
+            await sync_to_async(self.creer_notification)()
+            morceaux += [await flux.__anext__(), await flux.__anext__()]
+            await flux.aclose()
+            return morceaux, requetes_au_repos
+
+        with CaptureQueriesContext(connection):
+            (initial, ping, nouvelle, etat), requetes_au_repos = async_to_sync(scenario)()
+
+        self.assertIn('"count": 0', initial)
+        self.assertEqual(ping, ': ping\n\n')
+        self.assertEqual(requetes_au_repos, 0)
+        self.assertTrue(nouvelle.startswith('event: nouvelle'))
+        self.assertIn('Menu du jour', nouvelle)
+        self.assertIn('"count": 1', etat)
+
+    async def test_vue_sous_asgi(self):
+        url = reverse('notifs:flux_notifs')
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+        await sync_to_async(self.async_client.force_login)(self.utilisateur)
+        reponse = await self.async_client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Type'], 'text/event-stream')
+        self.assertEqual(reponse['Cache-Control'], 'no-cache')
+        morceaux = reponse.streaming_content.__aiter__()
+        premier = await morceaux.__anext__()
+        await morceaux.aclose()
+        self.assertIn(b'event: etat', premier)
+        self.assertIn(b'"count": 0', premier)
+
+    def test_vue_sous_wsgi(self):
+        self.client.force_login(self.utilisateur)
+        self.assertEqual(self.client.get(reverse('notifs:flux_notifs')).status_code, 204)
+
+
+class _PubSubRedis:
+    """pub/sub Redis simulé : les messages déposés dans `recus` sortent de listen()"""
+
+    def __init__(self):
+        self.recus, self.motifs = asyncio.Queue(), []
+
+    async def psubscribe(self, *motifs):
+        self.motifs += motifs
+
+    async def listen(self):
+        while True:
+            yield await self.recus.get()
+
+
+class BusRedisTests(SimpleTestCase):
+    """Une connexion d'écoute Redis par processus, redistribuée aux flux locaux"""
+
+    def test_une_connexion_pour_tous_les_flux(self):
+        pubsub = _PubSubRedis()
+        client = mock.Mock(pubsub=mock.Mock(return_value=pubsub), aclose=mock.AsyncMock())
+
+        async def scenario():
+            bus = flux.BusRedis()
+            async with bus.abonner(1) as a, bus.abonner(1) as b, bus.abonner(2) as c:
+                for canal, evenement in [(b'notifs:flux:1', b'{"type": "etat"}'),
+                                         (b'notifs:flux:tous', b'{"type": "rafraichir"}')]:
+                    pubsub.recus.put_nowait({'type': 'pmessage', 'channel': canal, 'data': evenement})
+                recus = [[(await asyncio.wait_for(f.get(), 1))['type'] for _ in range(n)]
+                         for f, n in ((a, 2), (b, 2), (c, 1))]
+            bus._relais.cancel()
+            await asyncio.gather(bus._relais, return_exceptions=True)
+            bus.publier(2, {'type': 'etat'})
+            return recus
+
+        with mock.patch('redis.asyncio.Redis.from_url', return_value=client) as connexions, \
+                mock.patch('redis.Redis.from_url') as client_publication:
+            recus = async_to_sync(scenario)()
+
+        self.assertEqual(recus, [['etat', 'rafraichir'], ['etat', 'rafraichir'], ['rafraichir']])
+        self.assertEqual(connexions.call_count, 1)
+        self.assertEqual(pubsub.motifs, ['notifs:flux:*'])
+        client.aclose.assert_awaited_once()
+        client_publication.return_value.publish.assert_called_once_with('notifs:flux:2', '{"type": "etat"}')
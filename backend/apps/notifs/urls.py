@@ -16,4 +16,5 @@ urlpatterns = [
 
     # API
     path('api/', views.api_notifs, name='api_notifs'),
+    path('flux/', views.flux_notifs, name='flux_notifs'),
 ]
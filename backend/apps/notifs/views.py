@@ -1,15 +1,27 @@
 """
 Vues pour l'application notifs — gestion des notifications
 """
+import asyncio
+import json
+import random
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
+from apps.accounts.recherche import filtre_personnes
+from apps.settings.facettes import compter_facettes
+from apps.settings.pagination import paginer_par_curseur
 from .models import Notification
+from . import compteurs, flux
 
 
 def _admin_required(request):
@@ -37,7 +49,7 @@ def admin_notifications(request):
 
     if search:
         qs = qs.filter(Q(titre__icontains=search) | Q(message__icontains=search) |
-                       Q(destinataire__prenom__icontains=search) | Q(destinataire__nom__icontains=search))
+                       filtre_personnes(search, 'destinataire__'))
     if type_n:
         qs = qs.filter(type_notification=type_n)
     if priorite:
@@ -48,24 +60,20 @@ def admin_notifications(request):
         qs = qs.filter(est_lu=True)
 
     # Stats
-    total_notifs = Notification.objects.count()
-    notifs_non_lues = Notification.objects.filter(est_lu=False).count()
-    notifs_aujourd_hui = Notification.objects.filter(cree_le__date=aujourd_hui).count()
-    notifs_semaine = Notification.objects.filter(cree_le__date__gte=aujourd_hui - timezone.timedelta(days=6)).count()
+    stats = compter_facettes(Notification.objects.all(), {
+        'total_notifs':       None,
+        'notifs_non_lues':    Q(est_lu=False),
+        'notifs_aujourd_hui': Q(cree_le__date=aujourd_hui),
+        'notifs_semaine':     Q(cree_le__date__gte=aujourd_hui - timezone.timedelta(days=6)),
+    })
 
-    paginator = Paginator(qs, 30)
-    page_obj = paginator.get_page(request.GET.get('page', 1))
+    page_obj = paginer_par_curseur(request, qs, 'cree_le', 30)
 
     return render(request, 'notifs/admin_notifications.html', {
         'notifs': page_obj,
         'page_obj': page_obj,
-        'total_notifs': total_notifs,
-        'notifs_non_lues': notifs_non_lues,
-        'notifs_aujourd_hui': notifs_aujourd_hui,
-        'notifs_semaine': notifs_semaine,
+        **stats,
         'filtres': {'search': search, 'type': type_n, 'priorite': priorite, 'lu': lu},
-        'notifications': _mes_notifs(request),
-        'unread_notifications_count': notifs_non_lues,
     })
 
 
@@ -90,11 +98,18 @@ def marquer_lu(request, pk):
 def marquer_tout_lu(request):
     """Marque toutes les notifications de l'utilisateur comme lues."""
     if request.user.est_admin:
-        # Admin marque tout le système
-        Notification.objects.filter(est_lu=False).update(est_lu=True, lu_le=timezone.now())
+        # Admin marque tout le système : compteurs remis à zéro pour les seuls destinataires concernés
+        concernes = list(
+            Notification.objects.filter(est_lu=False).order_by().values_list('destinataire_id', flat=True).distinct()
+        )
+        Notification.objects.filter(destinataire_id__in=concernes, est_lu=False).update(
+            est_lu=True, lu_le=timezone.now(),
+        )
+        compteurs.tout_lu(*concernes)
         messages.success(request, 'Toutes les notifications ont été marquées comme lues.')
     else:
         Notification.objects.filter(destinataire=request.user, est_lu=False).update(est_lu=True, lu_le=timezone.now())
+        compteurs.tout_lu(request.user.pk)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
     return redirect(request.META.get('HTTP_REFERER', 'notifs:admin_notifications'))
@@ -138,17 +153,24 @@ def envoyer(request):
     else:
         users = Utilisateur.objects.filter(est_actif=True)
 
+    envoyer_email = request.POST.get('envoyer_email') == 'on'
     notifs = [
         Notification(
-            destinataire=u,
+            destinataire_id=uid,
             type_notification=type_notification,
             priorite='MOYENNE',
             titre=titre,
             message=msg,
+            envoyer_email=envoyer_email,
         )
-        for u in users
+        for uid in users.values_list('pk', flat=True)
     ]
     Notification.objects.bulk_create(notifs, batch_size=200)
+    # bulk_create n'émet pas post_save : compteurs des destinataires ajustés ici
+    compteurs.notifications_creees([n.destinataire_id for n in notifs])
+    if envoyer_email:
+        from .tasks import envoyer_emails_en_attente
+        transaction.on_commit(envoyer_emails_en_attente.delay)
 
     messages.success(request, f'{len(notifs)} notification(s) envoyée(s).')
     return redirect(request.META.get('HTTP_REFERER', 'notifs:admin_notifications'))
@@ -160,7 +182,7 @@ def envoyer(request):
 @login_required
 def mes_notifications(request):
     qs = Notification.objects.filter(destinataire=request.user).order_by('-cree_le')
-    non_lues = qs.filter(est_lu=False).count()
+    non_lues, _ = compteurs.etat_notifications(request.user)
 
     paginator = Paginator(qs, 20)
     page_obj = paginator.get_page(request.GET.get('page', 1))
@@ -169,34 +191,89 @@ def mes_notifications(request):
         'notifs': page_obj,
         'page_obj': page_obj,
         'non_lues': non_lues,
-        'notifications': qs[:5],
-        'unread_notifications_count': non_lues,
     })
 
 
 # ════════════════════════════════════════════════════════════════
 # API JSON — pour le dropdown de la navbar
 # ════════════════════════════════════════════════════════════════
-@login_required
-def api_notifs(request):
-    """Retourne les 5 dernières notifs non lues en JSON."""
-    notifs = Notification.objects.filter(
-        destinataire=request.user, est_lu=False
-    ).order_by('-cree_le')[:5]
-    return JsonResponse({
-        'count': Notification.objects.filter(destinataire=request.user, est_lu=False).count(),
+def _etat_json(utilisateur):
+    nombre, dernieres = compteurs.etat_notifications(utilisateur)
+    return {
+        'count': nombre,
         'notifs': [
             {
-                'id': n.id,
-                'titre': n.titre,
-                'message': n.message[:80],
-                'type': n.type_notification,
-                'priorite': n.priorite,
-                'cree_le': n.cree_le.isoformat(),
+                'id': n['id'],
+                'titre': n['titre'],
+                'message': n['message'],
+                'type': n['type_notification'],
+                'priorite': n['priorite'],
+                'cree_le': n['cree_le'].isoformat(),
             }
-            for n in notifs
+            for n in dernieres
         ],
-    })
+    }
+
+
+@login_required
+def api_notifs(request):
+    """Retourne les 5 dernières notifs non lues en JSON (compteurs en cache)."""
+    return JsonResponse(_etat_json(request.user))
+
+
+# ════════════════════════════════════════════════════════════════
+# Flux SSE — remplace l'interrogation périodique de api_notifs
+# ════════════════════════════════════════════════════════════════
+DELAI_PING = getattr(settings, 'NOTIFICATIONS_STREAM_KEEPALIVE', 25)
+ETALEMENT_RAFRAICHIR = 5
+
+
+def _sse(evenement, donnees):
+    return f"event: {evenement}\ndata: {json.dumps(donnees, default=str)}\n\n"
+
+
+async def _evenements(utilisateur):
+    """
+    État initial, puis un état à jour après chaque changement. Entre deux
+    changements la connexion n'envoie qu'un commentaire de maintien.
+    """
+    etat = sync_to_async(_etat_json)
+    async with flux.bus().abonner(utilisateur.pk) as file:
+        yield 'retry: 5000\n' + _sse('etat', await etat(utilisateur))
+        while True:
+            try:
+                recus = [await asyncio.wait_for(file.get(), DELAI_PING)]
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            while not file.empty():
+                recus.append(file.get_nowait())
+
+            for e in recus:
+                if e['type'] == 'nouvelle':
+                    yield _sse('nouvelle', e['notification'])
+            if any(e['type'] == 'rafraichir' for e in recus):
+                # Envoi de masse : on étale le rechargement des compteurs de tous les abonnés
+                await asyncio.sleep(random.uniform(0, ETALEMENT_RAFRAICHIR))
+            yield _sse('etat', await etat(utilisateur))
+
+
+async def flux_notifs(request):
+    """
+    Flux text/event-stream de l'utilisateur connecté (serveur ASGI requis).
+    Sous WSGI, répond 204 : le navigateur revient alors à l'interrogation de api_notifs.
+    """
+    # request.auser() n'existe qu'à partir de Django 5.0 (requirements.txt : 4.2)
+    utilisateur = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if utilisateur is None:
+        return JsonResponse({'error': 'Authentification requise'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(_evenements(utilisateur), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ════════════════════════════════════════════════════════════════
@@ -216,16 +293,9 @@ def creer_notification(destinataire, titre, message, type_notification='SYSTEME'
             texte_lien=texte_lien,
             envoyer_email=envoyer_email,
         )
-        if envoyer_email:
-            n.envoyer_email_notification()
+        # L'email éventuel part en tâche de fond (signal post_save)
         return n
     except Exception as e:
         print(f'[notifs] Erreur création notif : {e}')
         return None
 
-
-def _mes_notifs(request):
-    try:
-        return Notification.objects.filter(destinataire=request.user, est_lu=False).order_by('-cree_le')[:5]
-    except Exception:
-        return []
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Scanner hors ligne : le restaurant continue de servir quand la connexion lâche.
+
+1. Instantané — l'appareil télécharge, pour le jour, les clients des agences
+   planifiées au restaurant qui ont des tickets disponibles (porte-monnaie),
+   les plats du jour et les réservations. Format compact (listes, pas
+   d'objets) ; un jeton signé identifie le restaurant et le jour.
+2. Hors ligne, l'appareil valide un jeton QR v2 localement (client présent,
+   solde restant, expiration, nonce pas encore vu) et met le scan en file :
+   {id, code, scanne_le, menu_id}. La signature HMAC du jeton ne peut pas
+   être vérifiée sur l'appareil (clé serveur) : elle l'est à la synchronisation.
+3. Synchronisation — reconcilier() applique les scans par lots, chacun dans
+   sa propre transaction :
+     APPLIQUE       ticket consommé à l'heure du scan
+     DEJA_APPLIQUE  même id déjà reçu (envoi rejoué) : rien n'est refait
+     CONFLIT        code ou ticket consommé ailleurs entre-temps
+     REJETE         jeton falsifié, expiré à l'heure du scan, code inconnu,
+                    révoqué ou remplacé, plat manquant ou inconnu…
+
+    reconcilier(restaurant, gestionnaire, jour, scans)
+    → {'resultats': [...], 'stats': {'appliques': 4980, 'deja_appliques': 0, 'conflits': 20,
+                                     'rejetes': 0, 'duree_s': 9.8, 'scans_par_seconde': 510.2}}
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.tickets import jetons_qr
+from apps.tickets.models import CodeQR, PorteMonnaieTicket, Ticket
+from apps.transactions.models import LogConsommation
+from .models import Menu, PlanningRestaurant, Reservation
+from .scanner import decrementer_stock, extraire_code
+
+logger = logging.getLogger(__name__)
+
+SEL = 'apps.restaurants.hors_ligne'
+DUREE_INSTANTANE = 36 * 3600
+MAX_SCANS = getattr(settings, 'OFFLINE_SYNC_MAX_SCANS', 500)  # par envoi
+TAILLE_LOT = 500
+TOLERANCE_HORLOGE = timedelta(minutes=5)
+COLONNES_CLIENTS = ['id', 'disponibles', 'nom', 'matricule', 'agence']
+
+APPLIQUE, DEJA_APPLIQUE, CONFLIT, REJETE = 'APPLIQUE', 'DEJA_APPLIQUE', 'CONFLIT', 'REJETE'
+
+
+# ════════════════════════════════════════════════════════════════
+# Instantané
+# ════════════════════════════════════════════════════════════════
+def instantane(restaurant, jour=None):
+    """Données du scanner hors ligne pour `jour` (aujourd'hui par défaut), avec leur jeton signé"""
+    jour = jour or timezone.now().date()
+    agences = PlanningRestaurant.objects.filter(
+        restaurant=restaurant, est_actif=True, date_debut__lte=jour, date_fin__gte=jour,
+    ).values('agence_id')
+
+    soldes = (
+        PorteMonnaieTicket.objects
+        .filter(valide_de__lte=jour, valide_jusqua__gte=jour, disponibles__gt=0,
+                utilisateur__agence_id__in=agences, utilisateur__type_utilisateur='CLIENT',
+                utilisateur__est_actif=True)
+        .order_by('utilisateur_id')
+        .values('utilisateur_id', 'utilisateur__prenom', 'utilisateur__nom',
+                'utilisateur__matricule', 'utilisateur__agence__nom')
+        .annotate(disponibles_jour=Sum('disponibles'))
+    )
+    clients = [
+        [s['utilisateur_id'], s['disponibles_jour'],
+         f"{s['utilisateur__prenom']} {s['utilisateur__nom']}",
+         s['utilisateur__matricule'] or '', s['utilisateur__agence__nom'] or '']
+        for s in soldes
+    ]
+    plats = list(
+        Menu.objects.filter(restaurant=restaurant, date=jour, est_disponible=True)
+        .order_by('id').values('id', 'nom', 'quantite_disponible')
+    )
+    reservations = dict(
+        Reservation.objects.filter(
+            restaurant=restaurant, date_reservation=jour, statut__in=['EN_ATTENTE', 'CONFIRME'],
+        ).order_by('id').values_list('client_id', 'menu_id')
+    )
+
+    contenu = {
+        'jour': jour.isoformat(), 'colonnes': COLONNES_CLIENTS, 'clients': clients,
+        'plats_du_jour': plats, 'reservations': reservations,
+    }
+    version = hashlib.sha1(json.dumps(contenu, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return {
+        'instantane': signing.dumps({'r': restaurant.pk, 'j': jour.isoformat(), 'v': version}, salt=SEL),
+        'version': version,
+        'genere_le': timezone.now().isoformat(),
+        **contenu,
+    }
+
+
+def lire_instantane(jeton, restaurant):
+    """Jour de l'instantané signé ; ValidationError s'il est falsifié, périmé ou d'un autre restaurant"""
+    try:
+        donnees = signing.loads(jeton or '', salt=SEL, max_age=DUREE_INSTANTANE)
+    except signing.BadSignature:
+        raise ValidationError('Instantané invalide ou périmé — rechargez-le')
+    if donnees.get('r') != restaurant.pk:
+        raise ValidationError('Instantané invalide ou périmé — rechargez-le')
+    return date.fromisoformat(donnees['j'])
+
+
+# ════════════════════════════════════════════════════════════════
+# Réconciliation
+# ════════════════════════════════════════════════════════════════
+class _Conflit(Exception):
+    pass
+
+
+def _horodatage(valeur, jour, maintenant):
+    """Heure du scan, si elle tombe le jour de l'instantané et pas dans le futur"""
+    scanne_le = parse_datetime(str(valeur or ''))
+    if scanne_le is None:
+        return None
+    if timezone.is_naive(scanne_le):
+        scanne_le = timezone.make_aware(scanne_le)
+    if scanne_le.date() != jour or scanne_le > maintenant + TOLERANCE_HORLOGE:
+        return None
+    return min(scanne_le, maintenant)
+
+
+def _resultat(reference, statut, message='', ticket_numero=''):
+    return {'id': reference, 'statut': statut, 'message': message, 'ticket_numero': ticket_numero}
+
+
+def reconcilier(restaurant, gestionnaire, jour, scans, taille_lot=TAILLE_LOT):
+    """
+    Applique les scans hors ligne (idempotent sur leur id) ; retourne un
+    résultat par scan, dans l'ordre reçu, et les compteurs.
+    """
+    stats = {APPLIQUE: 0, DEJA_APPLIQUE: 0, CONFLIT: 0, REJETE: 0}
+    resultats, vus = [], {}
+    debut = time.monotonic()
+
+    for i in range(0, len(scans), taille_lot):
+        lot = [s if isinstance(s, dict) else {} for s in scans[i:i + taille_lot]]
+        for s in lot:
+            s['_reference'] = str(s.get('id') or '').strip()[:64]
+            s['_code'] = extraire_code(str(s.get('code') or ''))
+
+        # Lectures groupées du lot : scans déjà reçus, codes, réservations, plats
+        deja = dict(
+            LogConsommation.objects
+            .filter(reference_hors_ligne__in=[s['_reference'] for s in lot if s['_reference']])
+            .values_list('reference_hors_ligne', 'ticket__numero_ticket')
+        )
+        codes = {
+            qr.code: qr for qr in CodeQR.objects.filter(code__in={s['_code'] for s in lot if s['_code']})
+            .select_related('utilisateur')
+            .only('id', 'code', 'utilisateur_id', 'expire_le', 'est_valide', 'est_utilise', 'utilisateur__agence_id')
+        }
+        reservations = {
+            r.client_id: r for r in Reservation.objects.filter(
+                restaurant=restaurant, date_reservation=jour, statut__in=['EN_ATTENTE', 'CONFIRME'],
+                client_id__in={qr.utilisateur_id for qr in codes.values()},
+            ).only('id', 'client_id', 'menu_id')
+        }
+        # Des plats étaient proposés ce jour-là : l'appareil a dû en faire choisir un
+        plats_du_jour = Menu.objects.filter(restaurant=restaurant, date=jour, est_disponible=True).exists()
+        plats = Menu.objects.filter(restaurant=restaurant).only('id', 'quantite_disponible').in_bulk(
+            {int(s['menu_id']) for s in lot if str(s.get('menu_id') or '').isdigit()}
+        )
+
+        # Une transaction par lot, un point de sauvegarde par scan : un scan refusé
+        # n'annule que lui, et la base ne valide qu'une fois par lot
+        with transaction.atomic():
+            for scan in lot:
+                precedent = vus.get(scan['_reference']) if scan['_reference'] else None
+                if precedent:
+                    # Même id deux fois dans l'envoi : même réponse, rien n'est refait
+                    statut = DEJA_APPLIQUE if precedent['statut'] == APPLIQUE else precedent['statut']
+                    resultat = {**precedent, 'statut': statut}
+                else:
+                    resultat = _appliquer(scan, restaurant, gestionnaire, jour, deja, codes, reservations, plats,
+                                          plats_du_jour)
+                    vus[scan['_reference']] = resultat
+                stats[resultat['statut']] += 1
+                resultats.append(resultat)
+
+    duree = round(time.monotonic() - debut, 3)
+    stats = {
+        'appliques': stats[APPLIQUE], 'deja_appliques': stats[DEJA_APPLIQUE],
+        'conflits': stats[CONFLIT], 'rejetes': stats[REJETE],
+        'duree_s': duree,
+        'scans_par_seconde': round(len(scans) / duree, 1) if duree else 0.0,
+    }
+    logger.info(f"Synchronisation hors ligne ({restaurant}) : {stats}")
+    return {'resultats': resultats, 'stats': stats}
+
+
+def _appliquer(scan, restaurant, gestionnaire, jour, deja, codes, reservations, plats, plats_du_jour):
+    reference, code = scan['_reference'], scan['_code']
+    if not reference:
+        return _resultat(reference, REJETE, 'Identifiant de scan manquant')
+    if reference in deja:
+        return _resultat(reference, DEJA_APPLIQUE, ticket_numero=deja[reference])
+
+    scanne_le = _horodatage(scan.get('scanne_le'), jour, timezone.now())
+    if scanne_le is None:
+        return _resultat(reference, REJETE, 'Horodatage du scan invalide')
+    if jetons_qr.est_jeton(code):
+        try:
+            jetons_qr.lire(code, maintenant=scanne_le)
+        except ValidationError as e:
+            return _resultat(reference, CONFLIT if e.code == 'deja_utilise' else REJETE, e.messages[0])
+    qr = codes.get(code)
+    if qr is None:
+        return _resultat(reference, REJETE, 'Code QR introuvable')
+    if scanne_le > qr.expire_le:
+        return _resultat(reference, REJETE, 'Code QR expiré')
+    if qr.est_utilise:
+        return _resultat(reference, CONFLIT, 'Code QR déjà utilisé')
+    if not qr.est_valide:
+        # Code révoqué par le client ou remplacé par un plus récent
+        return _resultat(reference, REJETE, 'Code QR invalide')
+
+    # Plat : mêmes exigences qu'au scanner en ligne
+    reservation = reservations.get(qr.utilisateur_id)
+    menu_id = scan.get('menu_id')
+    plat = None
+    if menu_id not in (None, ''):
+        plat = plats.get(int(menu_id)) if str(menu_id).isdigit() else None
+        if plat is None:
+            return _resultat(reference, REJETE, 'Plat inconnu dans ce restaurant')
+    elif not reservation and plats_du_jour:
+        return _resultat(reference, REJETE, 'Veuillez choisir un plat avant de valider')
+    try:
+        with transaction.atomic():
+            if not qr.marquer_comme_utilise(restaurant):
+                raise _Conflit('Code QR déjà utilisé')
+            ticket = Ticket.reclamer_disponible(
+                qr.utilisateur_id, restaurant, gestionnaire, qr.utilisateur.agence_id, consomme_le=scanne_le,
+            )
+            if not ticket:
+                raise _Conflit('Aucun ticket disponible (consommé ailleurs)')
+            if reservation:
+                Reservation.objects.filter(pk=reservation.pk).update(
+                    statut='TERMINE', date_modification=timezone.now(),
+                )
+                plat_id = plat.pk if plat else reservation.menu_id
+            else:
+                plat_id = plat.pk if plat else None
+                if plat:
+                    # Trace de réservation pour l'historique client, comme au scanner en ligne
+                    Reservation.objects.create(
+                        client_id=qr.utilisateur_id, restaurant=restaurant, menu_id=plat.pk,
+                        date_reservation=jour, statut='TERMINE',
+                    )
+            if plat and plat.quantite_disponible is not None:
+                decrementer_stock(plat.pk, timezone.now())
+            LogConsommation.objects.create(
+                ticket_id=ticket.pk,
+                restaurant=restaurant,
+                client_id=qr.utilisateur_id,
+                valide_par=gestionnaire,
+                qr_code_id=qr.pk,
+                date_consommation=scanne_le,
+                menu_consomme_id=plat_id,
+                agence_id=qr.utilisateur.agence_id,
+                notes='Scan hors ligne',
+                reference_hors_ligne=reference,
+            )
+    except _Conflit as e:
+        return _resultat(reference, CONFLIT, str(e))
+    except IntegrityError:
+        # Même id reçu en parallèle par un autre envoi
+        return _resultat(reference, DEJA_APPLIQUE)
+    if reservation:
+        reservations.pop(qr.utilisateur_id, None)
+    return _resultat(reference, APPLIQUE, ticket_numero=ticket.numero_ticket)
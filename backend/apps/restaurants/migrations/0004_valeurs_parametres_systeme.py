@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:33
+
+import apps.settings.parametres
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0003_alter_menu_unique_together'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='menu',
+            name='prix',
+            field=models.DecimalField(decimal_places=2, default=apps.settings.parametres.prix_repas_courant, max_digits=10, verbose_name='Prix'),
+        ),
+    ]
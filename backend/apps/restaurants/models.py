@@ -6,6 +6,8 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from apps.settings.parametres import prix_repas_courant
+
 
 class Restaurant(models.Model):
     """Modèle pour les restaurants partenaires"""
@@ -146,7 +148,7 @@ class Menu(models.Model):
     quantite_disponible = models.IntegerField('Quantité disponible', default=0, blank=True, null=True)
     quantite_consomme = models.IntegerField('Quantité consommée', default=0)
 
-    prix = models.DecimalField('Prix', max_digits=10, decimal_places=2, default=settings.TICKET_FULL_PRICE)
+    prix = models.DecimalField('Prix', max_digits=10, decimal_places=2, default=prix_repas_courant)
 
     image = models.ImageField('Image du plat', upload_to='menus/', blank=True, null=True)
 
@@ -0,0 +1,198 @@
+"""
+Service de consommation des tickets au scanner du restaurant.
+
+Un jeton QR signé (v2) est d'abord vérifié en mémoire, voir jetons_qr.py.
+Un scan = une seule transaction :
+  - verrou sur le code QR (deux scanners ne peuvent pas valider le même code)
+  - réclamation du code et d'un ticket DISPONIBLE par UPDATE conditionnel
+    (SKIP LOCKED sur les tickets quand la base le permet)
+  - lecture groupée réservation + plats du jour
+  - écritures en UPDATE directs (pas de get/save successifs)
+"""
+import json
+import logging
+import time
+from collections import deque
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Q, F, Case, When, Value
+from django.utils import timezone
+
+from apps.accounts.models import Utilisateur
+from apps.tickets import jetons_qr
+from apps.tickets.models import CodeQR, Ticket
+from apps.transactions.models import LogConsommation
+from .models import Menu, Reservation
+
+logger = logging.getLogger(__name__)
+
+# Objectifs de latence d'un scan complet (millisecondes)
+LATENCE_CIBLE_P50_MS = getattr(settings, 'SCAN_LATENCY_TARGET_P50_MS', 50)
+LATENCE_CIBLE_P99_MS = getattr(settings, 'SCAN_LATENCY_TARGET_P99_MS', 250)
+
+_latences = deque(maxlen=2000)
+_verrou_latences = Lock()
+
+
+def extraire_code(brut):
+    """Accepte le JSON encodé dans l'image QR ou le code saisi manuellement."""
+    brut = (brut or '').strip()
+    if brut.startswith('{'):
+        try:
+            return str(json.loads(brut).get('code', '')).strip()
+        except (ValueError, AttributeError):
+            pass
+    return brut
+
+
+def latences_scanner():
+    """p50/p99 observés sur les derniers scans de ce processus, avec les objectifs."""
+    with _verrou_latences:
+        echantillons = sorted(_latences)
+    resultat = {
+        'echantillons': len(echantillons),
+        'p50_ms': None,
+        'p99_ms': None,
+        'cible_p50_ms': LATENCE_CIBLE_P50_MS,
+        'cible_p99_ms': LATENCE_CIBLE_P99_MS,
+    }
+    if echantillons:
+        resultat['p50_ms'] = round(echantillons[int(0.50 * (len(echantillons) - 1))], 1)
+        resultat['p99_ms'] = round(echantillons[int(0.99 * (len(echantillons) - 1))], 1)
+    return resultat
+
+
+def _enregistrer_latence(debut, code):
+    duree_ms = (time.perf_counter() - debut) * 1000
+    with _verrou_latences:
+        _latences.append(duree_ms)
+    if duree_ms > LATENCE_CIBLE_P99_MS:
+        logger.warning(f"Scan lent ({duree_ms:.0f} ms > {LATENCE_CIBLE_P99_MS} ms) pour le code {code[:10]}...")
+
+
+def _verrouiller_code_qr(code):
+    """
+    SELECT ... FOR UPDATE sur le code QR seul (pas sur l'utilisateur joint).
+    Sans FOR UPDATE OF, la jointure verrouillerait aussi l'utilisateur : le
+    client et son agence sont alors lus à part, en une requête.
+    """
+    qs = CodeQR.objects.filter(code=code)
+    if connection.features.has_select_for_update_of:
+        return qs.select_related('utilisateur', 'utilisateur__agence').select_for_update(of=('self',)).get()
+    qr = qs.select_for_update().get()
+    qr.utilisateur = Utilisateur.objects.select_related('agence').get(pk=qr.utilisateur_id)
+    return qr
+
+
+def decrementer_stock(menu_id, maintenant):
+    """
+    Décrément du stock d'un plat en un UPDATE.
+    est_disponible est évalué avant quantite_disponible : MySQL applique
+    les affectations de gauche à droite avec les valeurs déjà modifiées.
+    """
+    Menu.objects.filter(pk=menu_id, quantite_disponible__isnull=False).update(
+        est_disponible=Case(
+            When(quantite_disponible__lte=1, then=Value(False)),
+            default=F('est_disponible'),
+        ),
+        quantite_disponible=Case(
+            When(quantite_disponible__gt=0, then=F('quantite_disponible') - 1),
+            default=Value(0),
+        ),
+        date_modification=maintenant,
+    )
+
+
+def consommer_qr_code(code, restaurant, gestionnaire, menu_id=None):
+    """
+    Valide un code QR et consomme un ticket en une transaction.
+    Lève CodeQR.DoesNotExist si le code est inconnu, ValidationError si le scan est refusé.
+    """
+    debut = time.perf_counter()
+    try:
+        # Jeton signé falsifié, expiré ou rejoué : refusé avant toute requête
+        jetons_qr.verifier(code)
+        with transaction.atomic():
+            return _consommer(code, restaurant, gestionnaire, menu_id)
+    finally:
+        _enregistrer_latence(debut, code)
+
+
+def _consommer(code, restaurant, gestionnaire, menu_id):
+    maintenant = timezone.now()
+    aujourd_hui = maintenant.date()
+
+    # ── Code QR (verrouillé jusqu'au commit) ─────────────────────────
+    qr = _verrouiller_code_qr(code)
+    if not qr.est_valide:
+        raise ValidationError('Code QR invalide')
+    if qr.est_utilise:
+        raise ValidationError('Code QR déjà utilisé')
+    if maintenant > qr.expire_le:
+        raise ValidationError('Code QR expiré')
+    client = qr.utilisateur
+
+    # Réclamations conditionnelles : un seul scan gagne le code et le ticket
+    if not qr.marquer_comme_utilise(restaurant):
+        raise ValidationError('Code QR déjà utilisé')
+    ticket = Ticket.reclamer_disponible(qr.utilisateur_id, restaurant, gestionnaire, client.agence_id)
+    if not ticket:
+        raise ValidationError('Aucun ticket valide disponible')
+
+    # ── Réservation + plats du jour : deux lectures au total ─────────
+    reservation = Reservation.objects.filter(
+        client_id=qr.utilisateur_id, restaurant=restaurant,
+        date_reservation=aujourd_hui,
+        statut__in=['EN_ATTENTE', 'CONFIRME'],
+    ).select_related('menu').first()
+
+    menu_id = int(menu_id) if str(menu_id or '').isdigit() else None
+    filtre_plats = Q(date=aujourd_hui, est_disponible=True)
+    if menu_id:
+        filtre_plats |= Q(pk=menu_id)
+    plats = {
+        m.pk: m for m in Menu.objects.filter(Q(restaurant=restaurant) & filtre_plats)
+        .only('id', 'nom', 'date', 'est_disponible', 'quantite_disponible')
+    }
+
+    plat_consomme = plats.get(menu_id) if menu_id else None
+
+    if reservation:
+        # Plat choisi manuellement prioritaire, sinon le plat réservé
+        plat_consomme = plat_consomme or reservation.menu
+        Reservation.objects.filter(pk=reservation.pk).update(statut='TERMINE', date_modification=maintenant)
+    else:
+        plats_du_jour = any(p.date == aujourd_hui and p.est_disponible for p in plats.values())
+        if plats_du_jour and not plat_consomme:
+            raise ValidationError('Veuillez choisir un plat avant de valider')
+        if plat_consomme:
+            # Trace de réservation pour l'historique client
+            Reservation.objects.create(
+                client_id=qr.utilisateur_id, restaurant=restaurant, menu=plat_consomme,
+                date_reservation=aujourd_hui, statut='TERMINE',
+            )
+
+    if plat_consomme and plat_consomme.quantite_disponible is not None:
+        decrementer_stock(plat_consomme.pk, maintenant)
+
+    LogConsommation.objects.create(
+        ticket_id=ticket.pk,
+        restaurant=restaurant,
+        client_id=qr.utilisateur_id,
+        valide_par=gestionnaire,
+        qr_code_id=qr.pk,
+        date_consommation=maintenant,
+        menu_consomme=plat_consomme,
+        agence_id=client.agence_id,
+    )
+
+    return {
+        'client': client.get_full_name(),
+        'matricule': client.matricule or '',
+        'agence': client.agence.nom if client.agence else '',
+        'ticket_numero': ticket.numero_ticket,
+        'plat': plat_consomme.nom if plat_consomme else '—',
+    }
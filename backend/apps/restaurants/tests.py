@@ -1,3 +1,289 @@
-from django.test import TestCase
+import json
+import threading
+import unittest
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.models import Agence, Direction, Utilisateur
+from apps.tickets.models import CodeQR, PorteMonnaieTicket, Ticket
+from apps.transactions.models import LogConsommation, TransactionTicket
+from . import hors_ligne
+from .scanner import _verrouiller_code_qr, consommer_qr_code
+from .models import Menu, PlanningRestaurant, Restaurant
+
+
+class DonneesRestaurant:
+    """Restaurant planifié pour une agence, son gestionnaire et un client avec des tickets"""
+
+    @classmethod
+    def creer_donnees(cls, nombre_tickets=5):
+        aujourd_hui = timezone.now().date()
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        cls.agence = Agence.objects.create(
+            nom='Agence Centre', code='AC', adresse='Avenue Kwame Nkrumah',
+            ville='Ouagadougou', telephone='+22625000000', direction=direction,
+        )
+        cls.restaurant = Restaurant.objects.create(
+            nom='Restaurant Central', code='RC', adresse='Zone du bois',
+            ville='Ouagadougou', telephone='+22625000001',
+        )
+        PlanningRestaurant.objects.create(
+            restaurant=cls.restaurant, agence=cls.agence, type_planning='MENSUEL',
+            date_debut=aujourd_hui - timedelta(days=1), date_fin=aujourd_hui + timedelta(days=1),
+        )
+        cls.gestionnaire = Utilisateur.objects.create_user(
+            'gestionnaire@lonab.bf', 'secret', prenom='Issa', nom='Gestion',
+            type_utilisateur='GESTIONNAIRE_RESTAURANT', restaurant_gere=cls.restaurant,
+        )
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client',
+            type_utilisateur='CLIENT', agence=cls.agence,
+        )
+        TransactionTicket.objects.create(
+            client=cls.client_lonab, agence=cls.agence, nombre_tickets=nombre_tickets,
+            valide_de=aujourd_hui - timedelta(days=1), valide_jusqu_a=aujourd_hui + timedelta(days=30),
+        ).completer()
+
+    @classmethod
+    def creer_plat(cls, nom='Riz sauce arachide'):
+        return Menu.objects.create(
+            restaurant=cls.restaurant, jour_semaine='LUNDI', date=timezone.now().date(),
+            nom=nom, plats=nom, quantite_disponible=None,
+        )
+
+
+# ════════════════════════════════════════════════════════════════
+# Scanner en ligne
+# ════════════════════════════════════════════════════════════════
+class ScannerTests(DonneesRestaurant, TestCase):
+    """Scan au restaurant : requêtes du verrou, ticket affiché = ticket consommé"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creer_donnees()
+
+    def test_verrou_charge_client_et_agence(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        with transaction.atomic():
+            with self.assertNumQueries(1 if connection.features.has_select_for_update_of else 2):
+                verrouille = _verrouiller_code_qr(qr.code)
+            with self.assertNumQueries(0):
+                self.assertEqual(verrouille.utilisateur.agence.nom, 'Agence Centre')
+
+    def test_ticket_affiche_est_le_ticket_consomme(self):
+        # Vente plus récente mais valable plus longtemps : ses tickets passent après
+        aujourd_hui = timezone.now().date()
+        TransactionTicket.objects.create(
+            numero_transaction='VENTE-2', client=self.client_lonab, agence=self.agence, nombre_tickets=2,
+            valide_de=aujourd_hui, valide_jusqu_a=aujourd_hui + timedelta(days=60),
+        ).completer()
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.client.force_login(self.gestionnaire)
+
+        apercu = self.client.get(reverse('restaurants:verifier_qr_code'), {'code': qr.code}).json()
+        scan = self.client.post(reverse('restaurants:valider_qr_code'), {'code': qr.code}).json()
+        self.assertTrue(scan['valide'])
+        self.assertEqual(apercu['ticket_numero'], scan['ticket_numero'])
+
+    def test_latences_exposees_a_l_administrateur(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.client.force_login(self.gestionnaire)
+        self.client.post(reverse('restaurants:valider_qr_code'), {'code': qr.code})
+        self.assertEqual(self.client.get(reverse('restaurants:scanner_latences')).status_code, 403)
+
+        admin = Utilisateur.objects.create_user(
+            'admin@lonab.bf', 'secret', prenom='Awa', nom='Admin', type_utilisateur='ADMIN',
+        )
+        self.client.force_login(admin)
+        latences = self.client.get(reverse('restaurants:scanner_latences')).json()
+        self.assertGreaterEqual(latences['echantillons'], 1)
+        self.assertIsNotNone(latences['p99_ms'])
+        self.assertEqual(latences['cible_p99_ms'], 250)
+
+
+class DoubleConsommationTests(DonneesRestaurant, TestCase):
+    """Un code QR, un ticket : les réclamations conditionnelles ne servent qu'une fois"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creer_donnees()
+
+    def test_code_scanne_deux_fois(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        consommer_qr_code(qr.code, self.restaurant, self.gestionnaire)
+        with self.assertRaises(ValidationError):
+            consommer_qr_code(qr.code, self.restaurant, self.gestionnaire)
+
+        self.assertEqual(Ticket.objects.filter(proprietaire=self.client_lonab, statut='CONSOMME').count(), 1)
+        self.assertEqual(PorteMonnaieTicket.solde(self.client_lonab.pk, timezone.now().date()).disponibles, 4)
+
+    def test_instances_perimees(self):
+        # Deux scans ont lu le même code et le même ticket avant d'écrire
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        qr_bis = CodeQR.objects.get(pk=qr.pk)
+        ticket = Ticket.objects.filter(proprietaire=self.client_lonab).first()
+
+        self.assertTrue(qr.marquer_comme_utilise(self.restaurant))
+        self.assertFalse(qr_bis.marquer_comme_utilise(self.restaurant))
+        self.assertTrue(Ticket._consommer_si_disponible(ticket, self.restaurant, self.gestionnaire))
+        self.assertFalse(Ticket._consommer_si_disponible(ticket, self.restaurant, self.gestionnaire))
+        self.assertEqual(PorteMonnaieTicket.solde(self.client_lonab.pk, timezone.now().date()).disponibles, 4)
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite sérialise les écritures : pas de concurrence réelle')
+class ScansConcurrentsTests(DonneesRestaurant, TransactionTestCase):
+    """Scans simultanés depuis plusieurs scanners : jamais de double consommation"""
+
+    SCANNERS = 8
+
+    def setUp(self):
+        self.creer_donnees(nombre_tickets=3)
+
+    def scanner_en_parallele(self, codes):
+        reussis, refuses, erreurs = [], [], []
+        depart = threading.Barrier(len(codes))
+
+        def scanner(code):
+            try:
+                depart.wait()
+                reussis.append(consommer_qr_code(code, self.restaurant, self.gestionnaire)['ticket_numero'])
+            except ValidationError:
+                refuses.append(code)
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        fils = [threading.Thread(target=scanner, args=[code]) for code in codes]
+        for f in fils:
+            f.start()
+        for f in fils:
+            f.join()
+        self.assertEqual(erreurs, [])
+        return reussis, refuses
+
+    def test_meme_code_sur_plusieurs_scanners(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        reussis, refuses = self.scanner_en_parallele([qr.code] * self.SCANNERS)
+
+        self.assertEqual(len(reussis), 1)
+        self.assertEqual(len(refuses), self.SCANNERS - 1)
+        self.assertEqual(Ticket.objects.filter(proprietaire=self.client_lonab, statut='CONSOMME').count(), 1)
+        self.assertEqual(LogConsommation.objects.count(), 1)
+
+    def test_plus_de_scans_que_de_tickets(self):
+        codes = [CodeQR.objects.create(utilisateur=self.client_lonab).code for _ in range(self.SCANNERS)]
+        reussis, refuses = self.scanner_en_parallele(codes)
+
+        self.assertEqual(len(reussis), 3)
+        self.assertEqual(len(set(reussis)), 3)
+        self.assertEqual(len(refuses), self.SCANNERS - 3)
+        self.assertFalse(Ticket.objects.filter(proprietaire=self.client_lonab, statut='DISPONIBLE').exists())
+        self.assertEqual(LogConsommation.objects.count(), 3)
+        self.assertEqual(PorteMonnaieTicket.solde(self.client_lonab.pk, timezone.now().date()).disponibles, 0)
+
+
+# ════════════════════════════════════════════════════════════════
+# Scanner hors ligne
+# ════════════════════════════════════════════════════════════════
+class ReconciliationHorsLigneTests(DonneesRestaurant, TestCase):
+    """Un scan synchronisé n'est pas accepté là où le scanner en ligne le refuserait"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creer_donnees()
+
+    def synchroniser(self, qr, reference='scan-1', **scan):
+        scan = {'id': reference, 'code': qr.code, 'scanne_le': timezone.now().isoformat(), **scan}
+        return hors_ligne.reconcilier(
+            self.restaurant, self.gestionnaire, timezone.now().date(), [scan],
+        )['resultats'][0]
+
+    def disponibles(self):
+        return Ticket.objects.filter(proprietaire=self.client_lonab, statut='DISPONIBLE').count()
+
+    def test_scan_applique(self):
+        resultat = self.synchroniser(CodeQR.objects.create(utilisateur=self.client_lonab))
+        self.assertEqual(resultat['statut'], hors_ligne.APPLIQUE)
+        self.assertEqual(self.disponibles(), 4)
+
+    def test_code_revoque_rejete(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.client.force_login(self.client_lonab)
+        self.client.post(reverse('tickets:invalider_qrcode', args=[qr.pk]))
+
+        resultat = self.synchroniser(qr)
+        self.assertEqual(resultat['statut'], hors_ligne.REJETE)
+        self.assertEqual(self.disponibles(), 5)
+
+    def test_code_remplace_rejete(self):
+        ancien = CodeQR.objects.create(utilisateur=self.client_lonab)
+        CodeQR.invalider_codes_precedents(self.client_lonab)
+        CodeQR.objects.create(utilisateur=self.client_lonab)
+
+        resultat = self.synchroniser(ancien)
+        self.assertEqual(resultat['statut'], hors_ligne.REJETE)
+        self.assertEqual(self.disponibles(), 5)
+
+    def test_plat_manquant_rejete(self):
+        self.creer_plat()
+        resultat = self.synchroniser(CodeQR.objects.create(utilisateur=self.client_lonab))
+        self.assertEqual(resultat['statut'], hors_ligne.REJETE)
+        self.assertEqual(self.disponibles(), 5)
+
+    def test_plat_inconnu_rejete(self):
+        plat = self.creer_plat()
+        resultat = self.synchroniser(CodeQR.objects.create(utilisateur=self.client_lonab), menu_id=plat.pk + 1000)
+        self.assertEqual(resultat['statut'], hors_ligne.REJETE)
+        self.assertEqual(self.disponibles(), 5)
+
+    def test_plat_choisi_applique(self):
+        plat = self.creer_plat()
+        resultat = self.synchroniser(CodeQR.objects.create(utilisateur=self.client_lonab), menu_id=plat.pk)
+        self.assertEqual(resultat['statut'], hors_ligne.APPLIQUE)
+        self.assertEqual(self.disponibles(), 4)
+
+    def test_file_de_la_veille_synchronisee_apres_minuit(self):
+        hier = timezone.localdate() - timedelta(days=1)
+        scanne_le = timezone.make_aware(datetime.combine(hier, time(23, 30)))
+        scans = [
+            {'id': f'veille-{i}', 'code': CodeQR.objects.create(utilisateur=self.client_lonab).code,
+             'scanne_le': scanne_le.isoformat()}
+            for i in range(2)
+        ]
+        self.client.force_login(self.gestionnaire)
+
+        def envoyer(jour):
+            corps = {'instantane': hors_ligne.instantane(self.restaurant, jour)['instantane'], 'scans': scans}
+            reponse = self.client.post(reverse('restaurants:scanner_synchroniser'), json.dumps(corps),
+                                       content_type='application/json')
+            return [r['statut'] for r in reponse.json()['resultats']]
+
+        # Le jeton du jour refuse les scans de la veille : le scanner garde celui de leur jour
+        self.assertEqual(envoyer(timezone.localdate()), [hors_ligne.REJETE] * 2)
+        self.assertEqual(envoyer(hier), [hors_ligne.APPLIQUE] * 2)
+        self.assertEqual(self.disponibles(), 3)
+
+    def test_envoi_rejoue(self):
+        maintenant = timezone.now().isoformat()
+        scans = [
+            {'id': f'scan-{i}', 'code': CodeQR.objects.create(utilisateur=self.client_lonab).code, 'scanne_le': maintenant}
+            for i in range(3)
+        ]
+        premier = hors_ligne.reconcilier(self.restaurant, self.gestionnaire, timezone.now().date(), scans)
+        self.assertEqual(premier['stats']['appliques'], 3)
+
+        # Lectures groupées du lot, aucune écriture : le coût ne dépend pas du nombre de scans
+        with CaptureQueriesContext(connection) as requetes:
+            rejoue = hors_ligne.reconcilier(self.restaurant, self.gestionnaire, timezone.now().date(), scans * 4)
+        self.assertEqual(rejoue['stats']['deja_appliques'], 12)
+        self.assertEqual(len([r for r in requetes.captured_queries if r['sql'].startswith('SELECT')]), 4)
+        self.assertFalse([r for r in requetes.captured_queries if r['sql'].startswith(('INSERT', 'UPDATE'))])
+        self.assertEqual(self.disponibles(), 2)
 
-# Create your tests here.
@@ -25,11 +25,16 @@ urlpatterns = [
     path('plannings/<int:pk>/edit/', views.planning_edit, name='planning_edit'),
     path('plannings/<int:pk>/delete/', views.planning_delete, name='planning_delete'),
 
+    # Suivi du scanner (administrateur)
+    path('scanner/latences/', views.scanner_latences, name='scanner_latences'),
+
     # Gestionnaire
     path('gestionnaire/', views.gestionnaire_dashboard, name='gestionnaire_dashboard'),
     path('gestionnaire/scanner/', views.gestionnaire_scanner, name='gestionnaire_scanner'),
     path('gestionnaire/scanner/verifier/', views.verifier_qr_code, name='verifier_qr_code'),
     path('gestionnaire/scanner/valider/', views.valider_qr_code, name='valider_qr_code'),
+    path('gestionnaire/scanner/hors-ligne/instantane/', views.scanner_instantane, name='scanner_instantane'),
+    path('gestionnaire/scanner/hors-ligne/synchroniser/', views.scanner_synchroniser, name='scanner_synchroniser'),
     path('gestionnaire/consommations/', views.gestionnaire_consommations, name='gestionnaire_consommations'),
     path('gestionnaire/reservations/', views.gestionnaire_reservations, name='gestionnaire_reservations'),
     path('gestionnaire/reservations/<int:pk>/statut/', views.gestionnaire_changer_statut_reservation, name='changer_statut_reservation'),
@@ -6,15 +6,25 @@ Logique :
   - Planning : une agence ne peut avoir qu'un restaurant actif simultanément
   - Gestionnaire bloqué si restaurant non programmé
 """
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db.models import Q, Count
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
+from apps.accounts.recherche import filtre_recherche
+from apps.settings.facettes import compter_facettes
+from apps.tickets import jetons_qr
+from apps.tickets.models import CodeQR, PorteMonnaieTicket
+from apps.transactions.models import StatistiqueJournaliere
 from .models import Restaurant, PlanningRestaurant, Menu, Reservation
+from .hors_ligne import MAX_SCANS, instantane, lire_instantane, reconcilier
+from .scanner import consommer_qr_code, extraire_code, latences_scanner
 
 JOURS_MAP = {
     'Monday': 'LUNDI', 'Tuesday': 'MARDI', 'Wednesday': 'MERCREDI',
@@ -74,10 +84,12 @@ def restaurants_list(request):
         qs = qs.filter(Q(nom__icontains=q) | Q(code__icontains=q) | Q(ville__icontains=q))
     return render(request, 'restaurants/restaurants_list.html', {
         'restaurants': qs.order_by('nom'),
-        'total': Restaurant.objects.count(),
-        'actifs': Restaurant.objects.filter(statut='ACTIF').count(),
-        'inactifs': Restaurant.objects.filter(statut='INACTIF').count(),
-        'suspendus': Restaurant.objects.filter(statut='SUSPENDU').count(),
+        **compter_facettes(Restaurant.objects.all(), {
+            'total':     None,
+            'actifs':    Q(statut='ACTIF'),
+            'inactifs':  Q(statut='INACTIF'),
+            'suspendus': Q(statut='SUSPENDU'),
+        }),
     })
 
 @login_required
@@ -481,11 +493,10 @@ def gestionnaire_dashboard(request):
     ).select_related('client', 'menu').order_by('statut')
 
     # Données graphe 7 jours pour Chart.js
-    graph_7j = []
-    for i in range(6, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = restaurant.tickets_consommes.filter(date_consommation__date=j).count()
-        graph_7j.append({'label': j.strftime('%a %d/%m'), 'value': nb})
+    graph_7j = [
+        {'label': ligne['date'].strftime('%a %d/%m'), 'value': ligne['tickets_consommes']}
+        for ligne in StatistiqueJournaliere.serie(7, 'tickets_consommes', fin=aujourd_hui, restaurant=restaurant)
+    ]
 
     return render(request, 'restaurants/gestionnaire_dashboard.html', {
         'restaurant': restaurant,
@@ -525,11 +536,12 @@ def verifier_qr_code(request):
     redir = _verifier_acces_gestionnaire(request)
     if redir: return JsonResponse({'valide': False, 'error': 'Accès refusé'}, status=403)
     restaurant = request.user.restaurant_gere
-    code = request.GET.get('code', '').strip()
+    code = extraire_code(request.GET.get('code', ''))
     if not code:
         return JsonResponse({'valide': False, 'error': 'Code manquant'})
     try:
         from apps.tickets.models import CodeQR, Ticket
+        jetons_qr.verifier(code)
         qr = CodeQR.objects.select_related(
             'utilisateur', 'utilisateur__agence', 'utilisateur__direction'
         ).get(code=code)
@@ -537,11 +549,11 @@ def verifier_qr_code(request):
         if not est_valide:
             return JsonResponse({'valide': False, 'error': message})
         aujourd_hui = timezone.now().date()
-        tickets_qs = Ticket.objects.filter(
+        # Même ordre que Ticket.reclamer_disponible : le ticket affiché est celui qui sera consommé
+        ticket = Ticket.objects.filter(
             proprietaire=qr.utilisateur, statut='DISPONIBLE',
             valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui,
-        )
-        ticket = tickets_qs.first()
+        ).order_by('valide_jusqua', 'id').first()
         if not ticket:
             return JsonResponse({'valide': False, 'error': 'Aucun ticket valide disponible pour cet employé'})
 
@@ -568,7 +580,7 @@ def verifier_qr_code(request):
             'matricule': qr.utilisateur.matricule or '—',
             'agence': qr.utilisateur.agence.nom if qr.utilisateur.agence else '—',
             'ticket_numero': ticket.numero_ticket,
-            'tickets_restants': tickets_qs.count(),
+            'tickets_restants': PorteMonnaieTicket.solde(qr.utilisateur_id, aujourd_hui).disponibles,
             'photo_url': qr.utilisateur.photo_profil.url if qr.utilisateur.photo_profil else '',
             'plats_du_jour': plats_du_jour,
             'plat_requis': True,   # ← le gestionnaire DOIT choisir un plat
@@ -584,6 +596,8 @@ def verifier_qr_code(request):
         return JsonResponse(resp)
     except CodeQR.DoesNotExist:
         return JsonResponse({'valide': False, 'error': 'Code QR introuvable ou invalide'})
+    except ValidationError as e:
+        return JsonResponse({'valide': False, 'error': e.messages[0]})
     except Exception as e:
         return JsonResponse({'valide': False, 'error': str(e)})
 
@@ -598,91 +612,58 @@ def valider_qr_code(request):
     if not code:
         return JsonResponse({'error': 'Code QR manquant'}, status=400)
     try:
-        from apps.tickets.models import CodeQR, Ticket
-        qr = CodeQR.objects.get(code=code)
-        est_valide, message = qr.verifier_validite()
-        if not est_valide:
-            return JsonResponse({'error': message, 'valide': False}, status=400)
-        aujourd_hui = timezone.now().date()
-        ticket = Ticket.objects.filter(
-            proprietaire=qr.utilisateur, statut='DISPONIBLE',
-            valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui,
-        ).first()
-        if not ticket:
-            return JsonResponse({'error': 'Aucun ticket valide disponible', 'valide': False}, status=400)
-
-        # ── Traitement du plat consommé ────────────────────────────────────
-        plat_consomme = None
-        plat_nom = None
-
-        # Cas 1 : le gestionnaire a transmis un menu_id explicite
-        if menu_id:
-            try:
-                plat_consomme = Menu.objects.get(pk=menu_id, restaurant=restaurant)
-                plat_nom = plat_consomme.nom
-            except Menu.DoesNotExist:
-                pass
-
-        # Cas 2 : le client avait une réservation active → on l'utilise
-        reservation_active = Reservation.objects.filter(
-            client=qr.utilisateur, restaurant=restaurant,
-            date_reservation=aujourd_hui,
-            statut__in=['EN_ATTENTE', 'CONFIRME'],
-        ).select_related('menu').first()
-
-        if reservation_active:
-            # Si pas de plat choisi manuellement → on utilise le plat réservé
-            if not plat_consomme:
-                plat_consomme = reservation_active.menu
-                plat_nom = reservation_active.menu.nom
-            # Marquer la réservation comme terminée
-            reservation_active.statut = 'TERMINE'
-            reservation_active.save(update_fields=['statut'])
-        else:
-            # Pas de réservation : le plat est OBLIGATOIRE si des plats du jour existent
-            plats_disponibles = Menu.objects.filter(
-                restaurant=restaurant, date=aujourd_hui, est_disponible=True
-            ).exists()
-            if plats_disponibles and not plat_consomme:
-                return JsonResponse({
-                    'error': 'Veuillez choisir un plat avant de valider',
-                    'valide': False
-                }, status=400)
-            elif plat_consomme:
-                # Créer une trace de réservation
-                Reservation.objects.create(
-                    client=qr.utilisateur,
-                    restaurant=restaurant,
-                    menu=plat_consomme,
-                    date_reservation=aujourd_hui,
-                    statut='TERMINE',
-                )
-
-        # Décrémenter quantité si applicable
-        if plat_consomme and plat_consomme.quantite_disponible is not None:
-            plat_consomme.quantite_disponible = max(0, plat_consomme.quantite_disponible - 1)
-            if plat_consomme.quantite_disponible == 0:
-                plat_consomme.est_disponible = False
-            plat_consomme.save(update_fields=['quantite_disponible', 'est_disponible'])
-
-        # ── Consommer le ticket ────────────────────────────────────────────
-        ticket.marquer_comme_consomme(restaurant, request.user)
-        qr.marquer_comme_utilise(restaurant)
-
-        return JsonResponse({
-            'valide': True,
-            'message': f'Ticket validé — {qr.utilisateur.get_full_name()}',
-            'client': qr.utilisateur.get_full_name(),
-            'matricule': qr.utilisateur.matricule or '',
-            'agence': qr.utilisateur.agence.nom if qr.utilisateur.agence else '',
-            'ticket_numero': ticket.numero_ticket,
-            'plat': plat_nom or '—',
-        })
+        resultat = consommer_qr_code(extraire_code(code), restaurant, request.user, menu_id)
     except CodeQR.DoesNotExist:
         return JsonResponse({'error': 'Code QR invalide ou introuvable', 'valide': False}, status=404)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0], 'valide': False}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e), 'valide': False}, status=400)
 
+    return JsonResponse({
+        'valide': True,
+        'message': f"Ticket validé — {resultat['client']}",
+        **resultat,
+    })
+
+# ── Scanner hors ligne (voir hors_ligne.py) ──────────────────────
+@login_required
+def scanner_instantane(request):
+    redir = _verifier_acces_gestionnaire(request)
+    if redir: return JsonResponse({'error': 'Accès refusé'}, status=403)
+    donnees = instantane(request.user.restaurant_gere)
+    if request.GET.get('version') == donnees['version']:
+        return JsonResponse({'inchange': True, 'version': donnees['version'], 'instantane': donnees['instantane']})
+    return JsonResponse(donnees)
+
+@login_required
+@require_http_methods(["POST"])
+def scanner_synchroniser(request):
+    redir = _verifier_acces_gestionnaire(request)
+    if redir: return JsonResponse({'error': 'Accès refusé'}, status=403)
+    restaurant = request.user.restaurant_gere
+    try:
+        corps = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Requête invalide'}, status=400)
+    scans = corps.get('scans') if isinstance(corps, dict) else None
+    if not isinstance(scans, list):
+        return JsonResponse({'error': 'Liste de scans manquante'}, status=400)
+    if len(scans) > MAX_SCANS:
+        return JsonResponse({'error': f'Au plus {MAX_SCANS} scans par envoi'}, status=400)
+    try:
+        jour = lire_instantane(corps.get('instantane'), restaurant)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    return JsonResponse(reconcilier(restaurant, request.user, jour, scans))
+
+@login_required
+def scanner_latences(request):
+    """Latence des scans (p50/p99) servis par ce processus, et les objectifs — administrateur"""
+    if not request.user.est_admin:
+        return JsonResponse({'error': 'Permission refusée'}, status=403)
+    return JsonResponse(latences_scanner())
+
 @login_required
 def gestionnaire_consommations(request):
     redir = _verifier_acces_gestionnaire(request)
@@ -698,19 +679,20 @@ def gestionnaire_consommations(request):
     if date_debut: qs = qs.filter(date_consommation__date__gte=date_debut)
     if date_fin_f: qs = qs.filter(date_consommation__date__lte=date_fin_f)
     if search:
-        qs = qs.filter(Q(numero_ticket__icontains=search)|Q(proprietaire__prenom__icontains=search)|Q(proprietaire__nom__icontains=search)|Q(proprietaire__matricule__icontains=search))
+        qs = qs.filter(filtre_recherche(search, 'proprietaire__', numero='numero_ticket'))
     if agence_id: qs = qs.filter(proprietaire__agence_id=agence_id)
     stats = {
-        'total_filtre': qs.count(),
-        'aujourd_hui': restaurant.tickets_consommes.filter(date_consommation__date=aujourd_hui).count(),
-        'cette_semaine': restaurant.tickets_consommes.filter(date_consommation__date__gte=aujourd_hui-timezone.timedelta(days=6)).count(),
-        'ce_mois': restaurant.tickets_consommes.filter(date_consommation__date__gte=debut_mois).count(),
+        **compter_facettes(qs, {'total_filtre': None}),
+        **compter_facettes(restaurant.tickets_consommes.all(), {
+            'aujourd_hui':   Q(date_consommation__date=aujourd_hui),
+            'cette_semaine': Q(date_consommation__date__gte=aujourd_hui-timezone.timedelta(days=6)),
+            'ce_mois':       Q(date_consommation__date__gte=debut_mois),
+        }),
     }
-    graph_data = []
-    for i in range(6, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = restaurant.tickets_consommes.filter(date_consommation__date=j).count()
-        graph_data.append({'label': j.strftime('%a %d'), 'value': nb})
+    graph_data = [
+        {'label': ligne['date'].strftime('%a %d'), 'value': ligne['tickets_consommes']}
+        for ligne in StatistiqueJournaliere.serie(7, 'tickets_consommes', fin=aujourd_hui, restaurant=restaurant)
+    ]
     from apps.accounts.models import Agence
     agences = Agence.objects.filter(plannings_restaurant__restaurant=restaurant).distinct()
     return render(request, 'restaurants/gestionnaire_consommations.html', {
@@ -730,13 +712,13 @@ def gestionnaire_reservations(request):
     if date_filtre: qs = qs.filter(date_reservation=date_filtre)
     if statut := request.GET.get('statut'): qs = qs.filter(statut=statut)
     if search := request.GET.get('search'):
-        qs = qs.filter(Q(client__prenom__icontains=search)|Q(client__nom__icontains=search)|Q(client__matricule__icontains=search))
-    stats = {
-        'en_attente': qs.filter(statut='EN_ATTENTE').count(),
-        'confirme': qs.filter(statut='CONFIRME').count(),
-        'termine': qs.filter(statut='TERMINE').count(),
-        'annule': qs.filter(statut='ANNULE').count(),
-    }
+        qs = qs.filter(filtre_recherche(search, 'client__'))
+    stats = compter_facettes(qs, {
+        'en_attente': Q(statut='EN_ATTENTE'),
+        'confirme':   Q(statut='CONFIRME'),
+        'termine':    Q(statut='TERMINE'),
+        'annule':     Q(statut='ANNULE'),
+    })
     return render(request, 'restaurants/gestionnaire_reservations.html', {
         'restaurant': restaurant, 'reservations': qs, 'stats': stats,
         'statuts': Reservation.STATUT_CHOICES, 'aujourd_hui': aujourd_hui,
@@ -833,9 +815,7 @@ def client_menus(request):
     else:
         menus_du_jour = Menu.objects.none()
 
-    tickets_valides = request.user.tickets.filter(
-        statut='DISPONIBLE', valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui
-    ).count()
+    tickets_valides = PorteMonnaieTicket.solde(request.user, aujourd_hui).disponibles
 
     # Mes réservations du jour
     mes_reservations = Reservation.objects.filter(
@@ -878,10 +858,7 @@ def client_reserver(request):
         date_r = request.POST.get('date_reservation', aujourd_hui.isoformat())
 
         # Vérifier ticket valide
-        ticket_valide = request.user.tickets.filter(
-            statut='DISPONIBLE', valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui
-        ).exists()
-        if not ticket_valide:
+        if PorteMonnaieTicket.solde(request.user, aujourd_hui).disponibles <= 0:
             return JsonResponse({'error': 'Vous n\'avez aucun ticket valide ce mois-ci'}, status=400)
 
         # Vérifier pas déjà réservé ce menu aujourd'hui
@@ -972,8 +949,10 @@ def caissier_restaurants(request):
 
     return render(request, 'restaurants/caissier_restaurants.html', {
         'restaurants':        qs.order_by('nom'),
-        'total_restaurants':  base_qs.count(),
-        'restaurants_actifs': base_qs.filter(statut='ACTIF').count(),
+        **compter_facettes(base_qs, {
+            'total_restaurants':  None,
+            'restaurants_actifs': Q(statut='ACTIF'),
+        }),
         'agence':             agence,
         'planning_actif':     planning_actif,
     })
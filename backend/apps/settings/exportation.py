@@ -0,0 +1,192 @@
+"""
+Moteur d'export en flux (CSV / Excel) — mémoire constante quel que soit le volume.
+
+Un export = un queryset + des colonnes (en-tête, fonction objet → valeur) :
+
+    COLONNES = [('N° Ticket', lambda t: t.numero_ticket), ('Statut', lambda t: t.statut)]
+    return exporter(qs, COLONNES, 'tickets', format_export='xlsx', titre='Tickets')
+
+- CSV : StreamingHttpResponse, les lignes sont lues par paquets
+  (.iterator(chunk_size=…), ou par clé primaire avec par_cle=True) et
+  envoyées au fil de l'eau ;
+- XLSX : openpyxl en mode write-only, écrit dans un fichier temporaire
+  (en mémoire jusqu'à TAILLE_MAX_MEMOIRE, sur disque au-delà) puis servi
+  par FileResponse.
+
+Sous ASGI (Procfile : uvicorn), Django lit un itérateur synchrone d'un seul
+coup (sync_to_async(list)) avant d'envoyer quoi que ce soit ; ReponseEnFlux et
+ReponseFichier le lisent morceau par morceau, sous WSGI comme sous ASGI.
+"""
+import csv
+import io
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+TAILLE_PAQUET = 2000
+LIGNES_PAR_ENVOI = 500
+TAILLE_MAX_MEMOIRE = 8 * 1024 * 1024
+LIGNES_MAX_FEUILLE = 1_048_575  # limite Excel, en-tête non compris
+
+TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATS = ('csv', 'xlsx')
+
+
+class _FluxAsgi:
+    """Itération asynchrone morceau par morceau d'un contenu synchrone (au lieu de tout charger)"""
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for morceau in self.streaming_content:
+                yield morceau
+            return
+        # Même thread pour tous les morceaux : le curseur de la requête y reste ouvert
+        morceaux, fin = self.streaming_content, object()
+        while (morceau := await sync_to_async(next)(morceaux, fin)) is not fin:
+            yield morceau
+
+
+class ReponseEnFlux(_FluxAsgi, StreamingHttpResponse):
+    pass
+
+
+class ReponseFichier(_FluxAsgi, FileResponse):
+    pass
+
+
+def nom_fichier(prefixe, extension):
+    return f"{prefixe}_{timezone.now().strftime('%Y%m%d_%H%M')}.{extension}"
+
+
+def lignes(objets, colonnes, numeroter=False):
+    """Valeurs de chaque objet, dans l'ordre des colonnes (1re colonne '#' si numeroter)"""
+    extracteurs = [f for _, f in colonnes]
+    for idx, obj in enumerate(objets, 1):
+        valeurs = [f(obj) for f in extracteurs]
+        yield [idx] + valeurs if numeroter else valeurs
+
+
+def entetes(colonnes, numeroter=False):
+    noms = [nom for nom, _ in colonnes]
+    return ['#'] + noms if numeroter else noms
+
+
+def parcourir(queryset, taille_paquet=TAILLE_PAQUET):
+    """Itère sans mettre en cache tout le queryset (curseur serveur quand la base le permet)"""
+    return queryset.iterator(chunk_size=taille_paquet)
+
+
+def parcourir_par_cle(queryset, taille_paquet=TAILLE_PAQUET):
+    """
+    Itère par paquets ordonnés sur la clé primaire (WHERE pk > dernier LIMIT n) :
+    ni OFFSET ni curseur ouvert, chaque paquet est une requête courte sur l'index.
+    Sur MySQL, le pilote charge tout le résultat d'un .iterator() côté client ;
+    ici seul le paquet courant est en mémoire.
+    """
+    queryset, dernier = queryset.order_by('pk'), None
+    while True:
+        paquet = queryset if dernier is None else queryset.filter(pk__gt=dernier)
+        paquet = list(paquet[:taille_paquet])
+        if not paquet:
+            return
+        yield from paquet
+        dernier = paquet[-1].pk
+
+
+# ════════════════════════════════════════════════════════════════
+# CSV
+# ════════════════════════════════════════════════════════════════
+def flux_csv(entete, rangees):
+    """Morceaux de texte CSV (BOM UTF-8 pour Excel, puis ~LIGNES_PAR_ENVOI lignes par morceau)"""
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    tampon.write('\ufeff')
+    writer.writerow(entete)
+    for n, rangee in enumerate(rangees, 1):
+        writer.writerow(rangee)
+        if n % LIGNES_PAR_ENVOI == 0:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def reponse_csv(entete, rangees, fichier):
+    response = ReponseEnFlux(flux_csv(entete, rangees), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{fichier}"'
+    return response
+
+
+# ════════════════════════════════════════════════════════════════
+# XLSX
+# ════════════════════════════════════════════════════════════════
+def _nouvelle_feuille(wb, titre, entete, largeurs, numero):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(titre[:31] if numero == 1 else f'{titre[:26]} ({numero})')
+    for i, largeur in enumerate(largeurs or [], 1):
+        ws.column_dimensions[get_column_letter(i)].width = largeur
+    ws.freeze_panes = 'A2'
+
+    police = Font(bold=True, color='FFFFFF', size=10)
+    fond = PatternFill(start_color='1e5c3a', end_color='1e5c3a', fill_type='solid')
+    alignement = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    cellules = []
+    for valeur in entete:
+        cellule = WriteOnlyCell(ws, value=valeur)
+        cellule.font, cellule.fill, cellule.alignment = police, fond, alignement
+        cellules.append(cellule)
+    ws.append(cellules)
+    return ws
+
+
+def ecrire_xlsx(destination, entete, rangees, titre='Export', largeurs=None):
+    """Écrit le classeur dans `destination` (fichier ouvert), nouvelle feuille tous les LIGNES_MAX_FEUILLE"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    numero, ws, dans_feuille = 1, _nouvelle_feuille(wb, titre, entete, largeurs, 1), 0
+    for rangee in rangees:
+        if dans_feuille == LIGNES_MAX_FEUILLE:
+            numero += 1
+            ws, dans_feuille = _nouvelle_feuille(wb, titre, entete, largeurs, numero), 0
+        ws.append(rangee)
+        dans_feuille += 1
+    wb.save(destination)
+
+
+def reponse_xlsx(entete, rangees, fichier, titre='Export', largeurs=None):
+    destination = tempfile.SpooledTemporaryFile(max_size=TAILLE_MAX_MEMOIRE)
+    ecrire_xlsx(destination, entete, rangees, titre, largeurs)
+    destination.seek(0)
+    return ReponseFichier(destination, as_attachment=True, filename=fichier, content_type=TYPE_XLSX)
+
+
+# ════════════════════════════════════════════════════════════════
+# Point d'entrée
+# ════════════════════════════════════════════════════════════════
+def format_demande(request, defaut='csv'):
+    """Format demandé par ?format= ('csv' ou 'xlsx')"""
+    format_export = request.GET.get('format', defaut)
+    return format_export if format_export in FORMATS else defaut
+
+
+def exporter(queryset, colonnes, prefixe, format_export='csv', titre='Export',
+             largeurs=None, numeroter=False, par_cle=False):
+    """
+    Réponse HTTP d'export de `queryset` au format 'csv' ou 'xlsx'.
+    par_cle=True : parcours par clé primaire (grands volumes, ordre des pk).
+    """
+    if format_export not in FORMATS:
+        raise ValueError(f"Format d'export non supporté : {format_export}")
+
+    objets = parcourir_par_cle(queryset) if par_cle else parcourir(queryset)
+    entete = entetes(colonnes, numeroter)
+    rangees = lignes(objets, colonnes, numeroter)
+    if format_export == 'xlsx':
+        return reponse_xlsx(entete, rangees, nom_fichier(prefixe, 'xlsx'), titre, largeurs)
+    return reponse_csv(entete, rangees, nom_fichier(prefixe, 'csv'))
@@ -0,0 +1,60 @@
+"""
+Comptes par facette pour les pastilles KPI des listes — une requête, cache court.
+
+    comptes = compter_facettes(qs, {
+        'total':       None,
+        'disponibles': Q(statut='DISPONIBLE'),
+        'expires':     Q(statut__in=['EXPIRE', 'ANNULE']),
+    })
+
+Une seule requête aggregate(Count('pk', filter=...)) au lieu d'un COUNT par
+pastille. Le résultat est mis en cache DUREE_CACHE secondes sous une clé
+dérivée du SQL de la sélection (les mêmes filtres donnent la même clé, quel
+que soit l'ordre des paramètres GET) et des facettes demandées. Un
+traitement de masse (expiration des tickets…) appelle invalider() : la
+génération change et toutes les clés sont recalculées.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+DUREE_CACHE = getattr(settings, 'FACET_COUNTS_CACHE_TIMEOUT', 30)
+CLE_GENERATION = 'facettes:generation'
+
+
+def _generation():
+    cache.add(CLE_GENERATION, 1, None)
+    return cache.get(CLE_GENERATION) or 1
+
+
+def invalider():
+    """Périme tous les comptes en cache (nouvelle génération de clés)"""
+    try:
+        cache.incr(CLE_GENERATION)
+    except ValueError:
+        cache.set(CLE_GENERATION, 2, None)
+
+
+def _cle_cache(queryset, facettes):
+    empreinte = str(queryset.order_by().query) + '|' + '|'.join(
+        f'{nom}={condition}' for nom, condition in sorted(facettes.items(), key=lambda f: f[0])
+    )
+    return f'facettes:{_generation()}:' + hashlib.md5(empreinte.encode()).hexdigest()
+
+
+def compter_facettes(queryset, facettes, duree=DUREE_CACHE):
+    """
+    {nom: nombre} pour chaque facette ({nom: Q(...)}, None = toute la sélection).
+    duree=0 : pas de cache.
+    """
+    def _compter():
+        return queryset.order_by().aggregate(**{
+            nom: Count('pk', filter=condition) if condition is not None else Count('pk')
+            for nom, condition in facettes.items()
+        })
+
+    if not duree:
+        return _compter()
+    return cache.get_or_set(_cle_cache(queryset, facettes), _compter, duree)
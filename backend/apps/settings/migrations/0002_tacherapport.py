@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('settings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheRapport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_rapport', models.CharField(choices=[('UTILISATEURS_PDF', 'Utilisateurs (PDF)'), ('DIRECTIONS_PDF', 'Directions (PDF)'), ('AGENCES_PDF', 'Agences (PDF)')], max_length=30, verbose_name='Type')),
+                ('parametres', models.JSONField(blank=True, default=dict, verbose_name='Filtres')),
+                ('empreinte', models.CharField(db_index=True, max_length=64, verbose_name='Empreinte')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('progression', models.PositiveSmallIntegerField(default=0, verbose_name='Progression (%)')),
+                ('fichier', models.FileField(blank=True, upload_to='rapports/', verbose_name='Fichier')),
+                ('erreur', models.TextField(blank=True, verbose_name='Erreur')),
+                ('cree_le', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('termine_le', models.DateTimeField(blank=True, null=True, verbose_name='Terminé le')),
+                ('expire_le', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Expire le')),
+                ('demandeur', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='taches_rapport', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tâche de rapport',
+                'verbose_name_plural': 'Tâches de rapport',
+                'ordering': ['-cree_le'],
+            },
+        ),
+    ]
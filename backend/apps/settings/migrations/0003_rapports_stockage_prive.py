@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:46
+
+import apps.settings.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def retirer_rapports_publics(apps, schema_editor):
+    """Rapports déjà écrits sous MEDIA_ROOT : fichiers supprimés, tâches oubliées (régénérables)"""
+    TacheRapport = apps.get_model('settings', 'TacheRapport')
+    for nom in TacheRapport.objects.exclude(fichier='').values_list('fichier', flat=True):
+        default_storage.delete(nom)
+    TacheRapport.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('settings', '0002_tacherapport'),
+    ]
+
+    operations = [
+        migrations.RunPython(retirer_rapports_publics, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tacherapport',
+            name='fichier',
+            field=models.FileField(blank=True, storage=apps.settings.models.StockagePrive(), upload_to='rapports/', verbose_name='Fichier'),
+        ),
+    ]
@@ -1,9 +1,25 @@
 """
 Modèles pour les paramètres système et configurations
 """
-from django.db import models
+import copy
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+# Cache des paramètres : copie locale au processus + copie partagée (django cache)
+# repérée par un jeton de version renouvelé à chaque sauvegarde.
+CLE_VERSION_PARAMETRES = 'parametres_systeme:version'
+DELAI_VERIFICATION_PARAMETRES = getattr(settings, 'SYSTEM_PARAMS_REFRESH_SECONDS', 5)
+_parametres_locaux = {'objet': None, 'version': None, 'verifie_le': 0.0}
+
 
 class ParametresSysteme(models.Model):
     """Modèle pour les paramètres globaux du système"""
@@ -161,6 +177,7 @@ class ParametresSysteme(models.Model):
         """S'assurer qu'il n'existe qu'une seule instance"""
         self.pk = 1
         super().save(*args, **kwargs)
+        transaction.on_commit(ParametresSysteme.invalider_cache)
 
     def delete(self, *args, **kwargs):
         """Empêcher la suppression"""
@@ -168,9 +185,34 @@ class ParametresSysteme(models.Model):
 
     @classmethod
     def charger(cls):
-        """Charger ou créer les paramètres système"""
-        obj, cree = cls.objects.get_or_create(pk=1)
-        return obj
+        """
+        Charger ou créer les paramètres système.
+        Sans requête en régime établi : copie locale vérifiée contre le jeton de
+        version partagé au plus toutes les DELAI_VERIFICATION_PARAMETRES secondes.
+        Retourne une copie : la modifier n'altère pas le cache.
+        """
+        local = _parametres_locaux
+        maintenant = time.monotonic()
+        if local['objet'] is not None and maintenant - local['verifie_le'] < DELAI_VERIFICATION_PARAMETRES:
+            return copy.copy(local['objet'])
+
+        cache.add(CLE_VERSION_PARAMETRES, uuid.uuid4().hex, None)
+        version = cache.get(CLE_VERSION_PARAMETRES)
+        if local['objet'] is None or local['version'] != version:
+            cle = f'parametres_systeme:{version}'
+            obj = cache.get(cle)
+            if obj is None:
+                obj, cree = cls.objects.get_or_create(pk=1)
+                cache.set(cle, obj, None)
+            local['objet'], local['version'] = obj, version
+        local['verifie_le'] = maintenant
+        return copy.copy(local['objet'])
+
+    @staticmethod
+    def invalider_cache():
+        """Nouveau jeton de version : tous les processus rechargeront depuis la base"""
+        cache.set(CLE_VERSION_PARAMETRES, uuid.uuid4().hex, None)
+        _parametres_locaux.update(objet=None, version=None, verifie_le=0.0)
 
     def clean(self):
         """Validation des paramètres"""
@@ -265,3 +307,82 @@ class JournalAudit(models.Model):
     def __str__(self):
         nom_utilisateur = self.utilisateur.get_full_name() if self.utilisateur else 'Système'
         return f"{nom_utilisateur} - {self.get_action_display()} - {self.cree_le}"
+
+
+@deconstructible
+class StockagePrive(FileSystemStorage):
+    """Fichiers sous PRIVATE_MEDIA_ROOT : jamais servis par /media/, seulement par une vue contrôlée"""
+
+    @property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+class TacheRapport(models.Model):
+    """Génération d'un rapport PDF en tâche de fond (suivi de progression, fichier conservé DUREE_VIE)"""
+
+    TYPES = [
+        ('UTILISATEURS_PDF', 'Utilisateurs (PDF)'),
+        ('DIRECTIONS_PDF', 'Directions (PDF)'),
+        ('AGENCES_PDF', 'Agences (PDF)'),
+    ]
+
+    STATUTS = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+    ]
+
+    type_rapport = models.CharField('Type', max_length=30, choices=TYPES)
+    parametres = models.JSONField('Filtres', default=dict, blank=True)
+    # Type + filtres + version des données : deux demandes identiques partagent le fichier
+    empreinte = models.CharField('Empreinte', max_length=64, db_index=True)
+
+    statut = models.CharField('Statut', max_length=20, choices=STATUTS, default='EN_ATTENTE')
+    progression = models.PositiveSmallIntegerField('Progression (%)', default=0)
+    fichier = models.FileField('Fichier', upload_to='rapports/', storage=StockagePrive(), blank=True)
+    erreur = models.TextField('Erreur', blank=True)
+
+    demandeur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='taches_rapport'
+    )
+    cree_le = models.DateTimeField('Créé le', auto_now_add=True)
+    termine_le = models.DateTimeField('Terminé le', null=True, blank=True)
+    expire_le = models.DateTimeField('Expire le', null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Tâche de rapport'
+        verbose_name_plural = 'Tâches de rapport'
+        ordering = ['-cree_le']
+
+    def __str__(self):
+        return f"{self.get_type_rapport_display()} - {self.get_statut_display()} ({self.cree_le:%d/%m/%Y %H:%M})"
+
+    @property
+    def est_disponible(self):
+        return self.statut == 'TERMINE' and bool(self.fichier) and (
+            self.expire_le is None or self.expire_le > timezone.now()
+        )
+
+    def progresser(self, pourcentage):
+        """Met à jour la progression sans toucher au reste de la ligne"""
+        self.progression = max(0, min(100, int(pourcentage)))
+        TacheRapport.objects.filter(pk=self.pk).update(progression=self.progression)
+
+    @classmethod
+    def purger_expirees(cls):
+        """Supprime les tâches expirées et leurs fichiers ; retourne le nombre supprimé"""
+        expirees = list(cls.objects.filter(expire_le__lte=timezone.now()))
+        for tache in expirees:
+            if tache.fichier:
+                tache.fichier.delete(save=False)
+            tache.delete()
+        return len(expirees)
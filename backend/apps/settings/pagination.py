@@ -0,0 +1,154 @@
+"""
+Pagination par curseur (keyset) pour les grandes listes.
+
+Le Paginator de Django fait un COUNT(*) sur la sélection filtrée puis un
+OFFSET : le coût croît avec la profondeur de la page. Ici chaque page est
+
+    WHERE (date, id) < (date, id du dernier élément affiché)
+    ORDER BY date DESC, id DESC LIMIT n + 1
+
+soit le même parcours d'index en page 1 ou en page 10 000. Le curseur est
+opaque (base64) ; le total affiché vient d'un COUNT mis en cache
+DUREE_CACHE_TOTAL secondes par sélection.
+
+    page_obj = paginer_par_curseur(request, qs, 'date_creation', 10)
+    {% include 'components/pagination.html' with page_obj=page_obj %}
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PARAMETRE = 'curseur'
+DUREE_CACHE_TOTAL = 60
+
+
+def _encoder(sens, valeur, pk):
+    brut = json.dumps([sens, valeur.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+
+def _decoder(curseur, champ):
+    """(sens, valeur, pk) ou None si le curseur est absent ou invalide"""
+    if not curseur:
+        return None
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        sens, valeur, pk = json.loads(brut)
+        valeur = champ.to_python(valeur)
+    except (ValueError, TypeError, ValidationError):
+        return None
+    if sens not in ('suiv', 'prec') or valeur is None or not isinstance(pk, int):
+        return None
+    return sens, valeur, pk
+
+
+def total_en_cache(queryset):
+    """COUNT(*) de la sélection, partagé quelques secondes entre les pages et les utilisateurs"""
+    requete = queryset.order_by()
+    cle = 'pagination:total:' + hashlib.md5(str(requete.query).encode()).hexdigest()
+    return cache.get_or_set(cle, requete.count, DUREE_CACHE_TOTAL)
+
+
+class PageCurseur:
+    """Page d'une pagination par curseur (itérable comme une Page de Django)"""
+
+    est_curseur = True
+
+    def __init__(self, objets, queryset, parametres, suivant=None, precedent=None):
+        self.object_list = objets
+        self._queryset = queryset
+        self._parametres = parametres
+        self.curseur_suivant = suivant
+        self.curseur_precedent = precedent
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.curseur_suivant is not None
+
+    def has_previous(self):
+        return self.curseur_precedent is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def count(self):
+        if not self.has_other_pages():
+            return len(self.object_list)
+        if not hasattr(self, '_count'):
+            self._count = total_en_cache(self._queryset)
+        return self._count
+
+    @property
+    def paginator(self):
+        """Compatibilité avec les gabarits qui lisent page_obj.paginator.count"""
+        return self
+
+    def _url(self, curseur=None):
+        parametres = self._parametres.copy()
+        if curseur:
+            parametres[PARAMETRE] = curseur
+        return '?' + parametres.urlencode()
+
+    @property
+    def url_premiere(self):
+        return self._url()
+
+    @property
+    def url_suivante(self):
+        return self._url(self.curseur_suivant)
+
+    @property
+    def url_precedente(self):
+        return self._url(self.curseur_precedent)
+
+
+def paginer_par_curseur(request, queryset, champ, par_page=10):
+    """
+    Page courante de `queryset` triée par `champ` décroissant puis id décroissant.
+    Le curseur est lu dans ?curseur= ; invalide ou absent → première page.
+    """
+    modele_champ = queryset.model._meta.get_field(champ)
+    parametres = request.GET.copy()
+    parametres.pop(PARAMETRE, None)
+    parametres.pop('page', None)
+
+    position = _decoder(request.GET.get(PARAMETRE), modele_champ)
+    if position is None:
+        objets = list(queryset.order_by(f'-{champ}', '-pk')[:par_page + 1])
+        a_suivante, a_precedente = len(objets) > par_page, False
+        objets = objets[:par_page]
+    else:
+        sens, valeur, pk = position
+        # date <= v ET (date < v OU id < dernier) : la borne simple permet le parcours d'index
+        if sens == 'suiv':
+            apres = Q(**{f'{champ}__lte': valeur}) & (Q(**{f'{champ}__lt': valeur}) | Q(pk__lt=pk))
+            objets = list(queryset.filter(apres).order_by(f'-{champ}', '-pk')[:par_page + 1])
+            a_suivante, a_precedente = len(objets) > par_page, True
+            objets = objets[:par_page]
+        else:
+            avant = Q(**{f'{champ}__gte': valeur}) & (Q(**{f'{champ}__gt': valeur}) | Q(pk__gt=pk))
+            objets = list(queryset.filter(avant).order_by(champ, 'pk')[:par_page + 1])
+            a_suivante, a_precedente = True, len(objets) > par_page
+            objets = objets[:par_page][::-1]
+
+    suivant = precedent = None
+    if objets and a_suivante:
+        dernier = objets[-1]
+        suivant = _encoder('suiv', getattr(dernier, champ), dernier.pk)
+    if objets and a_precedente:
+        premier = objets[0]
+        precedent = _encoder('prec', getattr(premier, champ), premier.pk)
+    return PageCurseur(objets, queryset, parametres, suivant, precedent)
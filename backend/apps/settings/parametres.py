@@ -0,0 +1,59 @@
+"""
+Valeurs des paramètres système pour le reste de l'application.
+
+Tout passe par ParametresSysteme.charger() (mis en cache) ; les constantes
+de settings.py ne servent qu'en secours si la base est indisponible.
+Les fonctions *_courant(e) servent aussi de `default` aux champs de modèles.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+
+def charger_parametres():
+    """ParametresSysteme en cache, ou None si la base est indisponible"""
+    from .models import ParametresSysteme
+    try:
+        return ParametresSysteme.charger()
+    except Exception:
+        return None
+
+
+def valeurs_vente():
+    """Prix et limites utilisés par les écrans caissier et admin."""
+    p = charger_parametres()
+    if p is None:
+        return {
+            'prix_ticket': getattr(settings, 'TICKET_PRICE', 500),
+            'subvention':  getattr(settings, 'TICKET_SUBSIDY', 1500),
+            'min_tickets': getattr(settings, 'MIN_TICKETS_PER_TRANSACTION', 1),
+            'max_tickets': getattr(settings, 'MAX_TICKETS_PER_TRANSACTION', 20),
+            'max_mensuel': getattr(settings, 'MAX_TRANSACTIONS_PER_MONTH', 1),
+        }
+    return {
+        'prix_ticket': int(p.prix_ticket),
+        'subvention':  int(p.subvention_ticket),
+        'min_tickets': p.tickets_min_par_transaction,
+        'max_tickets': p.tickets_max_par_transaction,
+        'max_mensuel': p.transactions_max_par_mois,
+    }
+
+
+def prix_ticket_courant():
+    p = charger_parametres()
+    return p.prix_ticket if p else Decimal(settings.TICKET_PRICE)
+
+
+def subvention_courante():
+    p = charger_parametres()
+    return p.subvention_ticket if p else Decimal(settings.TICKET_SUBSIDY)
+
+
+def prix_repas_courant():
+    p = charger_parametres()
+    return p.prix_repas_complet if p else Decimal(settings.TICKET_FULL_PRICE)
+
+
+def duree_validite_qr_minutes():
+    p = charger_parametres()
+    return p.duree_validite_qr_code_minutes if p else settings.QR_CODE_EXPIRY_MINUTES
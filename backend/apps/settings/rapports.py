@@ -0,0 +1,148 @@
+"""
+Moteur de rapports par agence — nombre de requêtes constant.
+
+Chaque métrique est calculée en une requête groupée par agence
+(agrégation conditionnelle), la courbe 12 mois en une requête TruncMonth
+par table. Le résultat ne contient que des types simples : il est mis
+en cache par (période, agence) et peut être réutilisé tel quel par un export.
+"""
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum, Q
+from django.utils import timezone
+
+from .series import bornes_periode, serie_temporelle
+
+DUREE_CACHE = getattr(settings, 'REPORTS_CACHE_TIMEOUT', 300)
+
+
+def _cle_cache(date_debut, date_fin, agence_id):
+    return f"rapport_agences:{date_debut.isoformat()}:{date_fin.isoformat()}:{agence_id or 'toutes'}"
+
+
+def generer_rapport(date_debut, date_fin, agence_id=None, utiliser_cache=True):
+    """
+    Rapport de la période [date_debut, date_fin] (dates incluses), toutes agences
+    actives ou une seule. Retourne {'agences', 'totaux', 'mensuel', 'top_restaurants'}.
+    """
+    cle = _cle_cache(date_debut, date_fin, agence_id)
+    if utiliser_cache:
+        rapport = cache.get(cle)
+        if rapport is not None:
+            return rapport
+
+    agences = _metriques_agences(date_debut, date_fin, agence_id)
+    rapport = {
+        'agences': agences,
+        'totaux': {
+            'tickets':    sum(a['tickets_achetes'] for a in agences),
+            'consommes':  sum(a['tickets_consommes'] for a in agences),
+            'montant':    sum(a['montant_total'] for a in agences),
+            'subvention': sum(a['subvention'] for a in agences),
+            'employes':   sum(a['nb_employes'] for a in agences),
+        },
+        'mensuel': _serie_mensuelle(agence_id),
+        'top_restaurants': _top_restaurants(date_debut, date_fin),
+    }
+    cache.set(cle, rapport, DUREE_CACHE)
+    return rapport
+
+
+def _metriques_agences(date_debut, date_fin, agence_id):
+    """Métriques par agence : 3 requêtes quel que soit le nombre d'agences"""
+    from apps.accounts.models import Agence
+    from apps.tickets.models import Ticket
+    from apps.transactions.models import TransactionTicket
+
+    debut, fin = bornes_periode(date_debut, date_fin)
+
+    agences_qs = Agence.objects.filter(est_active=True)
+    if agence_id:
+        agences_qs = agences_qs.filter(pk=agence_id)
+    agences_qs = agences_qs.annotate(
+        nb_employes=Count('employes', filter=Q(employes__type_utilisateur='CLIENT', employes__est_actif=True)),
+    ).values('id', 'nom', 'code', 'direction__nom', 'nb_employes').order_by('nom')
+
+    # Tickets achetés (créés) et consommés dans la période, par agence du propriétaire
+    achat = Q(date_creation__gte=debut, date_creation__lt=fin)
+    conso = Q(statut='CONSOMME', date_consommation__gte=debut, date_consommation__lt=fin)
+    tickets = Ticket.objects.filter(achat | conso)
+    if agence_id:
+        tickets = tickets.filter(proprietaire__agence_id=agence_id)
+    par_agence_tickets = {
+        ligne['proprietaire__agence_id']: ligne
+        for ligne in tickets.values('proprietaire__agence_id').annotate(
+            achetes=Count('id', filter=achat),
+            consommes=Count('id', filter=conso),
+        ).order_by()
+    }
+
+    transactions = TransactionTicket.objects.filter(
+        statut='TERMINEE', date_transaction__gte=debut, date_transaction__lt=fin,
+    )
+    if agence_id:
+        transactions = transactions.filter(client__agence_id=agence_id)
+    par_agence_tx = {
+        ligne['client__agence_id']: ligne
+        for ligne in transactions.values('client__agence_id').annotate(
+            montant=Sum('montant_total'),
+            subvention=Sum('subvention_totale'),
+        ).order_by()
+    }
+
+    agences = []
+    for a in agences_qs:
+        t = par_agence_tickets.get(a['id'], {})
+        tx = par_agence_tx.get(a['id'], {})
+        agences.append({
+            'id':                a['id'],
+            'nom':               a['nom'],
+            'code':              a['code'],
+            'direction_nom':     a['direction__nom'] or '',
+            'nb_employes':       a['nb_employes'],
+            'tickets_achetes':   t.get('achetes', 0),
+            'tickets_consommes': t.get('consommes', 0),
+            'montant_total':     float(tx.get('montant') or 0),
+            'subvention':        float(tx.get('subvention') or 0),
+        })
+    return agences
+
+
+def _serie_mensuelle(agence_id):
+    """12 mois glissants : tickets émis et montant encaissé, une requête par table"""
+    from apps.tickets.models import Ticket
+    from apps.transactions.models import TransactionTicket
+
+    aujourd_hui = timezone.localdate()
+    debut = aujourd_hui.replace(day=1) - relativedelta(months=11)
+
+    tickets = Ticket.objects.all()
+    transactions = TransactionTicket.objects.filter(statut='TERMINEE')
+    if agence_id:
+        tickets = tickets.filter(proprietaire__agence_id=agence_id)
+        transactions = transactions.filter(client__agence_id=agence_id)
+
+    serie_tickets = serie_temporelle(tickets, 'date_creation', debut, aujourd_hui, 'mois')
+    serie_montants = serie_temporelle(
+        transactions, 'date_transaction', debut, aujourd_hui, 'mois',
+        valeurs={'montant': Sum('montant_total')},
+    )
+    return {
+        'labels':   [ligne['periode'].strftime('%b %Y') for ligne in serie_tickets],
+        'tickets':  [ligne['total'] for ligne in serie_tickets],
+        'montants': [float(ligne['montant']) for ligne in serie_montants],
+    }
+
+
+def _top_restaurants(date_debut, date_fin, limite=5):
+    from apps.transactions.models import LogConsommation
+
+    debut, fin = bornes_periode(date_debut, date_fin)
+    return list(
+        LogConsommation.objects
+        .filter(date_consommation__gte=debut, date_consommation__lt=fin)
+        .values('restaurant__nom')
+        .annotate(nb=Count('id'))
+        .order_by('-nb')[:limite]
+    )
@@ -0,0 +1,130 @@
+"""
+Rapports PDF en tâche de fond.
+
+    tache = demander_rapport('UTILISATEURS_PDF', request.GET, request.user)
+    tache.est_disponible → fichier prêt (éventuellement celui d'une demande identique)
+
+Chaque type déclare son constructeur et sa fonction de version des données.
+Le constructeur reçoit (destination, parametres, progression) et écrit le PDF.
+Une demande identique (mêmes filtres, données inchangées) réutilise le
+fichier existant ou la tâche déjà en cours au lieu de tout reconstruire ;
+une tâche restée en attente ou en cours au-delà de DELAI_MAX_TACHE (message
+perdu, worker arrêté) est abandonnée et relancée.
+
+Les fichiers contiennent des données personnelles : ils sont écrits hors
+MEDIA_ROOT (StockagePrive), sous un nom imprévisible, et servis uniquement par
+settings:telecharger_rapport.
+"""
+import hashlib
+import json
+import logging
+import secrets
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DUREE_VIE = timedelta(hours=getattr(settings, 'REPORT_FILES_TTL_HOURS', 24))
+DELAI_MAX_TACHE = timedelta(minutes=getattr(settings, 'REPORT_TASK_TIMEOUT_MINUTES', 30))
+
+RAPPORTS = {
+    'UTILISATEURS_PDF': ('apps.accounts.exports.pdf_utilisateurs', 'apps.accounts.exports.version_comptes', 'utilisateurs'),
+    'DIRECTIONS_PDF':   ('apps.accounts.exports.pdf_directions',   'apps.accounts.exports.version_comptes', 'directions'),
+    'AGENCES_PDF':      ('apps.accounts.exports.pdf_agences',      'apps.accounts.exports.version_comptes', 'agences'),
+}
+
+
+def _parametres(params):
+    """Filtres non vides, triés (QueryDict ou dict) — la pagination ne compte pas"""
+    return {k: params.get(k) for k in sorted(params) if params.get(k) and k not in ('page', 'format')}
+
+
+def empreinte(type_rapport, parametres):
+    _, version, _ = RAPPORTS[type_rapport]
+    contenu = json.dumps(
+        {'type': type_rapport, 'parametres': parametres, 'version': import_string(version)()},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def demander_rapport(type_rapport, params, demandeur=None):
+    """Tâche existante réutilisable (prête ou en cours) ou nouvelle tâche mise en file"""
+    from .models import TacheRapport
+    from .tasks import generer_rapport
+
+    parametres = _parametres(params)
+    cle = empreinte(type_rapport, parametres)
+
+    tache = TacheRapport.objects.filter(empreinte=cle).exclude(statut='ECHEC').order_by('-cree_le').first()
+    if tache and tache.statut in ('EN_ATTENTE', 'EN_COURS'):
+        if tache.cree_le > timezone.now() - DELAI_MAX_TACHE:
+            return tache
+        # Tâche perdue : abandonnée (un message livré en retard ne la reprendra pas), puis relancée
+        TacheRapport.objects.filter(pk=tache.pk, statut=tache.statut).update(
+            statut='ECHEC', erreur='Délai dépassé : tâche relancée',
+        )
+    elif tache and tache.est_disponible:
+        return tache
+
+    tache = TacheRapport.objects.create(
+        type_rapport=type_rapport, parametres=parametres, empreinte=cle, demandeur=demandeur,
+    )
+    transaction.on_commit(lambda: generer_rapport.delay(tache.pk))
+    return tache
+
+
+def executer(tache):
+    """Construit le fichier d'une tâche réservée (statut EN_COURS), appelé par le worker"""
+    constructeur, _, prefixe = RAPPORTS[tache.type_rapport]
+    try:
+        with tempfile.TemporaryFile() as destination:
+            import_string(constructeur)(destination, tache.parametres, tache.progresser)
+            destination.seek(0)
+            nom = f"{prefixe}_{timezone.localtime():%Y%m%d_%H%M}_{secrets.token_urlsafe(12)}.pdf"
+            tache.fichier.save(nom, File(destination), save=False)
+    except Exception as e:
+        logger.exception(f"Échec du rapport {tache.pk} ({tache.type_rapport})")
+        tache.statut, tache.erreur = 'ECHEC', str(e)
+        tache.save(update_fields=['statut', 'erreur'])
+        return tache
+
+    maintenant = timezone.now()
+    tache.statut, tache.progression = 'TERMINE', 100
+    tache.termine_le, tache.expire_le = maintenant, maintenant + DUREE_VIE
+    tache.save(update_fields=['statut', 'progression', 'fichier', 'termine_le', 'expire_le'])
+    return tache
+
+
+# ════════════════════════════════════════════════════════════════
+# Tableaux découpés
+# ════════════════════════════════════════════════════════════════
+TAILLE_TABLEAU = 250
+
+
+def tableaux_par_lots(rl, entete, rangees, largeurs, style, taille=TAILLE_TABLEAU):
+    """
+    Un Table ReportLab par lot de `taille` lignes (en-tête répété) : la mise en
+    page d'un grand Table est superlinéaire, celle de petits tableaux successifs
+    reste linéaire. Génère les Table au fur et à mesure.
+    """
+    lot = []
+    for rangee in rangees:
+        lot.append(rangee)
+        if len(lot) == taille:
+            yield _tableau(rl, entete, lot, largeurs, style)
+            lot = []
+    if lot:
+        yield _tableau(rl, entete, lot, largeurs, style)
+
+
+def _tableau(rl, entete, lot, largeurs, style):
+    table = rl['Table']([entete] + lot, colWidths=largeurs, repeatRows=1)
+    table.setStyle(style)
+    return table
@@ -0,0 +1,90 @@
+"""
+Séries temporelles pour les graphes — une requête GROUP BY par série.
+
+    serie_temporelle(Ticket.objects.filter(statut='CONSOMME'), 'date_consommation',
+                     debut, fin, granularite='jour')
+    → [{'periode': date(…), 'total': 12}, …]   (périodes vides incluses)
+"""
+from datetime import datetime, time, timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.db import models
+from django.db.models import Count
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+GRANULARITES = {
+    'jour': 'day',
+    'semaine': 'week',
+    'mois': 'month',
+}
+
+
+def debut_periode(jour, granularite):
+    """Premier jour de la période (jour, lundi de la semaine, 1er du mois)"""
+    if granularite == 'semaine':
+        return jour - timedelta(days=jour.weekday())
+    if granularite == 'mois':
+        return jour.replace(day=1)
+    return jour
+
+
+def periodes(debut, fin, granularite='jour'):
+    """Liste dense des débuts de période entre deux dates incluses"""
+    pas = {
+        'jour': relativedelta(days=1),
+        'semaine': relativedelta(weeks=1),
+        'mois': relativedelta(months=1),
+    }[granularite]
+    courant, resultat = debut_periode(debut, granularite), []
+    while courant <= fin:
+        resultat.append(courant)
+        courant += pas
+    return resultat
+
+
+def bornes_periode(debut, fin):
+    """Bornes aware [début 00:00, lendemain de fin 00:00[ dans le fuseau courant"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(debut, time.min), tz),
+        timezone.make_aware(datetime.combine(fin + timedelta(days=1), time.min), tz),
+    )
+
+
+def filtrer_periode(queryset, champ_date, debut, fin):
+    """
+    Filtre [debut, fin] (dates incluses) sans __date : sur un DateTimeField,
+    bornes aware dans le fuseau courant pour que l'index reste utilisable.
+    """
+    champ = queryset.model._meta.get_field(champ_date)
+    if isinstance(champ, models.DateTimeField):
+        borne_min, borne_max = bornes_periode(debut, fin)
+        return queryset.filter(**{f'{champ_date}__gte': borne_min, f'{champ_date}__lt': borne_max})
+    return queryset.filter(**{f'{champ_date}__range': (debut, fin)})
+
+
+def serie_temporelle(queryset, champ_date, debut, fin, granularite='jour', valeurs=None):
+    """
+    Agrège `queryset` par période sur `champ_date`.
+    `valeurs` : {nom: agrégat}, par défaut {'total': Count('pk')}.
+    Retourne une ligne par période, de `debut` à `fin`, à 0 quand vide.
+    """
+    if granularite not in GRANULARITES:
+        raise ValueError(f"Granularité inconnue : {granularite}")
+    valeurs = valeurs or {'total': Count('pk')}
+
+    lignes = (
+        filtrer_periode(queryset, champ_date, debut, fin)
+        .annotate(periode=Trunc(champ_date, GRANULARITES[granularite], output_field=models.DateField()))
+        .order_by()
+        .values('periode')
+        .annotate(**valeurs)
+    )
+    totaux = {ligne['periode']: ligne for ligne in lignes}
+
+    serie = []
+    for periode in periodes(debut, fin, granularite):
+        ligne = totaux.get(periode, {})
+        serie.append({'periode': periode, **{nom: ligne.get(nom) or 0 for nom in valeurs}})
+    return serie
@@ -0,0 +1,16 @@
+"""
+Tâches de fond de l'application settings — rapports PDF
+"""
+from celery import shared_task
+
+
+@shared_task
+def generer_rapport(tache_id):
+    from .models import TacheRapport
+    from .rapports_pdf import executer
+
+    TacheRapport.purger_expirees()
+    # Réservation conditionnelle : un message livré deux fois ne construit qu'un fichier
+    if not TacheRapport.objects.filter(pk=tache_id, statut='EN_ATTENTE').update(statut='EN_COURS'):
+        return None
+    return executer(TacheRapport.objects.get(pk=tache_id)).statut
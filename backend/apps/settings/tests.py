@@ -1,3 +1,285 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts import exports as exports_comptes
+from apps.accounts.models import Direction, Utilisateur
+from apps.notifs.models import Notification
+from . import exportation, models, rapports_pdf
+from .models import ParametresSysteme, TacheRapport
+from .pagination import PARAMETRE, paginer_par_curseur
+from .series import serie_temporelle
+
+
+class ParametresSystemeCacheTests(TestCase):
+    """Paramètres système : une modification faite dans un autre processus est vue ici"""
+
+    def setUp(self):
+        cache.clear()
+        models._parametres_locaux.update(objet=None, version=None, verifie_le=0.0)
+
+    def test_cache_partage_entre_processus(self):
+        self.assertNotIsInstance(caches['default'], LocMemCache)
+
+    def test_modification_dans_un_autre_processus(self):
+        self.assertEqual(ParametresSysteme.charger().tickets_max_par_transaction, 20)
+
+        # Autre processus : la base et le jeton partagé changent, pas la copie locale d'ici
+        ParametresSysteme.objects.filter(pk=1).update(tickets_max_par_transaction=12)
+        cache.set(models.CLE_VERSION_PARAMETRES, 'autre-processus', None)
+        self.assertEqual(ParametresSysteme.charger().tickets_max_par_transaction, 20)
+
+        models._parametres_locaux['verifie_le'] = 0.0  # délai de vérification écoulé
+        self.assertEqual(ParametresSysteme.charger().tickets_max_par_transaction, 12)
+
+    def test_charger_sans_requete_en_regime_etabli(self):
+        ParametresSysteme.charger()
+        with self.assertNumQueries(0):
+            ParametresSysteme.charger()
+
+
+class SerieTemporelleTests(TestCase):
+    """Une requête GROUP BY par série, périodes vides à 0"""
+
+    @classmethod
+    def setUpTestData(cls):
+        utilisateur = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+        # 3 le 2 mars (la dernière à 23 h 30, heure locale), 1 le 4 mars, 1 hors période
+        for jour, heure in [(2, 8), (2, 12), (2, 23), (4, 23), (9, 10)]:
+            notification = Notification.objects.create(
+                destinataire=utilisateur, type_notification='SYSTEME', titre='Info', message='…',
+            )
+            cree_le = timezone.make_aware(datetime.combine(date(2026, 3, jour), time(heure, 30)))
+            Notification.objects.filter(pk=notification.pk).update(cree_le=cree_le)
+
+    def test_serie_par_jour(self):
+        with self.assertNumQueries(1):
+            serie = serie_temporelle(Notification.objects.all(), 'cree_le', date(2026, 3, 1), date(2026, 3, 5))
+        self.assertEqual(
+            [(ligne['periode'].day, ligne['total']) for ligne in serie],
+            [(1, 0), (2, 3), (3, 0), (4, 1), (5, 0)],
+        )
+
+    def test_serie_par_mois(self):
+        with self.assertNumQueries(1):
+            serie = serie_temporelle(
+                Notification.objects.all(), 'cree_le', date(2026, 2, 1), date(2026, 3, 31), granularite='mois',
+            )
+        self.assertEqual([ligne['total'] for ligne in serie], [0, 5])
+
+
+class ExportationTests(TestCase):
+    """Exports en flux : rien n'est lu avant l'envoi, puis une requête par paquet"""
+
+    COLONNES = [('Code', lambda d: d.code), ('Nom', lambda d: d.nom)]
+
+    @classmethod
+    def setUpTestData(cls):
+        Direction.objects.bulk_create([Direction(nom=f'Direction {i:02d}', code=f'D{i:02d}') for i in range(12)])
+
+    def test_csv_en_flux(self):
+        with self.assertNumQueries(0):
+            reponse = exportation.exporter(Direction.objects.all(), self.COLONNES, 'directions', par_cle=True)
+        self.assertTrue(reponse.streaming)
+        contenu = b''.join(reponse.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(contenu[0], 'Code,Nom')
+        self.assertEqual(len(contenu), 13)
+
+    def test_parcours_par_cle(self):
+        with self.assertNumQueries(4):  # 5 + 5 + 2, puis le paquet vide
+            codes = [d.code for d in exportation.parcourir_par_cle(Direction.objects.all(), taille_paquet=5)]
+        self.assertEqual(codes, [f'D{i:02d}' for i in range(12)])
+
+    @staticmethod
+    def premier_morceau_asgi(reponse):
+        """Premier morceau tel que le lit le serveur ASGI (async for sur la réponse)"""
+        async def lire():
+            morceaux = reponse.__aiter__()
+            morceau = await morceaux.__anext__()
+            await morceaux.aclose()
+            return morceau
+        return async_to_sync(lire)()
+
+    @mock.patch.object(exportation, 'LIGNES_PAR_ENVOI', 2)
+    def test_csv_en_flux_sous_asgi(self):
+        lues = []
+
+        def rangees():
+            for i in range(10):
+                lues.append(i)
+                yield [i]
+
+        reponse = exportation.reponse_csv(['N'], rangees(), 'n.csv')
+        self.assertEqual(self.premier_morceau_asgi(reponse).decode('utf-8-sig'), 'N\r\n0\r\n1\r\n')
+        self.assertEqual(lues, [0, 1])  # pas d'export entier chargé avant le premier envoi
+
+    def test_xlsx_en_flux_sous_asgi(self):
+        reponse = exportation.exporter(Direction.objects.all(), self.COLONNES, 'directions', format_export='xlsx')
+        reponse.block_size = 512
+        fichier = reponse.file_to_stream
+        self.assertGreater(fichier.seek(0, io.SEEK_END), 512)
+        fichier.seek(0)
+
+        self.assertEqual(len(self.premier_morceau_asgi(reponse)), 512)
+        self.assertEqual(fichier.tell(), 512)
+
+    @mock.patch.object(exportation, 'LIGNES_MAX_FEUILLE', 5)
+    def test_xlsx_feuilles_successives(self):
+        from openpyxl import load_workbook
+
+        reponse = exportation.exporter(Direction.objects.all(), self.COLONNES, 'directions', format_export='xlsx',
+                                       titre='Directions')
+        classeur = load_workbook(io.BytesIO(b''.join(reponse.streaming_content)), read_only=True)
+        self.assertEqual(classeur.sheetnames, ['Directions', 'Directions (2)', 'Directions (3)'])
+        self.assertEqual(sum(len(list(feuille.iter_rows())) - 1 for feuille in classeur.worksheets), 12)
+
+
+class PaginationCurseurTests(TestCase):
+    """Pagination par curseur : une requête par page, sans COUNT ni OFFSET, égalités comprises"""
+
+    @classmethod
+    def setUpTestData(cls):
+        utilisateur = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+        Notification.objects.bulk_create([
+            Notification(destinataire=utilisateur, type_notification='SYSTEME', titre=f'Info {i}', message='…')
+            for i in range(25)
+        ])
+        # Dates en double : l'id départage
+        instant = timezone.now()
+        Notification.objects.filter(pk__in=Notification.objects.order_by('pk').values('pk')[5:15]).update(cree_le=instant)
+
+    def page(self, curseur=None):
+        requete = RequestFactory().get('/', {PARAMETRE: curseur} if curseur else {})
+        return paginer_par_curseur(requete, Notification.objects.all(), 'cree_le', 10)
+
+    def test_parcours_complet(self):
+        vus, curseur, pages = [], None, []
+        while True:
+            with self.assertNumQueries(1):
+                page = self.page(curseur)
+                ids = [n.pk for n in page]
+            vus += ids
+            pages.append(page)
+            if not page.has_next():
+                break
+            curseur = page.curseur_suivant
+
+        attendus = list(Notification.objects.order_by('-cree_le', '-pk').values_list('pk', flat=True))
+        self.assertEqual(vus, attendus)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+
+        # Retour en arrière depuis la dernière page
+        with self.assertNumQueries(1):
+            precedente = [n.pk for n in self.page(pages[-1].curseur_precedent)]
+        self.assertEqual(precedente, attendus[10:20])
+
+    def test_curseur_invalide(self):
+        self.assertEqual(len(self.page('pas-un-curseur')), 10)
+        self.assertFalse(self.page('pas-un-curseur').has_previous())
+
+
+class RapportsPdfTests(TestCase):
+    """Rapports PDF en tâche de fond : demandes identiques partagées, progression, échec, fichiers privés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Direction.objects.bulk_create([Direction(nom=f'Direction {i:02d}', code=f'D{i:02d}') for i in range(3)])
+        cls.admin = Utilisateur.objects.create_user(
+            'admin@lonab.bf', 'secret', prenom='Awa', nom='Admin', type_utilisateur='ADMIN',
+        )
+
+    def setUp(self):
+        prive = tempfile.TemporaryDirectory()
+        self.addCleanup(prive.cleanup)
+        reglages = override_settings(PRIVATE_MEDIA_ROOT=prive.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.prive = prive.name
+
+    def demander(self, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            tache = rapports_pdf.demander_rapport('DIRECTIONS_PDF', params, self.admin)
+        tache.refresh_from_db()
+        return tache
+
+    def test_demande_identique_partagee(self):
+        with mock.patch.object(exports_comptes, 'pdf_directions', wraps=exports_comptes.pdf_directions) as construire:
+            premiere = self.demander()
+            seconde = self.demander(page='2')  # la pagination ne change pas le rapport
+        self.assertEqual(premiere.pk, seconde.pk)
+        self.assertEqual(construire.call_count, 1)
+        self.assertTrue(seconde.est_disponible)
+
+        Direction.objects.create(nom='Direction 99', code='D99')  # données modifiées : nouveau rapport
+        self.assertNotEqual(self.demander().pk, premiere.pk)
+
+    def test_tache_en_cours_reutilisee(self):
+        with mock.patch('apps.settings.tasks.generer_rapport.delay') as mise_en_file:
+            premiere = self.demander()
+            seconde = self.demander()
+        self.assertEqual(mise_en_file.call_count, 1)
+        self.assertEqual((premiere.pk, seconde.statut), (seconde.pk, 'EN_ATTENTE'))
+
+    def test_tache_perdue_relancee(self):
+        with mock.patch('apps.settings.tasks.generer_rapport.delay'):
+            perdue = self.demander()
+        TacheRapport.objects.filter(pk=perdue.pk).update(
+            statut='EN_COURS', cree_le=timezone.now() - rapports_pdf.DELAI_MAX_TACHE - timedelta(minutes=1),
+        )
+
+        relancee = self.demander()
+        self.assertNotEqual(relancee.pk, perdue.pk)
+        self.assertTrue(relancee.est_disponible)
+        perdue.refresh_from_db()
+        self.assertEqual(perdue.statut, 'ECHEC')
+
+    def test_progression(self):
+        with mock.patch.object(TacheRapport, 'progresser', autospec=True,
+                               side_effect=TacheRapport.progresser) as progresser:
+            tache = self.demander()
+        etapes = [appel.args[1] for appel in progresser.call_args_list]
+        self.assertTrue(etapes)
+        self.assertEqual(etapes, sorted(etapes))
+        self.assertLess(etapes[-1], 100)
+        self.assertEqual((tache.statut, tache.progression), ('TERMINE', 100))
+
+    def test_echec(self):
+        with mock.patch.object(exports_comptes, 'pdf_directions', side_effect=RuntimeError('ReportLab en panne')), \
+                self.assertLogs('apps.settings.rapports_pdf', 'ERROR'):
+            tache = self.demander()
+        self.assertEqual((tache.statut, tache.erreur), ('ECHEC', 'ReportLab en panne'))
+        self.assertFalse(tache.fichier)
+
+        # Une nouvelle demande ne reprend pas la tâche en échec
+        self.assertEqual(self.demander().statut, 'TERMINE')
+
+    def test_fichier_prive(self):
+        tache = self.demander()
+        chemin = tache.fichier.path
+        self.assertTrue(chemin.startswith(self.prive + os.sep))
+        self.assertNotIn(f'_{tache.pk}.pdf', chemin)  # nom imprévisible
+
+        url = reverse('settings:telecharger_rapport', args=[tache.pk])
+        client = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+        self.client.force_login(client)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        reponse = self.client.get(url)
+        self.assertEqual(reponse['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'%PDF'))
@@ -10,6 +10,8 @@ urlpatterns = [
     path('jours-feries/<int:pk>/delete/', views.jour_ferie_delete, name='jour_ferie_delete'),
 
     path('admin/reports/', views.admin_reports, name='admin_reports'),
+    path('rapports/<int:pk>/', views.rapport_tache, name='rapport_tache'),
+    path('rapports/<int:pk>/telecharger/', views.telecharger_rapport, name='telecharger_rapport'),
 
     path('api/params/', views.api_params, name='api_params'),
 ]
@@ -1,16 +1,19 @@
 """
 Vues pour l'application settings — paramètres système et audit
 """
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
 from django.db.models import Q, Count
+from django.urls import reverse
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
-from .models import ParametresSysteme, JournalAudit, JourFerie
+from .models import ParametresSysteme, JournalAudit, JourFerie, TacheRapport
+from .exportation import ReponseFichier
+from .facettes import compter_facettes
+from .pagination import paginer_par_curseur
 
 
 def _admin_required(request):
@@ -20,23 +23,8 @@ def _admin_required(request):
     return False
 
 def _base_ctx(request):
-    """Contexte commun à toutes les vues admin."""
-    ctx = {
-        'annee_courante': timezone.now().year,
-        'notifications': [],
-        'unread_notifications_count': 0,
-    }
-    try:
-        from apps.notifs.models import Notification
-        ctx['notifications'] = Notification.objects.filter(
-            destinataire=request.user, est_lu=False
-        ).order_by('-cree_le')[:5]
-        ctx['unread_notifications_count'] = Notification.objects.filter(
-            destinataire=request.user, est_lu=False
-        ).count()
-    except Exception:
-        pass
-    return ctx
+    """Contexte commun à toutes les vues admin (les notifications viennent du context processor)."""
+    return {'annee_courante': timezone.now().year}
 
 def _stats_base(aujourd_hui=None):
     """Calcule les stats communes (même logique que dashboard_admin)."""
@@ -154,8 +142,6 @@ def admin_settings(request):
 
     return render(request, 'settings/admin_settings.html', {
         'params': params,
-        'notifications': _get_notifs(request),
-        'unread_notifications_count': _count_unread(request),
     })
 
 
@@ -179,10 +165,10 @@ def admin_audit(request):
     date_fin = request.GET.get('date_fin', '').strip()
 
     if search:
+        from apps.accounts.recherche import filtre_personnes
         qs = qs.filter(
             Q(description__icontains=search) |
-            Q(utilisateur__prenom__icontains=search) |
-            Q(utilisateur__nom__icontains=search) |
+            filtre_personnes(search, 'utilisateur__') |
             Q(modele__icontains=search)
         )
     if action:
@@ -195,26 +181,23 @@ def admin_audit(request):
         qs = qs.filter(cree_le__date__lte=date_fin)
 
     # Stats
-    total_entrees = JournalAudit.objects.count()
-    entrees_aujourd_hui = JournalAudit.objects.filter(cree_le__date=aujourd_hui).count()
-    entrees_semaine = JournalAudit.objects.filter(cree_le__date__gte=aujourd_hui - timezone.timedelta(days=6)).count()
+    stats = compter_facettes(JournalAudit.objects.all(), {
+        'total_entrees':       None,
+        'entrees_aujourd_hui': Q(cree_le__date=aujourd_hui),
+        'entrees_semaine':     Q(cree_le__date__gte=aujourd_hui - timezone.timedelta(days=6)),
+    })
 
     from apps.accounts.models import Utilisateur
     nb_utilisateurs_actifs = Utilisateur.objects.filter(est_actif=True).count()
 
-    paginator = Paginator(qs, 50)
-    page_obj = paginator.get_page(request.GET.get('page', 1))
+    page_obj = paginer_par_curseur(request, qs, 'cree_le', 50)
 
     return render(request, 'settings/admin_audit.html', {
         'entrees': page_obj,
         'page_obj': page_obj,
-        'total_entrees': total_entrees,
-        'entrees_aujourd_hui': entrees_aujourd_hui,
-        'entrees_semaine': entrees_semaine,
+        **stats,
         'nb_utilisateurs_actifs': nb_utilisateurs_actifs,
         'filtres': {'search': search, 'action': action, 'modele': modele, 'date_debut': date_debut, 'date_fin': date_fin},
-        'notifications': _get_notifs(request),
-        'unread_notifications_count': _count_unread(request),
     })
 
 
@@ -258,9 +241,9 @@ def admin_reports(request):
         messages.warning(request, 'Accès refusé.')
         return redirect('accounts:dashboard')
 
-    from dateutil.relativedelta import relativedelta
-    from django.db.models import Sum, Count
+    from datetime import date
     from apps.accounts.models import Agence
+    from .rapports import generer_rapport
 
     aujourd_hui = timezone.now().date()
 
@@ -272,134 +255,79 @@ def admin_reports(request):
 
     agences_qs = Agence.objects.filter(est_active=True).order_by('nom')
 
-    # ── Récapitulatif par agence ──────────────────────────────────
-    rapport_agences = []
+    # ── Rapport (requêtes groupées, mis en cache par période/agence) ──
     try:
-        from apps.tickets.models import Ticket
-        from apps.transactions.models import TransactionTicket
-        params = ParametresSysteme.charger()
-
-        qs_agences = agences_qs
-        if agence_id:
-            qs_agences = qs_agences.filter(pk=agence_id)
-
-        for a in qs_agences:
-            # Tickets achetés = créés dans la période pour les employés de cette agence
-            tickets_achetes = Ticket.objects.filter(
-                proprietaire__agence=a,
-                date_creation__date__gte=date_debut,
-                date_creation__date__lte=date_fin,
-            ).count()
-
-            # Tickets consommés dans la période
-            tickets_consommes = Ticket.objects.filter(
-                proprietaire__agence=a,
-                statut='CONSOMME',
-                date_consommation__date__gte=date_debut,
-                date_consommation__date__lte=date_fin,
-            ).count()
-
-            # Transactions terminées dans la période
-            txs_agg = TransactionTicket.objects.filter(
-                client__agence=a,
-                statut='TERMINEE',
-                date_transaction__date__gte=date_debut,
-                date_transaction__date__lte=date_fin,
-            ).aggregate(
-                montant=Sum('montant_total'),
-                subv=Sum('subvention_totale'),
-            )
-
-            a.tickets_achetes    = tickets_achetes
-            a.tickets_consommes  = tickets_consommes
-            a.montant_total      = txs_agg['montant']  or 0
-            a.subvention         = txs_agg['subv']     or 0
-            a.nb_employes        = a.employes.filter(type_utilisateur='CLIENT', est_actif=True).count()
-            rapport_agences.append(a)
-
-    except Exception:
-        pass
-
-    # ── Totaux globaux (période filtrée) ──────────────────────────
-    totaux = {'tickets': 0, 'consommes': 0, 'montant': 0, 'subvention': 0, 'employes': 0}
-    for a in rapport_agences:
-        totaux['tickets']    += a.tickets_achetes
-        totaux['consommes']  += a.tickets_consommes
-        totaux['montant']    += float(a.montant_total)
-        totaux['subvention'] += float(a.subvention)
-        totaux['employes']   += a.nb_employes
-
-    # ── Graphe 12 mois glissants ──────────────────────────────────
-    graph_labels          = []
-    graph_mensuel_tickets = []
-    graph_mensuel_montants= []
-    try:
-        from apps.tickets.models import Ticket
-        from apps.transactions.models import TransactionTicket
-
-        debut_graph = aujourd_hui.replace(day=1) - relativedelta(months=11)
-        for i in range(12):
-            debut_m = debut_graph + relativedelta(months=i)
-            fin_m   = debut_m    + relativedelta(months=1) - relativedelta(days=1)
-
-            qs_t = Ticket.objects.filter(
-                date_creation__date__gte=debut_m,
-                date_creation__date__lte=fin_m,
-            )
-            qs_tx = TransactionTicket.objects.filter(
-                statut='TERMINEE',
-                date_transaction__date__gte=debut_m,
-                date_transaction__date__lte=fin_m,
-            )
-            if agence_id:
-                qs_t  = qs_t.filter(proprietaire__agence_id=agence_id)
-                qs_tx = qs_tx.filter(client__agence_id=agence_id)
-
-            agg = qs_tx.aggregate(montant=Sum('montant_total'))
-            graph_labels.append(debut_m.strftime('%b %Y'))
-            graph_mensuel_tickets.append(qs_t.count())
-            graph_mensuel_montants.append(float(agg['montant'] or 0))
-
-    except Exception:
-        graph_labels           = []
-        graph_mensuel_tickets  = [0] * 12
-        graph_mensuel_montants = [0.0] * 12
-
-    # ── Top restaurants (consommations période) ───────────────────
-    top_restaurants = []
-    try:
-        from apps.transactions.models import LogConsommation
-        top_restaurants = (
-            LogConsommation.objects
-            .filter(
-                date_consommation__date__gte=date_debut,
-                date_consommation__date__lte=date_fin,
-            )
-            .values('restaurant__nom')
-            .annotate(nb=Count('id'))
-            .order_by('-nb')[:5]
+        rapport = generer_rapport(
+            date.fromisoformat(date_debut),
+            date.fromisoformat(date_fin),
+            int(agence_id) if agence_id.isdigit() else None,
         )
-    except Exception:
-        pass
+    except ValueError:
+        messages.error(request, 'Période invalide.')
+        rapport = {
+            'agences': [], 'top_restaurants': [],
+            'totaux': {'tickets': 0, 'consommes': 0, 'montant': 0, 'subvention': 0, 'employes': 0},
+            'mensuel': {'labels': [], 'tickets': [0] * 12, 'montants': [0.0] * 12},
+        }
 
     return render(request, 'settings/admin_reports.html', {
         'agences':               agences_qs,
-        'rapport_agences':       rapport_agences,
-        'totaux':                totaux,
-        'top_restaurants':       top_restaurants,
-        'graph_labels':          graph_labels,
-        'graph_mensuel_tickets': graph_mensuel_tickets,
-        'graph_mensuel_montants':graph_mensuel_montants,
+        'rapport_agences':       rapport['agences'],
+        'totaux':                rapport['totaux'],
+        'top_restaurants':       rapport['top_restaurants'],
+        'graph_labels':          rapport['mensuel']['labels'],
+        'graph_mensuel_tickets': rapport['mensuel']['tickets'],
+        'graph_mensuel_montants':rapport['mensuel']['montants'],
         'filtres': {
             'date_debut': date_debut,
             'date_fin':   date_fin,
             'agence':     agence_id,
             'type':       type_rpt,
         },
-        'notifications':              _get_notifs(request),
-        'unread_notifications_count': _count_unread(request),
     })
 
+# ════════════════════════════════════════════════════════════════
+# Rapports PDF en tâche de fond — suivi et téléchargement
+# ════════════════════════════════════════════════════════════════
+def _etat_tache(tache):
+    return {
+        'statut':      tache.statut,
+        'progression': tache.progression,
+        'erreur':      tache.erreur,
+        'url':         reverse('settings:telecharger_rapport', args=[tache.pk]) if tache.est_disponible else None,
+    }
+
+
+@login_required
+def rapport_tache(request, pk):
+    """Page de suivi d'une tâche de rapport (JSON si ?format=json ou requête AJAX)"""
+    if _admin_required(request):
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'error': 'Accès refusé'}, status=403)
+        messages.warning(request, 'Accès refusé.')
+        return redirect('accounts:dashboard')
+
+    tache = get_object_or_404(TacheRapport, pk=pk)
+    if request.GET.get('format') == 'json' or request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse(_etat_tache(tache))
+    return render(request, 'settings/rapport_tache.html', {'tache': tache, 'etat': _etat_tache(tache)})
+
+
+@login_required
+def telecharger_rapport(request, pk):
+    if _admin_required(request):
+        messages.warning(request, 'Accès refusé.')
+        return redirect('accounts:dashboard')
+
+    tache = get_object_or_404(TacheRapport, pk=pk)
+    if not tache.est_disponible:
+        raise Http404('Rapport indisponible ou expiré')
+    return ReponseFichier(
+        tache.fichier.open('rb'), as_attachment=True,
+        filename=tache.fichier.name.rsplit('/', 1)[-1], content_type='application/pdf',
+    )
+
+
 # ════════════════════════════════════════════════════════════════
 # API — Paramètres publics (pour les apps internes)
 # ════════════════════════════════════════════════════════════════
@@ -429,17 +357,3 @@ def _get_client_ip(request):
     if x_forwarded:
         return x_forwarded.split(',')[0].strip()
     return request.META.get('REMOTE_ADDR')
-
-def _get_notifs(request):
-    try:
-        from apps.notifs.models import Notification
-        return Notification.objects.filter(destinataire=request.user, est_lu=False).order_by('-cree_le')[:5]
-    except Exception:
-        return []
-
-def _count_unread(request):
-    try:
-        from apps.notifs.models import Notification
-        return Notification.objects.filter(destinataire=request.user, est_lu=False).count()
-    except Exception:
-        return 0
\ No newline at end of file
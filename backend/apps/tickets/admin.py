@@ -4,7 +4,7 @@ Administration — App Tickets
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import Ticket, CodeQR
+from .models import Ticket, CodeQR, SequenceTicket, PorteMonnaieTicket, StatistiqueCodeQR
 
 
 # ================================================================
@@ -119,45 +119,34 @@ class TicketAdmin(admin.ModelAdmin):
 
     @admin.action(description='✓ Marquer comme disponibles')
     def marquer_disponibles(self, request, queryset):
-        count = queryset.exclude(statut='CONSOMME').update(statut='DISPONIBLE')
+        count = PorteMonnaieTicket.changer_statut(queryset.exclude(statut='CONSOMME'), 'DISPONIBLE')
         self.message_user(request, f'{count} ticket(s) marqué(s) comme disponible(s).')
 
     @admin.action(description='✗ Marquer comme annulés')
     def marquer_annules(self, request, queryset):
-        count = queryset.exclude(statut='CONSOMME').update(statut='ANNULE')
+        count = PorteMonnaieTicket.changer_statut(queryset.exclude(statut='CONSOMME'), 'ANNULE')
         self.message_user(request, f'{count} ticket(s) annulé(s).')
 
     @admin.action(description='⏰ Marquer comme expirés')
     def marquer_expires(self, request, queryset):
-        count = queryset.filter(statut='DISPONIBLE').update(statut='EXPIRE')
+        count = PorteMonnaieTicket.changer_statut(queryset.filter(statut='DISPONIBLE'), 'EXPIRE')
         self.message_user(request, f'{count} ticket(s) marqué(s) comme expirés.')
 
     @admin.action(description='📥 Exporter en CSV')
     def exporter_csv(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="tickets.csv"'
-        response.write('\ufeff')
-        writer = csv.writer(response)
-        writer.writerow([
-            'N° Ticket', 'Propriétaire', 'Matricule',
-            'Statut', 'Valide du', 'Valide au',
-            'Prix payé', 'Restaurant', 'Date consommation',
-        ])
-        for t in queryset.select_related('proprietaire', 'restaurant_consommateur'):
-            writer.writerow([
-                t.numero_ticket,
-                t.proprietaire.get_full_name(),
-                t.proprietaire.matricule or '',
-                t.statut,
-                t.valide_de.strftime('%d/%m/%Y') if t.valide_de else '',
-                t.valide_jusqua.strftime('%d/%m/%Y') if t.valide_jusqua else '',
-                t.prix_paye,
-                t.restaurant_consommateur.nom if t.restaurant_consommateur else '',
-                t.date_consommation.strftime('%d/%m/%Y %H:%M') if t.date_consommation else '',
-            ])
-        return response
+        from apps.settings.exportation import exporter
+        colonnes = [
+            ('N° Ticket',         lambda t: t.numero_ticket),
+            ('Propriétaire',      lambda t: t.proprietaire.get_full_name()),
+            ('Matricule',         lambda t: t.proprietaire.matricule or ''),
+            ('Statut',            lambda t: t.statut),
+            ('Valide du',         lambda t: t.valide_de.strftime('%d/%m/%Y') if t.valide_de else ''),
+            ('Valide au',         lambda t: t.valide_jusqua.strftime('%d/%m/%Y') if t.valide_jusqua else ''),
+            ('Prix payé',         lambda t: t.prix_paye),
+            ('Restaurant',        lambda t: t.restaurant_consommateur.nom if t.restaurant_consommateur else ''),
+            ('Date consommation', lambda t: t.date_consommation.strftime('%d/%m/%Y %H:%M') if t.date_consommation else ''),
+        ]
+        return exporter(queryset.select_related('proprietaire', 'restaurant_consommateur'), colonnes, 'tickets')
 
 
 # ================================================================
@@ -184,7 +173,7 @@ class CodeQRAdmin(admin.ModelAdmin):
         'utilisateur__email', 'utilisateur__matricule',
     )
     readonly_fields = (
-        'code', 'image_qr', 'date_creation',
+        'code', 'apercu_qr', 'date_creation',
         'utilisateur', 'expire_le',
         'utilise_le', 'utilise_par_restaurant',
     )
@@ -194,7 +183,7 @@ class CodeQRAdmin(admin.ModelAdmin):
 
     fieldsets = (
         ('📱 Code QR', {
-            'fields': ('code', 'image_qr', 'donnees_tickets'),
+            'fields': ('code', 'apercu_qr', 'donnees_tickets'),
         }),
         ('👤 Utilisateur', {
             'fields': ('utilisateur',),
@@ -218,6 +207,12 @@ class CodeQRAdmin(admin.ModelAdmin):
     def code_display(self, obj):
         return format_html('<code style="font-size:11px;">{}</code>', obj.code[:16] + '…')
 
+    @admin.display(description='Image QR')
+    def apercu_qr(self, obj):
+        if not obj.pk:
+            return '—'
+        return format_html('<img src="{}" alt="QR" style="width:160px;height:160px;">', obj.url_image)
+
     @admin.display(description='Utilisateur', ordering='utilisateur__nom')
     def utilisateur_display(self, obj):
         return format_html(
@@ -274,25 +269,69 @@ class CodeQRAdmin(admin.ModelAdmin):
 
     @admin.action(description='📥 Exporter en CSV')
     def exporter_csv(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="codes_qr.csv"'
-        response.write('\ufeff')
-        writer = csv.writer(response)
-        writer.writerow([
-            'Code', 'Utilisateur', 'Valide', 'Utilisé',
-            'Expire le', 'Utilisé le', 'Restaurant', 'Créé le',
-        ])
-        for qr in queryset.select_related('utilisateur', 'utilise_par_restaurant'):
-            writer.writerow([
-                qr.code,
-                qr.utilisateur.get_full_name(),
-                'Oui' if qr.est_valide else 'Non',
-                'Oui' if qr.est_utilise else 'Non',
-                qr.expire_le.strftime('%d/%m/%Y %H:%M') if qr.expire_le else '',
-                qr.utilise_le.strftime('%d/%m/%Y %H:%M') if qr.utilise_le else '',
-                qr.utilise_par_restaurant.nom if qr.utilise_par_restaurant else '',
-                qr.date_creation.strftime('%d/%m/%Y %H:%M') if qr.date_creation else '',
-            ])
-        return response
+        from apps.settings.exportation import exporter
+        colonnes = [
+            ('Code',        lambda qr: qr.code),
+            ('Utilisateur', lambda qr: qr.utilisateur.get_full_name()),
+            ('Valide',      lambda qr: 'Oui' if qr.est_valide else 'Non'),
+            ('Utilisé',     lambda qr: 'Oui' if qr.est_utilise else 'Non'),
+            ('Expire le',   lambda qr: qr.expire_le.strftime('%d/%m/%Y %H:%M') if qr.expire_le else ''),
+            ('Utilisé le',  lambda qr: qr.utilise_le.strftime('%d/%m/%Y %H:%M') if qr.utilise_le else ''),
+            ('Restaurant',  lambda qr: qr.utilise_par_restaurant.nom if qr.utilise_par_restaurant else ''),
+            ('Créé le',     lambda qr: qr.date_creation.strftime('%d/%m/%Y %H:%M') if qr.date_creation else ''),
+        ]
+        return exporter(queryset.select_related('utilisateur', 'utilise_par_restaurant'), colonnes, 'codes_qr')
+
+
+# ================================================================
+# SÉQUENCES DE NUMÉROTATION
+# ================================================================
+
+@admin.register(SequenceTicket)
+class SequenceTicketAdmin(admin.ModelAdmin):
+
+    list_display = ('periode', 'dernier_numero', 'modifie_le')
+    readonly_fields = ('periode', 'dernier_numero', 'modifie_le')
+    ordering = ('-periode',)
+
+    def has_add_permission(self, request):
+        return False
+
+
+# ================================================================
+# PORTE-MONNAIE DE TICKETS
+# ================================================================
+
+@admin.register(PorteMonnaieTicket)
+class PorteMonnaieTicketAdmin(admin.ModelAdmin):
+
+    list_display = ('utilisateur', 'valide_de', 'valide_jusqua', 'disponibles', 'consommes',
+                    'annules', 'expires', 'valeur_disponible', 'modifie_le')
+    list_select_related = ('utilisateur',)
+    search_fields = (
+        'utilisateur__prenom', 'utilisateur__nom',
+        'utilisateur__email', 'utilisateur__matricule',
+    )
+    date_hierarchy = 'valide_de'
+    readonly_fields = ('utilisateur', 'valide_de', 'valide_jusqua', 'disponibles', 'consommes',
+                       'annules', 'expires', 'valeur_disponible', 'valeur_totale', 'modifie_le')
+    ordering = ('-valide_de',)
+
+    def has_add_permission(self, request):
+        return False
+
+
+# ================================================================
+# STATISTIQUES DES CODES QR
+# ================================================================
+
+@admin.register(StatistiqueCodeQR)
+class StatistiqueCodeQRAdmin(admin.ModelAdmin):
+
+    list_display = ('date', 'generes', 'utilises')
+    date_hierarchy = 'date'
+    readonly_fields = ('date', 'generes', 'utilises')
+    ordering = ('-date',)
+
+    def has_add_permission(self, request):
+        return False
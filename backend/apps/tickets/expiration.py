@@ -0,0 +1,73 @@
+"""
+Expiration des tickets : DISPONIBLE → EXPIRE une fois valide_jusqua passé.
+
+Parcours par clé primaire (WHERE id > dernier ... ORDER BY id LIMIT n) :
+chaque lot est une transaction courte qui verrouille n lignes au plus,
+passe leur statut et ajuste les porte-monnaie concernés. Aucun verrou long,
+aucun OFFSET ; un passage interrompu reprend simplement au suivant.
+
+    expirer_tickets(taille_lot=1000)
+    → {'expires': 48000, 'lots': 48, 'duree_s': 6.1, 'tickets_par_seconde': 7868.9}
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = getattr(settings, 'TICKET_EXPIRY_BATCH_SIZE', 1000)
+CLE_VERROU = 'tickets:expiration'
+DUREE_VERROU = 3600
+
+
+def tickets_a_expirer(jour=None):
+    """Tickets encore disponibles dont la validité s'est terminée avant `jour` (aujourd'hui par défaut)"""
+    from .models import Ticket
+
+    return Ticket.objects.filter(statut='DISPONIBLE', valide_jusqua__lt=jour or timezone.localdate())
+
+
+def expirer_tickets(jour=None, taille_lot=TAILLE_LOT, pause=0):
+    """
+    Expire les tickets échus, `taille_lot` par transaction (`pause` secondes
+    entre deux lots). Un seul passage à la fois (retourne None si un autre est
+    en cours) ; retourne les compteurs et le débit.
+    """
+    from apps.settings.facettes import invalider as invalider_facettes
+    from .models import PorteMonnaieTicket
+
+    if not cache.add(CLE_VERROU, 1, DUREE_VERROU):
+        logger.info("Expiration des tickets déjà en cours, ignorée")
+        return None
+
+    stats = {'expires': 0, 'lots': 0}
+    debut = time.monotonic()
+    try:
+        candidats, dernier = tickets_a_expirer(jour), 0
+        while True:
+            with transaction.atomic():
+                lot = list(
+                    candidats.filter(pk__gt=dernier).select_for_update()
+                    .order_by('pk').values_list('pk', flat=True)[:taille_lot]
+                )
+                if not lot:
+                    break
+                stats['expires'] += PorteMonnaieTicket.changer_statut_lot(lot, 'EXPIRE')
+            dernier = lot[-1]
+            stats['lots'] += 1
+            if pause:
+                time.sleep(pause)
+    finally:
+        cache.delete(CLE_VERROU)
+
+    if stats['expires']:
+        # Pastilles « disponibles / expirés » des listes
+        invalider_facettes()
+    stats['duree_s'] = round(time.monotonic() - debut, 3)
+    stats['tickets_par_seconde'] = round(stats['expires'] / stats['duree_s'], 1) if stats['duree_s'] else 0.0
+    logger.info(f"Expiration des tickets : {stats}")
+    return stats
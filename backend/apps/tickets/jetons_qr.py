@@ -0,0 +1,109 @@
+"""
+Jetons QR signés (format v2) : le scanner rejette un code falsifié, expiré ou
+déjà consommé sans interroger la base.
+
+    Q2.<utilisateur_id>.<expiration unix>.<nonce>.<signature>
+
+La signature est un HMAC-SHA256 (tronqué à 128 bits) du reste du jeton, clé
+dérivée de SECRET_KEY (les SECRET_KEY_FALLBACKS restent acceptées le temps
+d'une rotation). Seul un jeton authentique et non expiré va jusqu'à la base,
+qui reste l'autorité : code remplacé (est_valide), consommation conditionnelle.
+
+Les nonces consommés sont gardés en mémoire (par processus, LRU borné)
+jusqu'à l'expiration du jeton pour refuser un rejeu sans requête — le cache
+partagé de Django est en base par défaut et coûterait une requête par scan.
+C'est un raccourci, pas une garantie : un rejeu scanné par un autre processus
+est refusé par CodeQR.marquer_comme_utilise.
+
+Les anciens codes (sha256 hexadécimal) restent vérifiés en base ; l'émission
+suit QR_CODE_TOKEN_VERSION (2 par défaut, 1 pour revenir à l'ancien format).
+"""
+import base64
+import secrets
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone as tz
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PREFIXE = 'Q2'
+SEL = 'apps.tickets.jetons_qr.v2'
+OCTETS_NONCE = 9
+OCTETS_SIGNATURE = 16
+VERSION_EMISE = getattr(settings, 'QR_CODE_TOKEN_VERSION', 2)
+TAILLE_NONCES = 10000
+
+_nonces = OrderedDict()  # nonce -> expiration (horodatage unix)
+_verrou = Lock()
+
+Jeton = namedtuple('Jeton', 'utilisateur_id expire_le nonce')
+
+
+def _b64(octets):
+    return base64.urlsafe_b64encode(octets).rstrip(b'=').decode()
+
+
+def _signature(message, cle):
+    return _b64(salted_hmac(SEL, message, secret=cle, algorithm='sha256').digest()[:OCTETS_SIGNATURE])
+
+
+def est_jeton(code):
+    """True pour un code au format v2 (sinon : ancien format, vérifié en base)"""
+    return (code or '').startswith(PREFIXE + '.')
+
+
+def emettre(utilisateur_id, expire_le):
+    """Nouveau jeton signé pour l'utilisateur, valable jusqu'à `expire_le`"""
+    message = f"{PREFIXE}.{int(utilisateur_id)}.{int(expire_le.timestamp())}.{_b64(secrets.token_bytes(OCTETS_NONCE))}"
+    return f"{message}.{_signature(message, settings.SECRET_KEY)}"
+
+
+def lire(code, maintenant=None):
+    """
+    Jeton vérifié en mémoire (signature, expiration, nonce consommé).
+    Lève ValidationError si le code est refusé.
+    """
+    parties = code.split('.')
+    if len(parties) != 5 or not parties[1].isdigit() or not parties[2].isdigit():
+        raise ValidationError('Code QR invalide', code='invalide')
+    message, signature = code.rsplit('.', 1)
+    cles = [settings.SECRET_KEY, *getattr(settings, 'SECRET_KEY_FALLBACKS', [])]
+    if not any(constant_time_compare(signature, _signature(message, cle)) for cle in cles):
+        raise ValidationError('Code QR invalide', code='invalide')
+
+    jeton = Jeton(int(parties[1]), datetime.fromtimestamp(int(parties[2]), tz=tz.utc), parties[3])
+    if (maintenant or timezone.now()) > jeton.expire_le:
+        raise ValidationError('Code QR expiré', code='expire')
+    if _nonce_consomme(jeton.nonce):
+        raise ValidationError('Code QR déjà utilisé', code='deja_utilise')
+    return jeton
+
+
+def _nonce_consomme(nonce):
+    with _verrou:
+        expire = _nonces.get(nonce)
+        return expire is not None and expire > time.time()
+
+
+def marquer_consomme(code, expire_le):
+    """Retient le nonce du jeton jusqu'à son expiration (au-delà, l'expiration suffit)"""
+    expire = expire_le.timestamp()
+    maintenant = time.time()
+    if not est_jeton(code) or expire <= maintenant:
+        return
+    nonce = code.split('.')[3]
+    with _verrou:
+        _nonces[nonce] = expire
+        _nonces.move_to_end(nonce)
+        # Les plus anciens d'abord : expirés ou au-delà de la taille maximale
+        while _nonces and (len(_nonces) > TAILLE_NONCES or next(iter(_nonces.values())) <= maintenant):
+            _nonces.popitem(last=False)
+
+
+def verifier(code):
+    """Jeton v2 vérifié, ou None pour un code de l'ancien format ; ValidationError si refusé"""
+    return lire(code) if est_jeton(code) else None
@@ -0,0 +1,40 @@
+"""
+Passe au statut EXPIRE les tickets disponibles dont la validité est terminée.
+
+    python manage.py expirer_tickets
+    python manage.py expirer_tickets --taille-lot 5000 --pause 0.1
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tickets.expiration import TAILLE_LOT, expirer_tickets
+
+
+class Command(BaseCommand):
+    help = "Expire par lots les tickets disponibles dont la validité est terminée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT,
+                            help=f'Tickets par transaction (défaut {TAILLE_LOT})')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Pause entre deux lots, en secondes (défaut 0)')
+        parser.add_argument('--jour', help="Date de référence (AAAA-MM-JJ) ; par défaut aujourd'hui")
+
+    def handle(self, *args, **options):
+        jour = None
+        if options['jour']:
+            try:
+                jour = date.fromisoformat(options['jour'])
+            except ValueError:
+                raise CommandError('Format de date attendu : AAAA-MM-JJ')
+
+        stats = expirer_tickets(jour, taille_lot=options['taille_lot'], pause=options['pause'])
+        if stats is None:
+            self.stdout.write(self.style.WARNING("Une expiration est déjà en cours."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['expires']} ticket(s) expiré(s) en {stats['lots']} lot(s) — "
+            f"{stats['duree_s']} s, {stats['tickets_par_seconde']} tickets/s."
+        ))
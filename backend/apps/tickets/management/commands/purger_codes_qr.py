@@ -0,0 +1,46 @@
+"""
+Supprime les codes QR hors rétention et les images QR orphelines.
+
+    python manage.py purger_codes_qr
+    python manage.py purger_codes_qr --jours 3 --jours-utilises 30
+    python manage.py purger_codes_qr --images-seulement --simulation
+"""
+from django.core.management.base import BaseCommand
+
+from apps.tickets.purge_qr import (
+    RETENTION_JOURS, RETENTION_UTILISES_JOURS, TAILLE_LOT, nettoyer_images, purger_codes,
+)
+
+
+class Command(BaseCommand):
+    help = "Purge les codes QR expirés ou anciens et les images QR orphelines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=RETENTION_JOURS,
+                            help=f'Rétention des codes expirés non utilisés, en jours (défaut {RETENTION_JOURS})')
+        parser.add_argument('--jours-utilises', type=int, default=RETENTION_UTILISES_JOURS,
+                            help=f'Rétention des codes utilisés, en jours (défaut {RETENTION_UTILISES_JOURS})')
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT,
+                            help=f'Codes supprimés par transaction (défaut {TAILLE_LOT})')
+        parser.add_argument('--images-seulement', action='store_true',
+                            help='Ne traite que les images orphelines')
+        parser.add_argument('--simulation', action='store_true',
+                            help='Images : compte les orphelines sans les effacer')
+
+    def handle(self, *args, **options):
+        if not options['images_seulement'] and not options['simulation']:
+            stats = purger_codes(jours=options['jours'], jours_utilises=options['jours_utilises'],
+                                 taille_lot=options['taille_lot'])
+            if stats is None:
+                self.stdout.write(self.style.WARNING("Une purge est déjà en cours."))
+                return
+            self.stdout.write(self.style.SUCCESS(
+                f"{stats['supprimes']} code(s) supprimé(s) en {stats['lots']} lot(s) — "
+                f"{stats['duree_s']} s, {stats['codes_par_seconde']} codes/s."
+            ))
+
+        images = nettoyer_images(simulation=options['simulation'])
+        verbe = 'à effacer' if options['simulation'] else 'effacée(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f"{images['fichiers']} image(s) parcourue(s), {images['supprimes']} orpheline(s) {verbe} — {images['duree_s']} s."
+        ))
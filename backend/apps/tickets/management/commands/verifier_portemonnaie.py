@@ -0,0 +1,71 @@
+"""
+Vérifie les soldes des porte-monnaie de tickets : recalcul depuis Ticket,
+comparaison avec PorteMonnaieTicket, rapport des écarts.
+
+    python manage.py verifier_portemonnaie
+    python manage.py verifier_portemonnaie --corriger
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.tickets.models import PorteMonnaieTicket
+
+CLE = ('proprietaire_id', 'valide_de', 'valide_jusqua')
+
+
+class Command(BaseCommand):
+    help = "Recalcule les soldes des porte-monnaie depuis les tickets et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corriger', action='store_true',
+                            help='Réécrit les soldes en écart avec les valeurs recalculées')
+        parser.add_argument('--limite', type=int, default=20,
+                            help="Nombre d'écarts détaillés dans le rapport (défaut 20)")
+
+    def handle(self, *args, **options):
+        champs = PorteMonnaieTicket.CHAMPS_SOLDE
+        enregistres = {
+            (ligne['utilisateur_id'], ligne['valide_de'], ligne['valide_jusqua']): ligne
+            for ligne in PorteMonnaieTicket.objects.values('id', 'utilisateur_id', 'valide_de', 'valide_jusqua', *champs)
+        }
+
+        ecarts, verifies = [], 0
+        for attendu in PorteMonnaieTicket.soldes_attendus().iterator():
+            verifies += 1
+            cle = tuple(attendu[c] for c in CLE)
+            ligne = enregistres.pop(cle, None)
+            actuel = {c: ligne[c] if ligne else 0 for c in champs}
+            if any(actuel[c] != attendu[c] for c in champs):
+                ecarts.append((cle, ligne, actuel, {c: attendu[c] for c in champs}))
+        # Lignes sans aucun ticket : attendu à zéro
+        for cle, ligne in enregistres.items():
+            actuel = {c: ligne[c] for c in champs}
+            if any(actuel.values()):
+                ecarts.append((cle, ligne, actuel, dict.fromkeys(champs, 0)))
+
+        for (utilisateur_id, valide_de, valide_jusqua), _, actuel, attendu in ecarts[:options['limite']]:
+            differences = ', '.join(
+                f"{c} {actuel[c]} → {attendu[c]}" for c in champs if actuel[c] != attendu[c]
+            )
+            self.stdout.write(f"  utilisateur {utilisateur_id} {valide_de} → {valide_jusqua} : {differences}")
+        if len(ecarts) > options['limite']:
+            self.stdout.write(f"  … et {len(ecarts) - options['limite']} autre(s)")
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS(f"{verifies} solde(s) vérifié(s), aucun écart."))
+            return
+        if not options['corriger']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(ecarts)} écart(s) sur {verifies} solde(s). Relancer avec --corriger pour les réécrire."
+            ))
+            return
+
+        with transaction.atomic():
+            for (utilisateur_id, valide_de, valide_jusqua), ligne, _, attendu in ecarts:
+                if ligne:
+                    PorteMonnaieTicket.objects.filter(pk=ligne['id']).update(**attendu)
+                else:
+                    PorteMonnaieTicket.objects.create(
+                        utilisateur_id=utilisateur_id, valide_de=valide_de, valide_jusqua=valide_jusqua, **attendu
+                    )
+        self.stdout.write(self.style.SUCCESS(f"{len(ecarts)} solde(s) corrigé(s) sur {verifies}."))
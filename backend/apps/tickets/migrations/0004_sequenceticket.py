@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_alter_ticket_valide_par'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(max_length=6, unique=True, verbose_name='Période (AAAAMM)')),
+                ('dernier_numero', models.PositiveIntegerField(default=0, verbose_name='Dernier numéro attribué')),
+                ('modifie_le', models.DateTimeField(auto_now=True, verbose_name='Modifié le')),
+            ],
+            options={
+                'verbose_name': 'Séquence de tickets',
+                'verbose_name_plural': 'Séquences de tickets',
+                'ordering': ['-periode'],
+            },
+        ),
+    ]
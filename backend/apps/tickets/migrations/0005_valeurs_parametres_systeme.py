@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:33
+
+import apps.settings.parametres
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_sequenceticket'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='montant_subventionne',
+            field=models.DecimalField(decimal_places=2, default=apps.settings.parametres.subvention_courante, max_digits=10, verbose_name='Montant subventionné'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='prix_paye',
+            field=models.DecimalField(decimal_places=2, default=apps.settings.parametres.prix_ticket_courant, max_digits=10, verbose_name='Prix payé'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_valeurs_parametres_systeme'),
+        ('tickets', '0005_valeurs_parametres_systeme'),
+        ('transactions', '0007_index_pagination_curseur'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['date_creation', 'id'], name='tickets_tic_date_cr_bd5c78_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def remplir_porte_monnaie(apps, schema_editor):
+    """Soldes initiaux calculés depuis les tickets existants"""
+    Ticket = apps.get_model('tickets', 'Ticket')
+    PorteMonnaieTicket = apps.get_model('tickets', 'PorteMonnaieTicket')
+
+    groupes = (
+        Ticket.objects.order_by()
+        .values('proprietaire_id', 'valide_de', 'valide_jusqua')
+        .annotate(
+            disponibles=Count('id', filter=Q(statut='DISPONIBLE')),
+            consommes=Count('id', filter=Q(statut='CONSOMME')),
+            annules=Count('id', filter=Q(statut='ANNULE')),
+            expires=Count('id', filter=Q(statut='EXPIRE')),
+            valeur_disponible=Sum('prix_paye', filter=Q(statut='DISPONIBLE')),
+            valeur_totale=Sum('prix_paye'),
+        )
+    )
+    PorteMonnaieTicket.objects.bulk_create([
+        PorteMonnaieTicket(
+            utilisateur_id=g['proprietaire_id'], valide_de=g['valide_de'], valide_jusqua=g['valide_jusqua'],
+            disponibles=g['disponibles'], consommes=g['consommes'], annules=g['annules'], expires=g['expires'],
+            valeur_disponible=g['valeur_disponible'] or 0, valeur_totale=g['valeur_totale'] or 0,
+        )
+        for g in groupes.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_index_pagination_curseur'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PorteMonnaieTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valide_de', models.DateField(verbose_name='Valide à partir du')),
+                ('valide_jusqua', models.DateField(verbose_name="Valide jusqu'au")),
+                ('disponibles', models.IntegerField(default=0, verbose_name='Disponibles')),
+                ('consommes', models.IntegerField(default=0, verbose_name='Consommés')),
+                ('annules', models.IntegerField(default=0, verbose_name='Annulés')),
+                ('expires', models.IntegerField(default=0, verbose_name='Expirés')),
+                ('valeur_disponible', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Valeur disponible')),
+                ('valeur_totale', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Valeur totale')),
+                ('modifie_le', models.DateTimeField(auto_now=True, verbose_name='Modifié le')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='porte_monnaie', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Porte-monnaie de tickets',
+                'verbose_name_plural': 'Porte-monnaie de tickets',
+                'ordering': ['-valide_de'],
+                'constraints': [models.UniqueConstraint(fields=('utilisateur', 'valide_de', 'valide_jusqua'), name='portemonnaie_unique_periode')],
+            },
+        ),
+        migrations.RunPython(remplir_porte_monnaie, migrations.RunPython.noop),
+    ]
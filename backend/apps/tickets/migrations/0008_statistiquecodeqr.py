@@ -0,0 +1,54 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:07
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def remplir_statistiques(apps, schema_editor):
+    """Compteurs journaliers reconstitués depuis les codes existants, avant toute purge"""
+    CodeQR = apps.get_model('tickets', 'CodeQR')
+    StatistiqueCodeQR = apps.get_model('tickets', 'StatistiqueCodeQR')
+
+    jours = {}
+    generes = (
+        CodeQR.objects.order_by().annotate(jour=TruncDate('date_creation'))
+        .values('jour').annotate(n=Count('id')).values_list('jour', 'n')
+    )
+    for jour, n in generes:
+        jours.setdefault(jour, {'generes': 0, 'utilises': 0})['generes'] = n
+    utilises = (
+        CodeQR.objects.filter(est_utilise=True, utilise_le__isnull=False).order_by()
+        .annotate(jour=TruncDate('utilise_le')).values('jour').annotate(n=Count('id')).values_list('jour', 'n')
+    )
+    for jour, n in utilises:
+        jours.setdefault(jour, {'generes': 0, 'utilises': 0})['utilises'] = n
+    StatistiqueCodeQR.objects.bulk_create(
+        [StatistiqueCodeQR(date=jour, **compteurs) for jour, compteurs in jours.items() if jour],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_portemonnaieticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueCodeQR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Date')),
+                ('generes', models.IntegerField(default=0, verbose_name='Codes générés')),
+                ('utilises', models.IntegerField(default=0, verbose_name='Codes utilisés')),
+            ],
+            options={
+                'verbose_name': 'Statistique des codes QR',
+                'verbose_name_plural': 'Statistiques des codes QR',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.RunPython(remplir_statistiques, migrations.RunPython.noop),
+    ]
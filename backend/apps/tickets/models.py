@@ -1,17 +1,21 @@
 """
 Modèles pour la gestion des tickets
 """
-from django.db import models
+from django.db import IntegrityError, models, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from decimal import Decimal
+from django.urls import reverse
 import hashlib
 import json
 
+from apps.settings.parametres import prix_ticket_courant, subvention_courante, duree_validite_qr_minutes
+from . import jetons_qr
+
 
 class Ticket(models.Model):
     """Modèle pour un ticket individuel"""
@@ -65,9 +69,9 @@ class Ticket(models.Model):
     valide_jusqua = models.DateField('Valide jusqu\'au')
 
     # Aspect financier
-    prix_paye = models.DecimalField('Prix payé', max_digits=10, decimal_places=2, default=settings.TICKET_PRICE)
+    prix_paye = models.DecimalField('Prix payé', max_digits=10, decimal_places=2, default=prix_ticket_courant)
     montant_subventionne = models.DecimalField('Montant subventionné', max_digits=10, decimal_places=2,
-                                               default=settings.TICKET_SUBSIDY)
+                                               default=subvention_courante)
 
     # Horodatage
     date_creation = models.DateTimeField('Créé le', auto_now_add=True)
@@ -81,6 +85,7 @@ class Ticket(models.Model):
             models.Index(fields=['numero_ticket']),
             models.Index(fields=['proprietaire', 'statut']),
             models.Index(fields=['valide_de', 'valide_jusqua']),
+            models.Index(fields=['date_creation', 'id']),  # pagination par curseur
         ]
 
     def __str__(self):
@@ -107,23 +112,81 @@ class Ticket(models.Model):
         return timezone.now().date() > self.valide_jusqua
 
     def marquer_comme_consomme(self, restaurant, gestionnaire):
-        """Marquer le ticket comme consommé"""
+        """Marquer le ticket comme consommé (UPDATE conditionnel : jamais deux fois)"""
         if not self.est_valide:
             raise ValidationError('Ce ticket n\'est pas valide pour consommation')
 
-        self.statut = 'CONSOMME'
-        self.date_consommation = timezone.now()
-        self.restaurant_consommateur = restaurant
-        self.valide_par = gestionnaire
-        self.save()
+        if not self._consommer_si_disponible(self, restaurant, gestionnaire, self.proprietaire.agence_id):
+            raise ValidationError('Ce ticket a déjà été consommé')
+        self.refresh_from_db(fields=['statut', 'date_consommation', 'restaurant_consommateur', 'valide_par'])
+
+    @classmethod
+    def _consommer_si_disponible(cls, ticket, restaurant, gestionnaire, agence_id=None, consomme_le=None):
+        """UPDATE ... WHERE statut='DISPONIBLE' — retourne True si ce scan a gagné le ticket"""
+        from apps.transactions.models import StatistiqueJournaliere
+
+        maintenant = consomme_le or timezone.now()
+        with transaction.atomic():
+            pris = cls.objects.filter(pk=ticket.pk, statut='DISPONIBLE').update(
+                statut='CONSOMME',
+                date_consommation=maintenant,
+                restaurant_consommateur=restaurant,
+                valide_par=gestionnaire,
+                date_modification=timezone.now(),
+            ) == 1
+            if pris:
+                PorteMonnaieTicket.mouvement(
+                    ticket.proprietaire_id, ticket.valide_de, ticket.valide_jusqua,
+                    disponibles=-1, consommes=1, valeur_disponible=-ticket.prix_paye,
+                )
+                StatistiqueJournaliere.incrementer(
+                    timezone.localdate(maintenant),
+                    restaurant_id=restaurant.pk, agence_id=agence_id, tickets_consommes=1,
+                )
+        return pris
+
+    @classmethod
+    def reclamer_disponible(cls, proprietaire_id, restaurant, gestionnaire, agence_id=None, tentatives=5,
+                            consomme_le=None):
+        """
+        Consomme un ticket DISPONIBLE du propriétaire, sans double consommation
+        sous scans concurrents. Retourne le ticket réclamé ou None.
+
+        Dans une transaction, les tickets déjà verrouillés par un autre scan sont
+        sautés (SKIP LOCKED) ; l'UPDATE conditionnel reste l'arbitre final.
+        `consomme_le` : heure réelle d'un scan hors ligne synchronisé plus tard.
+        """
+        aujourd_hui = (consomme_le or timezone.now()).date()
+        candidats = cls.objects.filter(
+            proprietaire_id=proprietaire_id, statut='DISPONIBLE',
+            valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui,
+        ).order_by('valide_jusqua', 'id').only(
+            'id', 'numero_ticket', 'proprietaire_id', 'valide_de', 'valide_jusqua', 'prix_paye',
+        )
+        if connection.features.has_select_for_update_skip_locked and transaction.get_connection().in_atomic_block:
+            candidats = candidats.select_for_update(skip_locked=True)
+
+        perdus = []
+        for _ in range(tentatives):
+            ticket = candidats.exclude(pk__in=perdus).first()
+            if ticket is None:
+                return None
+            if cls._consommer_si_disponible(ticket, restaurant, gestionnaire, agence_id, consomme_le):
+                ticket.statut = 'CONSOMME'
+                return ticket
+            perdus.append(ticket.pk)
+        return None
 
     def annuler(self):
-        """Annuler le ticket"""
+        """Annuler le ticket (solde du porte-monnaie ajusté)"""
         if self.statut == 'CONSOMME':
             raise ValidationError('Un ticket consommé ne peut pas être annulé')
 
+        if not PorteMonnaieTicket.changer_statut(
+            Ticket.objects.filter(pk=self.pk).exclude(statut='CONSOMME'), 'ANNULE'
+        ) and Ticket.objects.filter(pk=self.pk, statut='CONSOMME').exists():
+            raise ValidationError('Un ticket consommé ne peut pas être annulé')
         self.statut = 'ANNULE'
-        self.save()
 
 
 class CodeQR(models.Model):
@@ -176,51 +239,38 @@ class CodeQR(models.Model):
 
     def save(self, *args, **kwargs):
         """Générer un code QR à la sauvegarde"""
-        if not self.code:
-            # Générer un code unique
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            data = f"{self.utilisateur.id}_{timestamp}_{self.utilisateur.email}"
-            self.code = hashlib.sha256(data.encode()).hexdigest()
-
         if not self.expire_le:
             # Définir la date d'expiration
-            self.expire_le = timezone.now() + timedelta(minutes=settings.QR_CODE_EXPIRY_MINUTES)
+            self.expire_le = timezone.now() + timedelta(minutes=duree_validite_qr_minutes())
 
+        if not self.code:
+            if jetons_qr.VERSION_EMISE >= 2:
+                # Jeton signé : vérifiable au scanner sans la base (voir jetons_qr.py)
+                self.code = jetons_qr.emettre(self.utilisateur_id, self.expire_le)
+            else:
+                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+                data = f"{self.utilisateur_id}_{timestamp}_{self.utilisateur.email}"
+                self.code = hashlib.sha256(data.encode()).hexdigest()
+
+        nouveau = self._state.adding
         super().save(*args, **kwargs)
+        if nouveau:
+            StatistiqueCodeQR.incrementer(timezone.localdate(self.date_creation), generes=1)
 
-        # Générer l'image du QR code
-        if not self.image_qr:
-            self.generer_image_qr()
-
-    def generer_image_qr(self):
-        """Générer l'image du QR code"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-
-        # Données à encoder
-        qr_data = {
+    def contenu_qr(self):
+        """Données encodées dans l'image du QR code (JSON)"""
+        return json.dumps({
             'code': self.code,
-            'utilisateur_id': self.utilisateur.id,
+            'utilisateur_id': self.utilisateur_id,
             'email': self.utilisateur.email,
             'cree_le': self.date_creation.isoformat() if self.date_creation else timezone.now().isoformat(),
             'expire_le': self.expire_le.isoformat(),
-        }
-
-        qr.add_data(json.dumps(qr_data))
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
+        })
 
-        # Sauvegarder dans le fichier
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        nom_fichier = f'qr_{self.utilisateur.id}_{timezone.now().strftime("%Y%m%d%H%M%S")}.png'
-        self.image_qr.save(nom_fichier, File(buffer), save=False)
-        self.save(update_fields=['image_qr'])
+    @property
+    def url_image(self):
+        """Image rendue à la demande (PNG), voir tickets:image_qrcode"""
+        return reverse('tickets:image_qrcode', args=[self.pk])
 
     def verifier_validite(self):
         """Vérifier si le code QR est toujours valide"""
@@ -237,32 +287,265 @@ class CodeQR(models.Model):
             self.save()
             return False, "Code QR expiré"
 
-        # Vérifier si l'utilisateur a des tickets valides
-        tickets_valides = Ticket.objects.filter(
-            proprietaire=self.utilisateur,
-            statut='DISPONIBLE',
-            valide_de__lte=maintenant.date(),
-            valide_jusqua__gte=maintenant.date()
-        )
-
-        if not tickets_valides.exists():
+        # Vérifier si l'utilisateur a des tickets valides (solde du porte-monnaie)
+        if PorteMonnaieTicket.solde(self.utilisateur_id, maintenant.date()).disponibles <= 0:
             return False, "Aucun ticket valide disponible"
 
         return True, "Code QR valide"
 
     def marquer_comme_utilise(self, restaurant):
-        """Marquer le code QR comme utilisé"""
+        """Marquer le code QR comme utilisé — retourne False s'il l'était déjà"""
+        maintenant = timezone.now()
+        pris = CodeQR.objects.filter(pk=self.pk, est_utilise=False).update(
+            est_utilise=True,
+            utilise_le=maintenant,
+            utilise_par_restaurant=restaurant,
+            est_valide=False,
+        )
         self.est_utilise = True
-        self.utilise_le = timezone.now()
-        self.utilise_par_restaurant = restaurant
         self.est_valide = False
-        self.save()
+        if pris:
+            self.utilise_le = maintenant
+            self.utilise_par_restaurant = restaurant
+            StatistiqueCodeQR.incrementer(timezone.localdate(maintenant), utilises=1)
+            # Rejeu d'un jeton v2 refusé au scanner sans requête (voir jetons_qr.py)
+            code, expire_le = self.code, self.expire_le
+            transaction.on_commit(lambda: jetons_qr.marquer_consomme(code, expire_le))
+        return pris == 1
 
     @classmethod
     def invalider_codes_precedents(cls, utilisateur):
-        """Invalider tous les codes QR précédents pour un utilisateur"""
+        """
+        Invalider les codes QR encore actifs d'un utilisateur. Un code expiré
+        est déjà refusé au scanner : seuls les codes non expirés (un seul en
+        pratique) sont mis à jour, quel que soit l'historique de l'utilisateur.
+        """
         cls.objects.filter(
             utilisateur=utilisateur,
             est_valide=True,
-            est_utilise=False
+            est_utilise=False,
+            expire_le__gt=timezone.now(),
         ).update(est_valide=False)
+
+
+class StatistiqueCodeQR(models.Model):
+    """
+    Compteurs journaliers des codes QR (générés, utilisés). Tenus à jour à la
+    création et à l'utilisation : ils survivent à la purge des codes expirés
+    (voir purge_qr.py), les statistiques ne comptent donc jamais les CodeQR.
+    """
+
+    date = models.DateField('Date', unique=True)
+    generes = models.IntegerField('Codes générés', default=0)
+    utilises = models.IntegerField('Codes utilisés', default=0)
+
+    class Meta:
+        verbose_name = 'Statistique des codes QR'
+        verbose_name_plural = 'Statistiques des codes QR'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"QR {self.date} — {self.generes} générés / {self.utilises} utilisés"
+
+    @classmethod
+    def incrementer(cls, date, **compteurs):
+        """Ajoute les compteurs à la ligne du jour, créée au besoin"""
+        compteurs = {champ: valeur for champ, valeur in compteurs.items() if valeur}
+        if not compteurs:
+            return
+        maj = {champ: models.F(champ) + v for champ, v in compteurs.items()}
+        if cls.objects.filter(date=date).update(**maj):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(date=date, **compteurs)
+        except IntegrityError:
+            cls.objects.filter(date=date).update(**maj)
+
+    @classmethod
+    def totaux(cls, depuis, jusqua=None):
+        """{'generes', 'utilises'} sur la période (une requête)"""
+        lignes = cls.objects.filter(date__gte=depuis)
+        if jusqua is not None:
+            lignes = lignes.filter(date__lte=jusqua)
+        sommes = lignes.aggregate(generes=Sum('generes'), utilises=Sum('utilises'))
+        return {champ: v or 0 for champ, v in sommes.items()}
+
+
+class SequenceTicket(models.Model):
+    """Compteur mensuel des numéros de tickets (AAAAMM-NNNNN)"""
+
+    periode = models.CharField('Période (AAAAMM)', max_length=6, unique=True)
+    dernier_numero = models.PositiveIntegerField('Dernier numéro attribué', default=0)
+    modifie_le = models.DateTimeField('Modifié le', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Séquence de tickets'
+        verbose_name_plural = 'Séquences de tickets'
+        ordering = ['-periode']
+
+    def __str__(self):
+        return f"{self.periode} → {self.dernier_numero}"
+
+    @classmethod
+    def reserver(cls, periode, nombre):
+        """
+        Réserve `nombre` numéros consécutifs pour la période et retourne le premier.
+        Un UPDATE ... SET dernier_numero = dernier_numero + N sur une seule ligne :
+        coût constant quel que soit le nombre de tickets, et le verrou de ligne
+        empêche deux ventes simultanées d'obtenir la même plage.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(periode=periode).update(dernier_numero=models.F('dernier_numero') + nombre):
+                # Première vente du mois : amorce à partir des tickets déjà émis
+                cls.objects.get_or_create(periode=periode, defaults={'dernier_numero': cls._amorce(periode)})
+                cls.objects.filter(periode=periode).update(dernier_numero=models.F('dernier_numero') + nombre)
+            dernier = cls.objects.filter(periode=periode).values_list('dernier_numero', flat=True).get()
+        return dernier - nombre + 1
+
+    @staticmethod
+    def _amorce(periode):
+        """Plus grand numéro déjà émis pour la période (tickets antérieurs au compteur)"""
+        dernier = Ticket.objects.filter(
+            numero_ticket__startswith=f"{periode}-"
+        ).order_by('-numero_ticket').values_list('numero_ticket', flat=True).first()
+        return int(dernier.split('-')[1]) if dernier else 0
+
+
+class PorteMonnaieTicket(models.Model):
+    """
+    Solde de tickets d'un utilisateur pour une période de validité.
+
+    Une ligne par (utilisateur, valide_de, valide_jusqua) : nombre de tickets
+    par statut et valeur des tickets disponibles. Chaque changement de statut
+    (vente, consommation, remboursement, annulation, expiration) ajuste la ligne
+    dans la même transaction ; les pages client lisent ce solde au lieu de
+    compter les tickets. `verifier_portemonnaie` le recalcule depuis Ticket.
+    """
+
+    CHAMPS_STATUT = {
+        'DISPONIBLE': 'disponibles',
+        'CONSOMME': 'consommes',
+        'ANNULE': 'annules',
+        'EXPIRE': 'expires',
+    }
+    CHAMPS_SOLDE = ('disponibles', 'consommes', 'annules', 'expires', 'valeur_disponible', 'valeur_totale')
+
+    utilisateur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='porte_monnaie'
+    )
+    valide_de = models.DateField('Valide à partir du')
+    valide_jusqua = models.DateField('Valide jusqu\'au')
+
+    disponibles = models.IntegerField('Disponibles', default=0)
+    consommes = models.IntegerField('Consommés', default=0)
+    annules = models.IntegerField('Annulés', default=0)
+    expires = models.IntegerField('Expirés', default=0)
+    valeur_disponible = models.DecimalField('Valeur disponible', max_digits=12, decimal_places=2, default=0)
+    valeur_totale = models.DecimalField('Valeur totale', max_digits=12, decimal_places=2, default=0)
+
+    modifie_le = models.DateTimeField('Modifié le', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Porte-monnaie de tickets'
+        verbose_name_plural = 'Porte-monnaie de tickets'
+        ordering = ['-valide_de']
+        constraints = [
+            models.UniqueConstraint(fields=['utilisateur', 'valide_de', 'valide_jusqua'],
+                                    name='portemonnaie_unique_periode'),
+        ]
+
+    def __str__(self):
+        return f"{self.utilisateur_id} {self.valide_de:%m/%Y} — {self.disponibles} disponible(s)"
+
+    @property
+    def total(self):
+        return self.disponibles + self.consommes + self.annules + self.expires
+
+    @classmethod
+    def mouvement(cls, utilisateur_id, valide_de, valide_jusqua, **deltas):
+        """Ajoute les deltas (valeurs négatives acceptées) à la ligne de la période, créée au besoin"""
+        deltas = {champ: valeur for champ, valeur in deltas.items() if valeur}
+        if not deltas:
+            return
+        cle = {'utilisateur_id': utilisateur_id, 'valide_de': valide_de, 'valide_jusqua': valide_jusqua}
+        maj = {champ: models.F(champ) + v for champ, v in deltas.items()}
+        maj['modifie_le'] = timezone.now()
+        if cls.objects.filter(**cle).update(**maj):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**cle, **deltas)
+        except IntegrityError:
+            # Créée entre-temps par une vente concurrente
+            cls.objects.filter(**cle).update(**maj)
+
+    @classmethod
+    def changer_statut(cls, tickets, nouveau, taille_lot=1000, **champs):
+        """
+        Passe les tickets du queryset au statut `nouveau` (champs : autres
+        colonnes à écrire) et ajuste les soldes, par lots verrouillés.
+        Retourne le nombre de tickets modifiés.
+        """
+        tickets = tickets.exclude(statut=nouveau)
+        total = 0
+        while True:
+            with transaction.atomic():
+                lot = list(tickets.select_for_update().order_by('pk').values_list('pk', flat=True)[:taille_lot])
+                if not lot:
+                    return total
+                cls.changer_statut_lot(lot, nouveau, **champs)
+            total += len(lot)
+
+    @classmethod
+    def changer_statut_lot(cls, lot, nouveau, **champs):
+        """
+        Passe les tickets `lot` (pk déjà verrouillés par l'appelant, dans sa
+        transaction) au statut `nouveau` et ajuste les soldes par période.
+        """
+        groupes = list(
+            Ticket.objects.filter(pk__in=lot).exclude(statut=nouveau).order_by()
+            .values('proprietaire_id', 'valide_de', 'valide_jusqua', 'statut')
+            .annotate(nb=Count('id'), valeur=Sum('prix_paye'))
+        )
+        modifies = Ticket.objects.filter(pk__in=lot).exclude(statut=nouveau).update(
+            statut=nouveau, date_modification=timezone.now(), **champs
+        )
+        for g in groupes:
+            deltas = {cls.CHAMPS_STATUT[g['statut']]: -g['nb'], cls.CHAMPS_STATUT[nouveau]: g['nb']}
+            if g['statut'] == 'DISPONIBLE':
+                deltas['valeur_disponible'] = -g['valeur']
+            elif nouveau == 'DISPONIBLE':
+                deltas['valeur_disponible'] = g['valeur']
+            cls.mouvement(g['proprietaire_id'], g['valide_de'], g['valide_jusqua'], **deltas)
+        return modifies
+
+    @classmethod
+    def solde(cls, utilisateur, jour=None):
+        """
+        Solde de l'utilisateur (objet non enregistré), en une requête :
+        périodes couvrant `jour`, ou toutes les périodes si jour est None.
+        """
+        utilisateur_id = getattr(utilisateur, 'pk', utilisateur)
+        lignes = cls.objects.filter(utilisateur_id=utilisateur_id)
+        if jour is not None:
+            lignes = lignes.filter(valide_de__lte=jour, valide_jusqua__gte=jour)
+        sommes = lignes.aggregate(**{champ: Sum(champ) for champ in cls.CHAMPS_SOLDE})
+        return cls(utilisateur_id=utilisateur_id, **{champ: v or 0 for champ, v in sommes.items()})
+
+    @classmethod
+    def soldes_attendus(cls, tickets=None):
+        """Soldes recalculés depuis Ticket : dicts (clé de période + compteurs), une requête groupée"""
+        tickets = Ticket.objects.all() if tickets is None else tickets
+        compteurs = {champ: Count('id', filter=models.Q(statut=statut)) for statut, champ in cls.CHAMPS_STATUT.items()}
+        return (
+            tickets.order_by()
+            .values('proprietaire_id', 'valide_de', 'valide_jusqua')
+            .annotate(
+                **compteurs,
+                valeur_disponible=Coalesce(Sum('prix_paye', filter=models.Q(statut='DISPONIBLE')), Decimal('0')),
+                valeur_totale=Coalesce(Sum('prix_paye'), Decimal('0')),
+            )
+        )
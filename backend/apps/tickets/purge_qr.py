@@ -0,0 +1,154 @@
+"""
+Rétention des codes QR : un code ne sert que quelques minutes.
+
+- purger_codes() supprime, par lots ordonnés sur la clé primaire, les codes
+  expirés sans avoir servi depuis plus de QR_CODE_RETENTION_DAYS jours, et
+  les codes utilisés depuis plus de QR_CODE_USED_RETENTION_DAYS jours (les
+  journaux de consommation gardent la trace du scan, leur lien passe à NULL).
+  Chaque lot est une transaction courte ; les images liées sont effacées
+  après le commit.
+- nettoyer_images() parcourt media/qrcodes/ en flux (os.scandir) et efface
+  les fichiers qu'aucun code ne référence (images des anciennes versions :
+  elles sont aujourd'hui rendues à la demande, voir qr_images.py).
+
+Les compteurs des statistiques viennent de StatistiqueCodeQR, pas des codes.
+
+    purger_codes()     → {'supprimes': 52000, 'lots': 52, 'duree_s': 3.4, 'codes_par_seconde': 15294.1}
+    nettoyer_images()  → {'fichiers': 800, 'supprimes': 780, 'duree_s': 0.2}
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 1000
+RETENTION_JOURS = getattr(settings, 'QR_CODE_RETENTION_DAYS', 7)
+RETENTION_UTILISES_JOURS = getattr(settings, 'QR_CODE_USED_RETENTION_DAYS', 90)
+DOSSIER_IMAGES = 'qrcodes'
+AGE_MIN_FICHIER = 3600  # un fichier plus récent peut appartenir à un code en cours de création
+CLE_VERROU = 'tickets:purge_qr'
+DUREE_VERROU = 3600
+
+
+def codes_a_purger(maintenant=None, jours=RETENTION_JOURS, jours_utilises=RETENTION_UTILISES_JOURS):
+    from .models import CodeQR
+
+    maintenant = maintenant or timezone.now()
+    return CodeQR.objects.filter(
+        Q(est_utilise=False, expire_le__lt=maintenant - timedelta(days=jours))
+        | Q(est_utilise=True, utilise_le__lt=maintenant - timedelta(days=jours_utilises))
+    )
+
+
+def _effacer_fichiers(noms):
+    racine = os.path.realpath(settings.MEDIA_ROOT)
+    for nom in noms:
+        chemin = os.path.realpath(os.path.join(racine, nom))
+        if not chemin.startswith(racine + os.sep):
+            continue
+        try:
+            os.remove(chemin)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Image QR non supprimée ({nom}) : {e}")
+
+
+def purger_codes(maintenant=None, jours=RETENTION_JOURS, jours_utilises=RETENTION_UTILISES_JOURS,
+                 taille_lot=TAILLE_LOT):
+    """
+    Supprime les codes hors rétention par lots. Un seul passage à la fois
+    (retourne None si un autre est en cours) ; retourne les compteurs et le débit.
+    """
+    from .models import CodeQR
+
+    if not cache.add(CLE_VERROU, 1, DUREE_VERROU):
+        logger.info("Purge des codes QR déjà en cours, ignorée")
+        return None
+
+    stats = {'supprimes': 0, 'lots': 0}
+    debut = time.monotonic()
+    try:
+        candidats, dernier = codes_a_purger(maintenant, jours, jours_utilises), 0
+        while True:
+            lot = list(
+                candidats.filter(pk__gt=dernier).order_by('pk').values_list('pk', 'image_qr')[:taille_lot]
+            )
+            if not lot:
+                break
+            dernier = lot[-1][0]
+            images = [image for _, image in lot if image]
+            with transaction.atomic():
+                CodeQR.objects.filter(pk__in=[pk for pk, _ in lot]).delete()
+                transaction.on_commit(lambda images=images: _effacer_fichiers(images))
+            stats['supprimes'] += len(lot)
+            stats['lots'] += 1
+    finally:
+        cache.delete(CLE_VERROU)
+
+    stats['duree_s'] = round(time.monotonic() - debut, 3)
+    stats['codes_par_seconde'] = round(stats['supprimes'] / stats['duree_s'], 1) if stats['duree_s'] else 0.0
+    logger.info(f"Purge des codes QR : {stats}")
+    return stats
+
+
+def _fichiers(dossier):
+    """Fichiers du dossier et de ses sous-dossiers, en flux (os.scandir)"""
+    try:
+        entrees = os.scandir(dossier)
+    except FileNotFoundError:
+        return
+    with entrees:
+        for entree in entrees:
+            if entree.is_dir(follow_symlinks=False):
+                yield from _fichiers(entree.path)
+            elif entree.is_file(follow_symlinks=False):
+                yield entree
+
+
+def nettoyer_images(taille_lot=500, simulation=False):
+    """
+    Efface les images de media/qrcodes/ qu'aucun code ne référence (plus
+    anciennes que AGE_MIN_FICHIER). Mémoire constante : les noms sont
+    vérifiés en base par paquets de `taille_lot`.
+    """
+    from .models import CodeQR
+
+    racine = os.path.join(settings.MEDIA_ROOT, DOSSIER_IMAGES)
+    limite = time.time() - AGE_MIN_FICHIER
+    stats = {'fichiers': 0, 'supprimes': 0}
+    debut = time.monotonic()
+
+    def _traiter(paquet):
+        references = set(
+            CodeQR.objects.filter(image_qr__in=paquet).values_list('image_qr', flat=True)
+        )
+        orphelins = [nom for nom in paquet if nom not in references]
+        if not simulation:
+            _effacer_fichiers(orphelins)
+        stats['supprimes'] += len(orphelins)
+
+    paquet = []
+    for entree in _fichiers(racine):
+        stats['fichiers'] += 1
+        if entree.stat(follow_symlinks=False).st_mtime > limite:
+            continue
+        nom = os.path.relpath(entree.path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        paquet.append(nom)
+        if len(paquet) == taille_lot:
+            _traiter(paquet)
+            paquet = []
+    if paquet:
+        _traiter(paquet)
+
+    stats['duree_s'] = round(time.monotonic() - debut, 3)
+    logger.info(f"Nettoyage des images QR{' (simulation)' if simulation else ''} : {stats}")
+    return stats
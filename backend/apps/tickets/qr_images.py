@@ -0,0 +1,61 @@
+"""
+Rendu des images de codes QR à la demande — aucun fichier écrit sur disque.
+
+Les codes expirent après quelques minutes : l'image est recalculée à partir
+du contenu du code et conservée dans un cache LRU en mémoire (par processus).
+"""
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+
+import qrcode
+import qrcode.image.svg
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+TAILLE_CACHE = 512
+
+_cache = OrderedDict()
+_verrou = Lock()
+
+
+def _generer(contenu, format_image):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(contenu)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    if format_image == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def rendre_image(contenu, format_image='png'):
+    """Octets de l'image QR encodant `contenu` (PNG ou SVG), via le cache LRU"""
+    if format_image not in FORMATS:
+        raise ValueError(f"Format d'image QR non supporté : {format_image}")
+
+    cle = (format_image, contenu)
+    with _verrou:
+        if cle in _cache:
+            _cache.move_to_end(cle)
+            return _cache[cle]
+
+    octets = _generer(contenu, format_image)
+
+    with _verrou:
+        _cache[cle] = octets
+        _cache.move_to_end(cle)
+        while len(_cache) > TAILLE_CACHE:
+            _cache.popitem(last=False)
+    return octets
@@ -0,0 +1,20 @@
+"""
+Tâches de fond de l'application tickets
+"""
+from celery import shared_task
+
+
+@shared_task
+def expirer_tickets():
+    """Expiration quotidienne des tickets échus (voir expiration.py et CELERY_BEAT_SCHEDULE)"""
+    from .expiration import expirer_tickets as expirer
+
+    return expirer()
+
+
+@shared_task
+def purger_codes_qr():
+    """Purge quotidienne des codes QR hors rétention et des images orphelines (voir purge_qr.py)"""
+    from .purge_qr import nettoyer_images, purger_codes
+
+    return {'codes': purger_codes(), 'images': nettoyer_images()}
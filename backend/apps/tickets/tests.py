@@ -1,3 +1,370 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.models import Agence, Direction, Utilisateur
+from apps.restaurants.models import Restaurant
+from apps.transactions.models import TransactionTicket
+from . import expiration, jetons_qr, purge_qr, qr_images
+from .models import CodeQR, PorteMonnaieTicket, SequenceTicket, StatistiqueCodeQR, Ticket
+
+
+class ImageCodeQRTests(TestCase):
+    """Images QR rendues à la demande : rien sur disque, un seul rendu par contenu"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+
+    def setUp(self):
+        qr_images._cache.clear()
+
+    def test_creation_sans_image(self):
+        CodeQR.objects.create(utilisateur=self.client_lonab)
+        with self.assertNumQueries(2):  # INSERT du code + compteur du jour
+            qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.assertFalse(qr.image_qr)
+
+    def test_image_rendue_une_fois(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.client.force_login(self.client_lonab)
+
+        with mock.patch.object(qr_images, '_generer', wraps=qr_images._generer) as generer:
+            for _ in range(3):
+                reponse = self.client.get(reverse('tickets:image_qrcode', args=[qr.pk]))
+                self.assertEqual(reponse['Content-Type'], 'image/png')
+            self.client.get(reverse('tickets:image_qrcode', args=[qr.pk]), {'format': 'svg'})
+        self.assertEqual(generer.call_count, 2)
+        self.assertTrue(reponse.content.startswith(b'\x89PNG'))
+
+
+class JetonsQRTests(TestCase):
+    """Jetons v2 vérifiés sans requête ; les anciens codes restent vérifiés en base"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+
+    def setUp(self):
+        jetons_qr._nonces.clear()
+        self.expire_le = timezone.now() + timedelta(minutes=5)
+        self.code = jetons_qr.emettre(self.client_lonab.pk, self.expire_le)
+
+    def refus(self, code, **kwargs):
+        with self.assertNumQueries(0), self.assertRaises(ValidationError) as refus:
+            jetons_qr.lire(code, **kwargs)
+        return refus.exception.code
+
+    def test_jeton_authentique(self):
+        with self.assertNumQueries(0):
+            jeton = jetons_qr.verifier(self.code)
+        self.assertEqual(jeton.utilisateur_id, self.client_lonab.pk)
+        self.assertEqual(jeton.expire_le, self.expire_le.replace(microsecond=0))
+
+    def test_signature_falsifiee(self):
+        prefixe, utilisateur, expire, nonce, signature = self.code.split('.')
+        autre = 'A' if signature[0] != 'A' else 'B'
+        self.assertEqual(self.refus(f'{prefixe}.{utilisateur}.{expire}.{nonce}.{autre}{signature[1:]}'), 'invalide')
+        # Utilisateur ou expiration modifiés : la signature ne correspond plus
+        self.assertEqual(self.refus(f'{prefixe}.{int(utilisateur) + 1}.{expire}.{nonce}.{signature}'), 'invalide')
+        self.assertEqual(self.refus(f'{prefixe}.{utilisateur}.{int(expire) + 3600}.{nonce}.{signature}'), 'invalide')
+        self.assertEqual(self.refus('Q2.pas.un.jeton'), 'invalide')
+
+    def test_ancienne_cle_acceptee(self):
+        with override_settings(SECRET_KEY='nouvelle-cle', SECRET_KEY_FALLBACKS=[]):
+            self.assertEqual(self.refus(self.code), 'invalide')
+        ancienne = jetons_qr.settings.SECRET_KEY
+        with override_settings(SECRET_KEY='nouvelle-cle', SECRET_KEY_FALLBACKS=[ancienne]):
+            self.assertEqual(jetons_qr.lire(self.code).utilisateur_id, self.client_lonab.pk)
+
+    def test_jeton_expire(self):
+        self.assertEqual(self.refus(self.code, maintenant=self.expire_le + timedelta(seconds=1)), 'expire')
+
+    def test_rejeu_refuse_sans_requete(self):
+        qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        jetons_qr.lire(qr.code)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(qr.marquer_comme_utilise(restaurant=None))
+        self.assertEqual(self.refus(qr.code), 'deja_utilise')
+        # Les autres jetons ne sont pas concernés
+        self.assertEqual(jetons_qr.lire(self.code).utilisateur_id, self.client_lonab.pk)
+
+    def test_nonces_bornes(self):
+        with mock.patch.object(jetons_qr, 'TAILLE_NONCES', 3):
+            codes = [jetons_qr.emettre(self.client_lonab.pk, self.expire_le) for _ in range(4)]
+            for code in codes:
+                jetons_qr.marquer_consomme(code, self.expire_le)
+        self.assertEqual(len(jetons_qr._nonces), 3)
+        # Le plus ancien est oublié : la base reste l'autorité pour ce rejeu
+        jetons_qr.lire(codes[0])
+        self.assertEqual(self.refus(codes[-1]), 'deja_utilise')
+
+    def test_ancien_format_verifie_en_base(self):
+        with mock.patch.object(jetons_qr, 'VERSION_EMISE', 1):
+            qr = CodeQR.objects.create(utilisateur=self.client_lonab)
+        self.assertFalse(jetons_qr.est_jeton(qr.code))
+        self.assertEqual(len(qr.code), 64)
+        with self.assertNumQueries(0):
+            self.assertIsNone(jetons_qr.verifier(qr.code))
+        self.assertEqual(qr.verifier_validite(), (False, 'Aucun ticket valide disponible'))
+        # Rejeu : rien en mémoire, la consommation conditionnelle en base le refuse
+        self.assertTrue(qr.marquer_comme_utilise(restaurant=None))
+        self.assertEqual(jetons_qr._nonces, {})
+        self.assertFalse(CodeQR.objects.get(pk=qr.pk).marquer_comme_utilise(restaurant=None))
+
+
+class PorteMonnaieTests(TestCase):
+    """Soldes tenus à chaque changement de statut, toujours égaux au recalcul depuis Ticket"""
+
+    @classmethod
+    def setUpTestData(cls):
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        cls.agence = Agence.objects.create(
+            nom='Agence Centre', code='AC', adresse='Avenue Kwame Nkrumah',
+            ville='Ouagadougou', telephone='+22625000000', direction=direction,
+        )
+        cls.restaurant = Restaurant.objects.create(
+            nom='Restaurant Central', code='RC', adresse='Zone du bois',
+            ville='Ouagadougou', telephone='+22625000001',
+        )
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client',
+            type_utilisateur='CLIENT', agence=cls.agence,
+        )
+        cls.aujourd_hui = timezone.localdate()
+
+    def setUp(self):
+        cache.delete(expiration.CLE_VERROU)
+
+    def vendre(self, nombre_tickets, debut=-1, fin=30):
+        vente = TransactionTicket.objects.create(
+            numero_transaction=f'VENTE-{TransactionTicket.objects.count() + 1}',
+            client=self.client_lonab, agence=self.agence, nombre_tickets=nombre_tickets,
+            valide_de=self.aujourd_hui + timedelta(days=debut), valide_jusqu_a=self.aujourd_hui + timedelta(days=fin),
+        )
+        vente.completer()
+        return vente
+
+    def assertSoldesExacts(self):
+        champs = PorteMonnaieTicket.CHAMPS_SOLDE
+        attendus = {
+            (a['proprietaire_id'], a['valide_de'], a['valide_jusqua']): {c: a[c] for c in champs}
+            for a in PorteMonnaieTicket.soldes_attendus()
+        }
+        enregistres = {
+            (l['utilisateur_id'], l['valide_de'], l['valide_jusqua']): {c: l[c] for c in champs}
+            for l in PorteMonnaieTicket.objects.values('utilisateur_id', 'valide_de', 'valide_jusqua', *champs)
+        }
+        self.assertEqual(enregistres, attendus)
+
+    def solde(self):
+        return PorteMonnaieTicket.solde(self.client_lonab, self.aujourd_hui)
+
+    def test_vente(self):
+        self.vendre(3)
+        self.vendre(2)
+        self.vendre(4, debut=-40, fin=-10)  # autre période
+        self.assertSoldesExacts()
+        self.assertEqual(PorteMonnaieTicket.objects.count(), 2)
+        solde = self.solde()
+        self.assertEqual((solde.disponibles, solde.total), (5, 5))
+        self.assertEqual(solde.valeur_disponible, 5 * Ticket.objects.first().prix_paye)
+
+    def test_consommation(self):
+        self.vendre(3)
+        ticket = Ticket.reclamer_disponible(self.client_lonab.pk, self.restaurant, None, self.agence.pk)
+        self.assertEqual(ticket.statut, 'CONSOMME')
+        self.assertSoldesExacts()
+        self.assertEqual((self.solde().disponibles, self.solde().consommes), (2, 1))
+
+    def test_remboursement(self):
+        vente = self.vendre(3)
+        self.vendre(2)
+        vente.rembourser()
+        self.assertSoldesExacts()
+        solde = self.solde()
+        self.assertEqual((solde.disponibles, solde.annules), (2, 3))
+        self.assertEqual(solde.valeur_disponible, 2 * Ticket.objects.first().prix_paye)
+
+    def test_annulation_et_reactivation(self):
+        self.vendre(3)
+        ticket = Ticket.objects.first()
+        ticket.annuler()
+        self.assertSoldesExacts()
+        self.assertEqual((self.solde().disponibles, self.solde().annules), (2, 1))
+
+        # Réactivation (action d'administration)
+        self.assertEqual(PorteMonnaieTicket.changer_statut(Ticket.objects.filter(pk=ticket.pk), 'DISPONIBLE'), 1)
+        self.assertSoldesExacts()
+        self.assertEqual((self.solde().disponibles, self.solde().annules), (3, 0))
+
+    def test_expiration_par_lots(self):
+        self.vendre(5, debut=-40, fin=-1)
+        self.vendre(2)
+        with CaptureQueriesContext(connection) as requetes:
+            stats = expiration.expirer_tickets(taille_lot=2)
+
+        self.assertEqual((stats['expires'], stats['lots']), (5, 3))
+        self.assertEqual(
+            sum(r['sql'].startswith('UPDATE "tickets_ticket"') for r in requetes.captured_queries), 3,
+        )
+        self.assertEqual(Ticket.objects.filter(statut='EXPIRE').count(), 5)
+        self.assertSoldesExacts()
+        self.assertEqual(self.solde().disponibles, 2)
+        self.assertIsNone(cache.get(expiration.CLE_VERROU))
+        # Rien de plus au passage suivant
+        self.assertEqual(expiration.expirer_tickets()['expires'], 0)
+
+    def test_expiration_jour_de_reference(self):
+        self.vendre(2, debut=-1, fin=3)
+        self.assertEqual(expiration.expirer_tickets()['expires'], 0)
+        self.assertEqual(expiration.expirer_tickets(self.aujourd_hui + timedelta(days=4))['expires'], 2)
+        self.assertSoldesExacts()
+
+    def test_expiration_un_passage_a_la_fois(self):
+        self.vendre(2, debut=-40, fin=-1)
+        cache.add(expiration.CLE_VERROU, 1, 60)
+        self.assertIsNone(expiration.expirer_tickets())
+        sortie = StringIO()
+        call_command('expirer_tickets', stdout=sortie)
+        self.assertIn('déjà en cours', sortie.getvalue())
+        self.assertEqual(Ticket.objects.filter(statut='EXPIRE').count(), 0)
+
+    def test_verifier_portemonnaie(self):
+        self.vendre(3)
+        self.vendre(2, debut=-40, fin=-10)
+        sortie = StringIO()
+        call_command('verifier_portemonnaie', stdout=sortie)
+        self.assertIn('2 solde(s) vérifié(s), aucun écart', sortie.getvalue())
+
+        # Écarts : compteur faussé, ligne disparue, ligne sans aucun ticket
+        ligne = PorteMonnaieTicket.objects.get(valide_jusqua=self.aujourd_hui + timedelta(days=30))
+        PorteMonnaieTicket.objects.filter(pk=ligne.pk).update(disponibles=7, consommes=1)
+        PorteMonnaieTicket.objects.filter(valide_jusqua=self.aujourd_hui - timedelta(days=10)).delete()
+        PorteMonnaieTicket.objects.create(
+            utilisateur=self.client_lonab, valide_de=self.aujourd_hui, valide_jusqua=self.aujourd_hui, disponibles=1,
+        )
+
+        sortie = StringIO()
+        call_command('verifier_portemonnaie', stdout=sortie)
+        rapport = sortie.getvalue()
+        self.assertIn('3 écart(s) sur 2 solde(s)', rapport)
+        self.assertIn('disponibles 7 → 3, consommes 1 → 0', rapport)
+        self.assertIn('disponibles 0 → 2', rapport)
+        self.assertIn('disponibles 1 → 0', rapport)
+        self.assertEqual(PorteMonnaieTicket.objects.get(pk=ligne.pk).disponibles, 7)  # rapport seul
+
+        sortie = StringIO()
+        call_command('verifier_portemonnaie', '--corriger', stdout=sortie)
+        self.assertIn('3 solde(s) corrigé(s) sur 2', sortie.getvalue())
+        call_command('verifier_portemonnaie', stdout=(sortie := StringIO()))
+        self.assertIn('aucun écart', sortie.getvalue())
+
+
+class PurgeCodesQRTests(TestCase):
+    """Purge des codes hors rétention par lots ; les compteurs du jour survivent"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client', type_utilisateur='CLIENT',
+        )
+        maintenant = timezone.now()
+        cas = (
+            [{'expire_le': maintenant - timedelta(days=10)}] * 7                        # à purger
+            + [{'expire_le': maintenant - timedelta(days=2)}] * 3                       # conservés
+            + [{'est_utilise': True, 'utilise_le': maintenant - timedelta(days=100)}] * 2  # à purger
+            + [{'est_utilise': True, 'utilise_le': maintenant - timedelta(days=10)}]    # conservé
+        )
+        for champs in cas:
+            qr = CodeQR.objects.create(utilisateur=cls.client_lonab)
+            CodeQR.objects.filter(pk=qr.pk).update(**champs)
+
+    def setUp(self):
+        cache.delete(purge_qr.CLE_VERROU)
+
+    def test_purge_par_lots(self):
+        generes = StatistiqueCodeQR.objects.get().generes
+        with CaptureQueriesContext(connection) as requetes:
+            stats = purge_qr.purger_codes(taille_lot=4)
+
+        self.assertEqual((stats['supprimes'], stats['lots']), (9, 3))
+        self.assertEqual(
+            sum(r['sql'].startswith('DELETE FROM "tickets_codeqr"') for r in requetes.captured_queries), 3,
+        )
+        self.assertEqual(CodeQR.objects.count(), 4)
+        self.assertEqual(StatistiqueCodeQR.objects.get().generes, generes)
+
+    def test_un_seul_passage_a_la_fois(self):
+        cache.add(purge_qr.CLE_VERROU, 1, 60)
+        self.assertIsNone(purge_qr.purger_codes())
+        self.assertEqual(CodeQR.objects.count(), 13)
+
+    def test_images_orphelines(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            os.makedirs(os.path.join(media, 'qrcodes'))
+            ancien = time.time() - 2 * purge_qr.AGE_MIN_FICHIER
+            for nom in ('reference.png', 'orpheline.png', 'recente.png'):
+                with open(os.path.join(media, 'qrcodes', nom), 'wb') as fichier:
+                    fichier.write(b'png')
+                if nom != 'recente.png':
+                    os.utime(os.path.join(media, 'qrcodes', nom), (ancien, ancien))
+            CodeQR.objects.filter(pk=CodeQR.objects.first().pk).update(image_qr='qrcodes/reference.png')
+
+            stats = purge_qr.nettoyer_images()
+            restants = sorted(os.listdir(os.path.join(media, 'qrcodes')))
+
+        self.assertEqual((stats['fichiers'], stats['supprimes']), (3, 1))
+        self.assertEqual(restants, ['recente.png', 'reference.png'])
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite sérialise les écritures : pas de concurrence réelle')
+class SequenceTicketConcurrenceTests(TransactionTestCase):
+    """Ventes simultanées : plages de numéros uniques et contiguës"""
+
+    VENTES = 8
+    TICKETS_PAR_VENTE = 5
+
+    def test_reservations_paralleles(self):
+        debuts, erreurs = [], []
+        depart = threading.Barrier(self.VENTES)
+
+        def vendre():
+            try:
+                depart.wait()
+                debuts.append(SequenceTicket.reserver('202601', self.TICKETS_PAR_VENTE))
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        fils = [threading.Thread(target=vendre) for _ in range(self.VENTES)]
+        for f in fils:
+            f.start()
+        for f in fils:
+            f.join()
+
+        self.assertEqual(erreurs, [])
+        numeros = sorted(debut + i for debut in debuts for i in range(self.TICKETS_PAR_VENTE))
+        self.assertEqual(numeros, list(range(1, self.VENTES * self.TICKETS_PAR_VENTE + 1)))
+        self.assertEqual(
+            SequenceTicket.objects.get(periode='202601').dernier_numero, self.VENTES * self.TICKETS_PAR_VENTE,
+        )
@@ -9,6 +9,7 @@ app_name = 'tickets'
 urlpatterns = [
     # ── Admin ──────────────────────────────────────────────────
     path('', views.admin_tickets, name='admin_tickets'),
+    path('export/', views.export_tickets, name='export_tickets'),
     path('stats/', views.admin_tickets_stats, name='admin_stats'),
     path('<int:pk>/', views.ticket_detail, name='ticket_detail'),
 
@@ -20,4 +21,5 @@ urlpatterns = [
     path('client/qrcode/', views.client_qrcode, name='client_qrcode'),
     path('client/qrcode/generer/', views.generer_qrcode, name='generer_qrcode'),
     path('client/qrcode/<int:pk>/invalider/', views.invalider_qrcode, name='invalider_qrcode'),
+    path('client/qrcode/<int:pk>/image/', views.image_qrcode, name='image_qrcode'),
 ]
\ No newline at end of file
@@ -3,19 +3,22 @@ Vues pour l'application tickets
 """
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
-from django.core.paginator import Paginator
+from django.db.models import Q, Sum
 from dateutil.relativedelta import relativedelta
 from django.utils import timezone
-from django.conf import settings
-from .models import Ticket, CodeQR
+from .models import Ticket, CodeQR, PorteMonnaieTicket, StatistiqueCodeQR
+from .qr_images import rendre_image, FORMATS
 
 from apps.accounts.models import Utilisateur, Agence
-from apps.settings.models import ParametresSysteme
-from apps.transactions.models import TransactionTicket, LogConsommation
+from apps.accounts.recherche import filtre_recherche
+from apps.settings.exportation import exporter, format_demande
+from apps.settings.facettes import compter_facettes
+from apps.settings.pagination import paginer_par_curseur
+from apps.settings.parametres import valeurs_vente
+from apps.transactions.models import LogConsommation, StatistiqueJournaliere
 
 
 def _debut_fin_mois(date=None):
@@ -25,56 +28,27 @@ def _debut_fin_mois(date=None):
     fin   = debut + relativedelta(months=1) - relativedelta(days=1)
     return debut, fin
 
-def _get_params():
-    """Charge les paramètres depuis la DB, fallback settings.py."""
-    try:
-        from apps.settings.models import ParametresSysteme
-        p = ParametresSysteme.charger()
-        return {
-            'prix_ticket': int(p.prix_ticket),
-            'subvention':  int(p.subvention_ticket),
-            'min_tickets': p.tickets_min_par_transaction,
-            'max_tickets': p.tickets_max_par_transaction,
-            'max_mensuel': p.transactions_max_par_mois,
-        }
-    except Exception:
-        return {
-            'prix_ticket': getattr(settings, 'TICKET_PRICE', 500),
-            'subvention':  getattr(settings, 'TICKET_SUBSIDY', 1500),
-            'min_tickets': getattr(settings, 'MIN_TICKETS_PER_TRANSACTION', 1),
-            'max_tickets': getattr(settings, 'MAX_TICKETS_PER_TRANSACTION', 20),
-            'max_mensuel': getattr(settings, 'MAX_TRANSACTIONS_PER_MONTH', 1),
-        }
-
-
-# ================================================================
-# ADMIN
-# ================================================================
-@login_required
-def admin_tickets(request):
-    if not request.user.est_admin:
-        return redirect('accounts:dashboard')
 
+def filtrer_tickets(params):
+    """
+    Tickets filtrés comme la liste admin (search, statut, agence, mois,
+    date_debut, date_fin). Retourne (queryset, valeurs des filtres).
+    """
     qs = Ticket.objects.select_related(
         'proprietaire', 'proprietaire__agence', 'transaction', 'transaction__caissier',
         'restaurant_consommateur'
     )
 
     # ── Filtres ─────────────────────────────────────────────────
-    q       = request.GET.get('search', '').strip()
-    statut  = request.GET.get('statut', '').strip()
-    agence  = request.GET.get('agence', '').strip()
-    date_debut = request.GET.get('date_debut', '').strip()
-    date_fin   = request.GET.get('date_fin', '').strip()
-    mois    = request.GET.get('mois', '').strip()
+    q       = params.get('search', '').strip()
+    statut  = params.get('statut', '').strip()
+    agence  = params.get('agence', '').strip()
+    date_debut = params.get('date_debut', '').strip()
+    date_fin   = params.get('date_fin', '').strip()
+    mois    = params.get('mois', '').strip()
 
     if q:
-        qs = qs.filter(
-            Q(numero_ticket__icontains=q) |
-            Q(proprietaire__prenom__icontains=q) |
-            Q(proprietaire__nom__icontains=q) |
-            Q(proprietaire__matricule__icontains=q)
-        )
+        qs = qs.filter(filtre_recherche(q, 'proprietaire__', numero='numero_ticket'))
     if statut:
         qs = qs.filter(statut=statut)
     if agence:
@@ -90,23 +64,60 @@ def admin_tickets(request):
     if date_fin:
         qs = qs.filter(date_creation__date__lte=date_fin)
 
+    return qs, {
+        'search':     q,
+        'statut':     statut,
+        'agence':     agence,
+        'date_debut': date_debut,
+        'date_fin':   date_fin,
+        'mois':       mois,
+    }
+
+
+COLONNES_EXPORT_TICKETS = [
+    ('N° Ticket',         lambda t: t.numero_ticket),
+    ('Propriétaire',      lambda t: t.proprietaire.get_full_name()),
+    ('Matricule',         lambda t: t.proprietaire.matricule or ''),
+    ('Agence',            lambda t: t.proprietaire.agence.nom if t.proprietaire.agence else ''),
+    ('Statut',            lambda t: t.get_statut_display()),
+    ('Valide du',         lambda t: t.valide_de.strftime('%d/%m/%Y') if t.valide_de else ''),
+    ('Valide au',         lambda t: t.valide_jusqua.strftime('%d/%m/%Y') if t.valide_jusqua else ''),
+    ('Prix payé',         lambda t: float(t.prix_paye)),
+    ('Subvention',        lambda t: float(t.montant_subventionne)),
+    ('Transaction',       lambda t: t.transaction.numero_transaction if t.transaction else ''),
+    ('Caissier',          lambda t: t.transaction.caissier.get_full_name() if t.transaction and t.transaction.caissier else ''),
+    ('Restaurant',        lambda t: t.restaurant_consommateur.nom if t.restaurant_consommateur else ''),
+    ('Date consommation', lambda t: timezone.localtime(t.date_consommation).strftime('%d/%m/%Y %H:%M') if t.date_consommation else ''),
+    ('Créé le',           lambda t: timezone.localtime(t.date_creation).strftime('%d/%m/%Y %H:%M')),
+]
+
+
+# ================================================================
+# ADMIN
+# ================================================================
+@login_required
+def admin_tickets(request):
+    if not request.user.est_admin:
+        return redirect('accounts:dashboard')
+
+    qs, filtres = filtrer_tickets(request.GET)
+
     debut_mois, _ = _debut_fin_mois()
+    # Une requête sur la sélection filtrée, une sur toute la table (chiffres du mois)
     totaux = {
-        'total':          qs.count(),
-        'disponibles':    qs.filter(statut='DISPONIBLE').count(),
-        'consommes':      qs.filter(statut='CONSOMME').count(),
-        'expires':        qs.filter(statut__in=['EXPIRE', 'ANNULE']).count(),
-        'vendus_mois':    Ticket.objects.filter(date_creation__date__gte=debut_mois).count(),
-        'consommes_mois': Ticket.objects.filter(statut='CONSOMME', date_consommation__date__gte=debut_mois).count(),
+        **compter_facettes(qs, {
+            'total':       None,
+            'disponibles': Q(statut='DISPONIBLE'),
+            'consommes':   Q(statut='CONSOMME'),
+            'expires':     Q(statut__in=['EXPIRE', 'ANNULE']),
+        }),
+        **compter_facettes(Ticket.objects.all(), {
+            'vendus_mois':    Q(date_creation__date__gte=debut_mois),
+            'consommes_mois': Q(statut='CONSOMME', date_consommation__date__gte=debut_mois),
+        }),
     }
 
-    paginator = Paginator(qs.order_by('-date_creation'), 10)
-    page_obj  = paginator.get_page(request.GET.get('page', 1))
-
-    # Paramètres GET à conserver dans la pagination
-    params_get = '&'.join([
-        f"{k}={v}" for k, v in request.GET.items() if k != 'page' and v
-    ])
+    page_obj = paginer_par_curseur(request, qs, 'date_creation', 10)
 
     from apps.accounts.models import Agence
     return render(request, 'tickets/admin_tickets.html', {
@@ -114,17 +125,20 @@ def admin_tickets(request):
         'page_obj':   page_obj,
         'totaux':     totaux,
         'agences':    Agence.objects.filter(est_active=True).order_by('nom'),
-        'filtres': {
-            'search':     q,
-            'statut':     statut,
-            'agence':     agence,
-            'date_debut': date_debut,
-            'date_fin':   date_fin,
-            'mois':       mois,
-        },
-        'extra_params': params_get,
+        'filtres':    filtres,
     })
 
+@login_required
+def export_tickets(request):
+    """Export complet (CSV ou XLSX via ?format=) des tickets filtrés comme la liste admin."""
+    if not request.user.est_admin:
+        return redirect('accounts:dashboard')
+
+    qs, _ = filtrer_tickets(request.GET)
+    return exporter(qs, COLONNES_EXPORT_TICKETS, 'tickets', format_demande(request),
+                    titre='Tickets', par_cle=True)
+
+
 @login_required
 def admin_tickets_stats(request):
     if not request.user.est_admin:
@@ -133,7 +147,8 @@ def admin_tickets_stats(request):
     aujourd_hui = timezone.now().date()
     debut_mois, fin_mois = _debut_fin_mois(aujourd_hui)
 
-    # Statistiques globales
+    # Statistiques globales (codes QR : compteurs journaliers, les codes expirés sont purgés)
+    qr_mois = StatistiqueCodeQR.totaux(debut_mois)
     stats = {
         'total_tickets':       Ticket.objects.count(),
         'disponibles':         Ticket.objects.filter(statut='DISPONIBLE').count(),
@@ -141,16 +156,15 @@ def admin_tickets_stats(request):
         'consommes_mois':      Ticket.objects.filter(statut='CONSOMME', date_consommation__date__gte=debut_mois).count(),
         'expires':             Ticket.objects.filter(statut='EXPIRE').count(),
         'annules':             Ticket.objects.filter(statut='ANNULE').count(),
-        'qr_generes_mois':     CodeQR.objects.filter(date_creation__date__gte=debut_mois).count(),
-        'qr_utilises_mois':    CodeQR.objects.filter(est_utilise=True, utilise_le__date__gte=debut_mois).count(),
+        'qr_generes_mois':     qr_mois['generes'],
+        'qr_utilises_mois':    qr_mois['utilises'],
     }
 
     # Consommations par jour (30 derniers jours)
-    conso_jour = []
-    for i in range(29, -1, -1):
-        j  = aujourd_hui - timezone.timedelta(days=i)
-        nb = Ticket.objects.filter(statut='CONSOMME', date_consommation__date=j).count()
-        conso_jour.append({'date': j.strftime('%d/%m'), 'nb': nb})
+    conso_jour = [
+        {'date': ligne['date'].strftime('%d/%m'), 'nb': ligne['tickets_consommes']}
+        for ligne in StatistiqueJournaliere.serie(30, 'tickets_consommes', fin=aujourd_hui)
+    ]
 
     return render(request, 'tickets/admin_stats.html', {
         'stats':      stats,
@@ -177,7 +191,6 @@ def caissier_tickets(request):
         return redirect('accounts:dashboard')
 
     from apps.tickets.models import Ticket
-    from apps.accounts.models import Utilisateur
 
     # Seulement les tickets issus des transactions de ce caissier
     qs = Ticket.objects.filter(
@@ -185,12 +198,7 @@ def caissier_tickets(request):
     ).select_related('proprietaire', 'transaction', 'restaurant_consommateur')
 
     if search := request.GET.get('search'):
-        qs = qs.filter(
-            Q(numero_ticket__icontains=search) |
-            Q(proprietaire__prenom__icontains=search) |
-            Q(proprietaire__nom__icontains=search) |
-            Q(proprietaire__matricule__icontains=search)
-        )
+        qs = qs.filter(filtre_recherche(search, 'proprietaire__', numero='numero_ticket'))
     if statut := request.GET.get('statut'):
         qs = qs.filter(statut=statut)
     if mois := request.GET.get('mois'):
@@ -202,32 +210,16 @@ def caissier_tickets(request):
 
     aujourd_hui = timezone.now().date()
     debut_mois, fin_mois = _debut_fin_mois(aujourd_hui)
-    params = _get_params()
-
-    stats = {
-        'total':       qs.count(),
-        'disponibles': qs.filter(statut='DISPONIBLE').count(),
-        'consommes':   qs.filter(statut='CONSOMME').count(),
-        'expires':     qs.filter(statut='EXPIRE').count(),
-    }
+    params = valeurs_vente()
 
-    # Clients éligibles (pas encore atteint leur limite ce mois)
-    clients_ayant_atteint = (
-        TransactionTicket.objects
-        .filter(type_transaction='ACHAT', statut='TERMINEE', date_transaction__date__gte=debut_mois)
-        .values('client_id')
-        .annotate(nb=Count('id'))
-        .filter(nb__gte=params['max_mensuel'])
-        .values_list('client_id', flat=True)
-    )
-    clients = Utilisateur.objects.filter(
-        type_utilisateur='CLIENT', est_actif=True,
-    ).exclude(
-        id__in=clients_ayant_atteint
-    ).select_related('agence').order_by('nom', 'prenom')
+    stats = compter_facettes(qs, {
+        'total':       None,
+        'disponibles': Q(statut='DISPONIBLE'),
+        'consommes':   Q(statut='CONSOMME'),
+        'expires':     Q(statut='EXPIRE'),
+    })
 
-    paginator = Paginator(qs.order_by('-date_creation'), 10)
-    page_obj  = paginator.get_page(request.GET.get('page', 1))
+    page_obj = paginer_par_curseur(request, qs, 'date_creation', 10)
 
     return render(request, 'tickets/caissier_tickets.html', {
         'tickets':     page_obj,
@@ -238,7 +230,6 @@ def caissier_tickets(request):
             ('consommés',   stats['consommes'],   '#6c757d'),
             ('expirés/annulés', stats['expires'], '#dc3545'),
         ],
-        'clients':     clients,
         'debut_mois':  debut_mois,
         'fin_mois':    fin_mois,
         'prix_ticket': params['prix_ticket'],
@@ -270,6 +261,7 @@ def client_tickets(request):
     tous = request.user.tickets.select_related('transaction', 'restaurant_consommateur')
 
     valides     = tous.filter(statut='DISPONIBLE', valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui)
+    solde       = PorteMonnaieTicket.solde(request.user, aujourd_hui)
     consommes   = list(tous.filter(statut='CONSOMME').order_by('-date_consommation')[:20])
     expires     = tous.filter(statut__in=['EXPIRE', 'ANNULE']).order_by('-valide_jusqua')[:10]
 
@@ -291,8 +283,8 @@ def client_tickets(request):
         'tickets_valides':     valides,
         'tickets_consommes':   consommes,
         'tickets_expires':     expires,
-        'nb_valides':          valides.count(),
-        'nb_consommes_mois':   tous.filter(statut='CONSOMME', date_consommation__date__gte=debut_mois).count(),
+        'nb_valides':          solde.disponibles,
+        'nb_consommes_mois':   solde.consommes,
         'aujourd_hui':         aujourd_hui,
         'debut_mois':          debut_mois,
         'fin_mois':            fin_mois,
@@ -315,11 +307,7 @@ def client_qrcode(request):
     ).order_by('-date_creation').first()
 
     # Tickets valides disponibles
-    tickets_valides = request.user.tickets.filter(
-        statut='DISPONIBLE',
-        valide_de__lte=aujourd_hui,
-        valide_jusqua__gte=aujourd_hui,
-    ).count()
+    tickets_valides = PorteMonnaieTicket.solde(request.user, aujourd_hui).disponibles
 
     # Historique QR codes (5 derniers)
     historique_qr = CodeQR.objects.filter(
@@ -343,11 +331,7 @@ def generer_qrcode(request):
     aujourd_hui = timezone.now().date()
 
     # Vérifier tickets disponibles
-    if not request.user.tickets.filter(
-        statut='DISPONIBLE',
-        valide_de__lte=aujourd_hui,
-        valide_jusqua__gte=aujourd_hui,
-    ).exists():
+    if PorteMonnaieTicket.solde(request.user, aujourd_hui).disponibles <= 0:
         return JsonResponse({'error': 'Aucun ticket valide — impossible de générer un QR code'}, status=400)
 
     # Invalider les anciens QR
@@ -362,7 +346,7 @@ def generer_qrcode(request):
             'message': 'QR Code généré avec succès',
             'code':    qr.code,
             'expire_le': qr.expire_le.isoformat(),
-            'image_url': qr.image_qr.url if qr.image_qr else '',
+            'image_url': qr.url_image,
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
@@ -378,3 +362,22 @@ def invalider_qrcode(request, pk):
     qr.save()
     return JsonResponse({'success': True, 'message': 'QR Code invalidé'})
 
+@login_required
+@require_http_methods(["GET"])
+def image_qrcode(request, pk):
+    """Image du QR code rendue à la demande (PNG, ou SVG avec ?format=svg)."""
+    format_image = request.GET.get('format', 'png')
+    if format_image not in FORMATS:
+        return JsonResponse({'error': 'Format non supporté'}, status=400)
+
+    codes = CodeQR.objects.select_related('utilisateur')
+    if not request.user.is_superuser:
+        codes = codes.filter(utilisateur=request.user)
+    qr = get_object_or_404(codes, pk=pk)
+
+    response = HttpResponse(rendre_image(qr.contenu_qr(), format_image), content_type=FORMATS[format_image])
+    # Le contenu d'un code ne change jamais : cache navigateur jusqu'à son expiration
+    restant = int((qr.expire_le - timezone.now()).total_seconds())
+    response['Cache-Control'] = f'private, max-age={max(restant, 0)}'
+    return response
+
@@ -170,28 +170,21 @@ class TransactionTicketAdmin(admin.ModelAdmin):
 
     @admin.action(description='📥 Exporter en CSV')
     def exporter_csv(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
-        response.write('\ufeff')
-        writer = csv.writer(response)
-        writer.writerow(['Numéro', 'Client', 'Matricule', 'Caissier', 'Tickets', 'Montant total', 'Subvention', 'Montant payé', 'Mode', 'Statut', 'Date'])
-        for t in queryset.select_related('client', 'caissier'):
-            writer.writerow([
-                t.numero_transaction,
-                t.client.get_full_name() if t.client else '',
-                t.client.matricule if t.client else '',
-                t.caissier.get_full_name() if t.caissier else '',
-                t.nombre_tickets,
-                f"{float(t.montant_total):,.0f}" if t.montant_total else '0',
-                f"{float(t.subvention_totale):,.0f}" if t.subvention_totale else '0',
-                f"{float(t.montant_paye):,.0f}",
-                t.get_mode_paiement_display(),
-                t.get_statut_display(),
-                t.date_transaction.strftime('%d/%m/%Y %H:%M') if t.date_transaction else '',
-            ])
-        return response
+        from apps.settings.exportation import exporter
+        colonnes = [
+            ('Numéro',       lambda t: t.numero_transaction),
+            ('Client',       lambda t: t.client.get_full_name() if t.client else ''),
+            ('Matricule',    lambda t: t.client.matricule if t.client else ''),
+            ('Caissier',     lambda t: t.caissier.get_full_name() if t.caissier else ''),
+            ('Tickets',      lambda t: t.nombre_tickets),
+            ('Montant total', lambda t: f"{float(t.montant_total):,.0f}" if t.montant_total else '0'),
+            ('Subvention',   lambda t: f"{float(t.subvention_totale):,.0f}" if t.subvention_totale else '0'),
+            ('Montant payé', lambda t: f"{float(t.montant_paye):,.0f}"),
+            ('Mode',         lambda t: t.get_mode_paiement_display()),
+            ('Statut',       lambda t: t.get_statut_display()),
+            ('Date',         lambda t: t.date_transaction.strftime('%d/%m/%Y %H:%M') if t.date_transaction else ''),
+        ]
+        return exporter(queryset.select_related('client', 'caissier'), colonnes, 'transactions')
 
     # ── Override get_queryset ───────────────────
 
@@ -0,0 +1,66 @@
+"""
+Reconstruit la table StatistiqueJournaliere à partir de l'historique
+(transactions terminées et tickets consommés).
+
+    python manage.py reconstruire_statistiques
+    python manage.py reconstruire_statistiques --depuis 2026-01-01
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncDate
+
+from apps.tickets.models import Ticket
+from apps.transactions.models import TransactionTicket, StatistiqueJournaliere
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les statistiques journalières depuis l'historique des ventes et consommations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', help='Date de début (AAAA-MM-JJ) ; par défaut tout l\'historique')
+
+    def handle(self, *args, **options):
+        depuis = None
+        if options['depuis']:
+            try:
+                depuis = date.fromisoformat(options['depuis'])
+            except ValueError:
+                raise CommandError('Format de date attendu : AAAA-MM-JJ')
+
+        ventes = TransactionTicket.objects.filter(statut='TERMINEE')
+        consommations = Ticket.objects.filter(statut='CONSOMME', date_consommation__isnull=False)
+        anciennes = StatistiqueJournaliere.objects.all()
+        if depuis:
+            ventes = ventes.filter(date_transaction__date__gte=depuis)
+            consommations = consommations.filter(date_consommation__date__gte=depuis)
+            anciennes = anciennes.filter(date__gte=depuis)
+
+        lignes = [
+            StatistiqueJournaliere(
+                date=v['jour'], agence_id=v['agence_id'], caissier_id=v['caissier_id'],
+                tickets_vendus=v['tickets'] or 0, montant=v['montant'] or 0, subvention=v['subvention'] or 0,
+            )
+            for v in ventes.annotate(jour=TruncDate('date_transaction'))
+            .values('jour', 'agence_id', 'caissier_id')
+            .annotate(tickets=Sum('nombre_tickets'), montant=Sum('montant_total'), subvention=Sum('subvention_totale'))
+        ]
+        lignes += [
+            StatistiqueJournaliere(
+                date=c['jour'], restaurant_id=c['restaurant_consommateur_id'],
+                agence_id=c['proprietaire__agence_id'], tickets_consommes=c['nb'],
+            )
+            for c in consommations.annotate(jour=TruncDate('date_consommation'))
+            .values('jour', 'restaurant_consommateur_id', 'proprietaire__agence_id')
+            .annotate(nb=Count('id'))
+        ]
+
+        with transaction.atomic():
+            supprimees, _ = anciennes.delete()
+            StatistiqueJournaliere.objects.bulk_create(lignes, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(lignes)} ligne(s) reconstruite(s), {supprimees} ancienne(s) supprimée(s)."
+        ))
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_utilisateur_type_utilisateur'),
+        ('restaurants', '0003_alter_menu_unique_together'),
+        ('transactions', '0004_alter_transactionticket_mode_paiement_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, verbose_name='Date')),
+                ('tickets_vendus', models.IntegerField(default=0, verbose_name='Tickets vendus')),
+                ('tickets_consommes', models.IntegerField(default=0, verbose_name='Tickets consommés')),
+                ('montant', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Montant encaissé')),
+                ('subvention', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Subvention')),
+                ('agence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_journalieres', to='accounts.agence')),
+                ('caissier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_journalieres', to=settings.AUTH_USER_MODEL)),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_journalieres', to='restaurants.restaurant')),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['restaurant', 'date'], name='transaction_restaur_55229d_idx'), models.Index(fields=['agence', 'date'], name='transaction_agence__d9c8e9_idx'), models.Index(fields=['caissier', 'date'], name='transaction_caissie_819b56_idx')],
+            },
+        ),
+    ]
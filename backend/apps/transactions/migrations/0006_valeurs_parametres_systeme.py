@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:33
+
+import apps.settings.parametres
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_statistiquejournaliere'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transactionticket',
+            name='prix_unitaire',
+            field=models.DecimalField(decimal_places=2, default=apps.settings.parametres.prix_ticket_courant, max_digits=10, verbose_name='Prix unitaire'),
+        ),
+        migrations.AlterField(
+            model_name='transactionticket',
+            name='subvention_par_ticket',
+            field=models.DecimalField(decimal_places=2, default=apps.settings.parametres.subvention_courante, max_digits=10, verbose_name='Subvention par ticket'),
+        ),
+    ]
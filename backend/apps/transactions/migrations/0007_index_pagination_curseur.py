@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_index_pagination_curseur'),
+        ('transactions', '0006_valeurs_parametres_systeme'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionticket',
+            index=models.Index(fields=['date_transaction', 'id'], name='transaction_date_tr_471a75_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionticket',
+            index=models.Index(fields=['caissier', 'date_transaction'], name='transaction_caissie_9c7db1_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_index_pagination_curseur'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logconsommation',
+            name='reference_hors_ligne',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Référence hors ligne'),
+        ),
+    ]
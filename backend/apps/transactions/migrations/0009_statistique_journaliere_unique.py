@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:51
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionner_doublons(apps, schema_editor):
+    """Lignes en double (premiers incréments simultanés) fusionnées dans la plus ancienne"""
+    StatistiqueJournaliere = apps.get_model('transactions', 'StatistiqueJournaliere')
+    cle = ('date', 'restaurant_id', 'agence_id', 'caissier_id')
+    compteurs = ('tickets_vendus', 'tickets_consommes', 'montant', 'subvention')
+    doublons = (
+        StatistiqueJournaliere.objects.order_by().values(*cle)
+        .annotate(n=Count('id'), garde=Min('id'), **{f'total_{c}': Sum(c) for c in compteurs})
+        .filter(n__gt=1)
+    )
+    for groupe in doublons:
+        lignes = StatistiqueJournaliere.objects.filter(**{c: groupe[c] for c in cle})
+        lignes.filter(pk=groupe['garde']).update(**{c: groupe[f'total_{c}'] for c in compteurs})
+        lignes.exclude(pk=groupe['garde']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_recherche_utilisateur'),
+        ('restaurants', '0004_valeurs_parametres_systeme'),
+        ('transactions', '0008_logconsommation_reference_hors_ligne'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_doublons, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='statistiquejournaliere',
+            constraint=models.UniqueConstraint(models.F('date'), django.db.models.functions.comparison.Coalesce('restaurant', models.Value(0)), django.db.models.functions.comparison.Coalesce('agence', models.Value(0)), django.db.models.functions.comparison.Coalesce('caissier', models.Value(0)), name='statistique_journaliere_unique'),
+        ),
+    ]
@@ -1,13 +1,16 @@
 """
 Modèles pour la gestion des transactions de tickets et des consommations
 """
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+from apps.settings.parametres import charger_parametres, prix_ticket_courant, subvention_courante
+
 
 class TransactionTicket(models.Model):
     """Transaction d'achat ou remboursement de tickets"""
@@ -68,8 +71,8 @@ class TransactionTicket(models.Model):
     valide_jusqu_a = models.DateField('Valide jusqu\'au', null=True, blank=True)
 
     # Montants
-    prix_unitaire = models.DecimalField('Prix unitaire', max_digits=10, decimal_places=2, default=settings.TICKET_PRICE)
-    subvention_par_ticket = models.DecimalField('Subvention par ticket', max_digits=10, decimal_places=2, default=settings.TICKET_SUBSIDY)
+    prix_unitaire = models.DecimalField('Prix unitaire', max_digits=10, decimal_places=2, default=prix_ticket_courant)
+    subvention_par_ticket = models.DecimalField('Subvention par ticket', max_digits=10, decimal_places=2, default=subvention_courante)
     montant_total = models.DecimalField('Montant total', max_digits=10, decimal_places=2, null=True, blank=True)
     subvention_totale = models.DecimalField('Subvention totale', max_digits=10, decimal_places=2, null=True, blank=True)
 
@@ -93,6 +96,9 @@ class TransactionTicket(models.Model):
             models.Index(fields=['numero_transaction']),
             models.Index(fields=['client', 'date_transaction']),
             models.Index(fields=['statut']),
+            # pagination par curseur (liste admin, historique caissier)
+            models.Index(fields=['date_transaction', 'id']),
+            models.Index(fields=['caissier', 'date_transaction']),
         ]
 
     def __str__(self):
@@ -144,10 +150,15 @@ class TransactionTicket(models.Model):
 
     def clean(self):
         """Validation de la transaction"""
-        if self.nombre_tickets < settings.MIN_TICKETS_PER_TRANSACTION:
-            raise ValidationError(f'Nombre minimum de tickets : {settings.MIN_TICKETS_PER_TRANSACTION}')
-        if self.nombre_tickets > settings.MAX_TICKETS_PER_TRANSACTION:
-            raise ValidationError(f'Nombre maximum de tickets : {settings.MAX_TICKETS_PER_TRANSACTION}')
+        params = charger_parametres()
+        min_tickets = params.tickets_min_par_transaction if params else settings.MIN_TICKETS_PER_TRANSACTION
+        max_tickets = params.tickets_max_par_transaction if params else settings.MAX_TICKETS_PER_TRANSACTION
+        max_mensuel = params.transactions_max_par_mois if params else settings.MAX_TRANSACTIONS_PER_MONTH
+
+        if self.nombre_tickets < min_tickets:
+            raise ValidationError(f'Nombre minimum de tickets : {min_tickets}')
+        if self.nombre_tickets > max_tickets:
+            raise ValidationError(f'Nombre maximum de tickets : {max_tickets}')
 
         if self.pk is None:
             debut_mois = timezone.now().date().replace(day=1)
@@ -159,58 +170,85 @@ class TransactionTicket(models.Model):
                 date_transaction__gte=debut_mois,
                 date_transaction__lt=fin_mois
             ).count()
-            if nb_transactions >= settings.MAX_TRANSACTIONS_PER_MONTH:
-                raise ValidationError(f'Limite de {settings.MAX_TRANSACTIONS_PER_MONTH} transaction(s)/mois atteinte')
+            if nb_transactions >= max_mensuel:
+                raise ValidationError(f'Limite de {max_mensuel} transaction(s)/mois atteinte')
 
     def generer_tickets(self):
         """Générer les tickets individuels"""
-        from apps.tickets.models import Ticket
+        from apps.tickets.models import PorteMonnaieTicket, SequenceTicket, Ticket
 
         if self.statut != 'TERMINEE':
             raise ValidationError('Les tickets ne peuvent être générés que pour les transactions complétées')
         if self.tickets_genere.exists():
             raise ValidationError('Tickets déjà générés pour cette transaction')
 
+        # Réservation des numéros, tickets, solde et statistiques dans une seule
+        # transaction : un échec rend la plage, la numérotation reste sans trou
         annee_mois = self.date_transaction.strftime('%Y%m')
-        dernier_ticket = Ticket.objects.filter(numero_ticket__startswith=annee_mois).order_by('-numero_ticket').first()
-
-        start_sequence = int(dernier_ticket.numero_ticket.split('-')[1]) + 1 if dernier_ticket else 1
-
-        tickets = []
-        for i in range(self.nombre_tickets):
-            numero_ticket = f"{annee_mois}-{str(start_sequence + i).zfill(5)}"
-            tickets.append(Ticket(
-                numero_ticket=numero_ticket,
-                proprietaire=self.client,
-                transaction=self,
-                valide_de=self.valide_de,
-                valide_jusqua=self.valide_jusqu_a,
-                prix_paye=self.prix_unitaire,
-                montant_subventionne=self.subvention_par_ticket
-            ))
-
-        Ticket.objects.bulk_create(tickets)
-        self.premier_ticket = tickets[0].numero_ticket
-        self.dernier_ticket = tickets[-1].numero_ticket
-        self.save(update_fields=['premier_ticket', 'dernier_ticket'])
+        with transaction.atomic():
+            start_sequence = SequenceTicket.reserver(annee_mois, self.nombre_tickets)
+
+            tickets = []
+            for i in range(self.nombre_tickets):
+                numero_ticket = f"{annee_mois}-{str(start_sequence + i).zfill(5)}"
+                tickets.append(Ticket(
+                    numero_ticket=numero_ticket,
+                    proprietaire=self.client,
+                    transaction=self,
+                    valide_de=self.valide_de,
+                    valide_jusqua=self.valide_jusqu_a,
+                    prix_paye=self.prix_unitaire,
+                    montant_subventionne=self.subvention_par_ticket
+                ))
+
+            Ticket.objects.bulk_create(tickets)
+            self.premier_ticket = tickets[0].numero_ticket
+            self.dernier_ticket = tickets[-1].numero_ticket
+            self.save(update_fields=['premier_ticket', 'dernier_ticket'])
+            valeur = self.nombre_tickets * self.prix_unitaire
+            PorteMonnaieTicket.mouvement(
+                self.client_id, self.valide_de, self.valide_jusqu_a,
+                disponibles=self.nombre_tickets, valeur_disponible=valeur, valeur_totale=valeur,
+            )
+            StatistiqueJournaliere.incrementer(
+                timezone.localdate(self.date_transaction),
+                agence_id=self.agence_id, caissier_id=self.caissier_id,
+                tickets_vendus=self.nombre_tickets,
+                montant=self.montant_total, subvention=self.subvention_totale,
+            )
         return tickets
 
     def completer(self):
-        """Compléter la transaction et générer les tickets"""
-        self.statut = 'TERMINEE'
-        self.save()
-        return self.generer_tickets()
+        """Compléter la transaction et générer les tickets (tout ou rien)"""
+        with transaction.atomic():
+            self.statut = 'TERMINEE'
+            self.save()
+            return self.generer_tickets()
 
     def rembourser(self):
         """Rembourser la transaction"""
         if self.statut != 'TERMINEE':
             raise ValidationError('Seules les transactions complétées peuvent être remboursées')
-        if self.tickets_genere.filter(statut='CONSOMME').exists():
-            raise ValidationError('Impossible de rembourser: certains tickets ont déjà été consommés')
-
-        self.tickets_genere.update(statut='ANNULE')
+        from apps.tickets.models import PorteMonnaieTicket
+
+        with transaction.atomic():
+            # Statut réclamé en base : de deux remboursements simultanés, un seul passe
+            if not TransactionTicket.objects.filter(pk=self.pk, statut='TERMINEE').update(
+                statut='REMBOURSE', date_modification=timezone.now(),
+            ):
+                raise ValidationError('Seules les transactions complétées peuvent être remboursées')
+            if self.tickets_genere.filter(statut='CONSOMME').exists():
+                raise ValidationError('Impossible de rembourser: certains tickets ont déjà été consommés')
+
+            PorteMonnaieTicket.changer_statut(self.tickets_genere.all(), 'ANNULE')
+            # La vente sort des statistiques du jour où elle avait été enregistrée
+            StatistiqueJournaliere.incrementer(
+                timezone.localdate(self.date_transaction),
+                agence_id=self.agence_id, caissier_id=self.caissier_id,
+                tickets_vendus=-self.nombre_tickets,
+                montant=-(self.montant_total or 0), subvention=-(self.subvention_totale or 0),
+            )
         self.statut = 'REMBOURSE'
-        self.save()
 
 
 class LogConsommation(models.Model):
@@ -226,6 +264,8 @@ class LogConsommation(models.Model):
     menu_consomme = models.ForeignKey('restaurants.Menu', on_delete=models.SET_NULL, null=True, blank=True, related_name='logs_consommation')
     agence = models.ForeignKey('accounts.Agence', on_delete=models.SET_NULL, null=True, related_name='logs_consommation')
     notes = models.TextField('Notes', blank=True)
+    # Identifiant du scan attribué par le scanner hors ligne : une synchronisation rejouée ne consomme pas deux fois
+    reference_hors_ligne = models.CharField('Référence hors ligne', max_length=64, unique=True, null=True, blank=True)
 
     date_creation = models.DateTimeField('Créé le', auto_now_add=True)
 
@@ -243,3 +283,76 @@ class LogConsommation(models.Model):
         return f"Consommation {self.ticket.numero_ticket} - {self.date_consommation}"
 
 
+
+
+class StatistiqueJournaliere(models.Model):
+    """
+    Compteurs journaliers pré-agrégés (ventes et consommations).
+
+    Les ventes alimentent les lignes (date, agence, caissier), les consommations
+    les lignes (date, restaurant, agence du client). Une seule ligne par clé
+    (contrainte unique, NULL compris) : deux premiers incréments simultanés
+    se retrouvent sur la même.
+    """
+
+    date = models.DateField('Date', db_index=True)
+    restaurant = models.ForeignKey('restaurants.Restaurant', on_delete=models.CASCADE, null=True, blank=True, related_name='statistiques_journalieres')
+    agence = models.ForeignKey('accounts.Agence', on_delete=models.CASCADE, null=True, blank=True, related_name='statistiques_journalieres')
+    caissier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='statistiques_journalieres')
+
+    tickets_vendus = models.IntegerField('Tickets vendus', default=0)
+    tickets_consommes = models.IntegerField('Tickets consommés', default=0)
+    montant = models.DecimalField('Montant encaissé', max_digits=12, decimal_places=2, default=0)
+    subvention = models.DecimalField('Subvention', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Statistique journalière'
+        verbose_name_plural = 'Statistiques journalières'
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['restaurant', 'date']),
+            models.Index(fields=['agence', 'date']),
+            models.Index(fields=['caissier', 'date']),
+        ]
+        constraints = [
+            # Les colonnes absentes valent NULL : ramenées à 0 pour que l'unicité les couvre
+            models.UniqueConstraint(
+                'date', Coalesce('restaurant', models.Value(0)), Coalesce('agence', models.Value(0)),
+                Coalesce('caissier', models.Value(0)), name='statistique_journaliere_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Stats {self.date} — {self.tickets_vendus} vendus / {self.tickets_consommes} consommés"
+
+    @classmethod
+    def incrementer(cls, date, restaurant_id=None, agence_id=None, caissier_id=None, **compteurs):
+        """Ajoute les compteurs (valeurs négatives acceptées) à la ligne du jour"""
+        compteurs = {champ: valeur for champ, valeur in compteurs.items() if valeur}
+        if not compteurs:
+            return
+        cle = {'date': date, 'restaurant_id': restaurant_id, 'agence_id': agence_id, 'caissier_id': caissier_id}
+        maj = {champ: models.F(champ) + v for champ, v in compteurs.items()}
+        if cls.objects.filter(**cle).update(**maj):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**cle, **compteurs)
+        except IntegrityError:
+            # Créée entre-temps par une vente ou une consommation concurrente
+            cls.objects.filter(**cle).update(**maj)
+
+    @classmethod
+    def serie(cls, nb_jours, *champs, fin=None, **filtres):
+        """Totaux par jour des `nb_jours` derniers jours, jours vides inclus — une seule requête"""
+        from apps.settings.series import serie_temporelle
+
+        fin = fin or timezone.localdate()
+        debut = fin - timezone.timedelta(days=nb_jours - 1)
+        return [
+            {'date': ligne.pop('periode'), **ligne}
+            for ligne in serie_temporelle(
+                cls.objects.filter(**filtres), 'date', debut, fin,
+                valeurs={champ: models.Sum(champ) for champ in champs},
+            )
+        ]
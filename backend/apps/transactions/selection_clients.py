@@ -0,0 +1,144 @@
+"""
+Sélection du client à l'écran de vente (recherche au fil de la frappe).
+
+La page caissier n'embarque plus la liste des clients : le champ de recherche
+interroge caissier_recherche_clients, qui répond une page JSON.
+
+- Index en mémoire par agence : (id, texte de recherche plié) des clients
+  actifs, triés par nom. Une recherche filtre cette liste en Python, sans
+  LIKE '%…%' en base. L'index est reconstruit quand le jeton de version de
+  l'agence (ou le jeton global) change ; les signaux sur Utilisateur le
+  renouvellent, le jeton est relu au plus toutes les DELAI_VERIFICATION
+  secondes.
+- Les ids de la page sont ensuite chargés en une requête, avec l'éligibilité
+  calculée par sous-requêtes : achats du mois, tickets valides restants.
+  La même requête revérifie agence / type / statut : une entrée périmée de
+  l'index (client déplacé, désactivé) disparaît simplement du résultat.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, time as heure
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.accounts.recherche import plier
+
+PAR_PAGE = 20
+PAR_PAGE_MAX = 50
+DELAI_VERIFICATION = getattr(settings, 'CLIENT_INDEX_REFRESH_SECONDS', 5)
+CLE_VERSION_GLOBALE = 'selection_clients:version'
+TOUTES = 'toutes'
+
+_index = {}  # {agence_id | TOUTES: {'version', 'verifie_le', 'entrees': [(id, texte)]}}
+_verrou = threading.Lock()
+
+
+def _cle_version(perimetre):
+    return f'selection_clients:version:{perimetre}'
+
+
+def invalider(agence_id=None):
+    """Nouveau jeton pour l'agence (ou TOUTES) et l'index toutes agences ; sans argument : tous les index"""
+    if agence_id is None:
+        cache.set(CLE_VERSION_GLOBALE, uuid.uuid4().hex, None)
+        _index.clear()
+        return
+    cache.set_many({_cle_version(agence_id): uuid.uuid4().hex, _cle_version(TOUTES): uuid.uuid4().hex}, None)
+    _index.pop(agence_id, None)
+    _index.pop(TOUTES, None)
+
+
+def _version(perimetre):
+    cles = [CLE_VERSION_GLOBALE, _cle_version(perimetre)]
+    for cle in cles:
+        cache.add(cle, uuid.uuid4().hex, None)
+    jetons = cache.get_many(cles)
+    return tuple(jetons.get(cle) for cle in cles)
+
+
+def clients_du_perimetre(perimetre):
+    """Clients actifs de l'agence (ou de toutes les agences)"""
+    from apps.accounts.models import Utilisateur
+
+    qs = Utilisateur.objects.filter(type_utilisateur='CLIENT', est_actif=True)
+    return qs if perimetre == TOUTES else qs.filter(agence_id=perimetre)
+
+
+def entrees(perimetre):
+    """[(id, texte plié)] du périmètre, triés par nom / prénom"""
+    maintenant = time.monotonic()
+    local = _index.get(perimetre)
+    if local and maintenant - local['verifie_le'] < DELAI_VERIFICATION:
+        return local['entrees']
+
+    version = _version(perimetre)
+    if local is None or local['version'] != version:
+        with _verrou:
+            local = _index.get(perimetre)
+            if local is None or local['version'] != version:
+                liste = list(
+                    clients_du_perimetre(perimetre)
+                    .order_by('nom', 'prenom', 'id').values_list('id', 'recherche')
+                )
+                local = {'version': version, 'entrees': liste}
+                _index[perimetre] = local
+    local['verifie_le'] = maintenant
+    return local['entrees']
+
+
+def chercher(perimetre, terme, page=1, par_page=PAR_PAGE):
+    """(ids de la page, a_suivante) : clients dont le texte contient tous les mots du terme"""
+    mots = plier(terme).split()
+    debut = (page - 1) * par_page
+    trouves = []
+    for pk, texte in entrees(perimetre):
+        if all(mot in texte for mot in mots):
+            trouves.append(pk)
+            if len(trouves) > debut + par_page:
+                break
+    return trouves[debut:debut + par_page], len(trouves) > debut + par_page
+
+
+def avec_eligibilite(queryset, aujourd_hui):
+    """Annote nb_achats_mois et nb_tickets_valides (sous-requêtes corrélées, une seule requête)"""
+    from apps.tickets.models import Ticket
+    from .models import TransactionTicket
+
+    debut_mois = timezone.make_aware(datetime.combine(aujourd_hui.replace(day=1), heure.min))
+    achats = (
+        TransactionTicket.objects
+        .filter(client=OuterRef('pk'), type_transaction='ACHAT', statut='TERMINEE',
+                date_transaction__gte=debut_mois)
+        .order_by().values('client').annotate(n=Count('id')).values('n')
+    )
+    valides = (
+        Ticket.objects
+        .filter(proprietaire=OuterRef('pk'), statut='DISPONIBLE',
+                valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui)
+        .order_by().values('proprietaire').annotate(n=Count('id')).values('n')
+    )
+    return queryset.annotate(
+        nb_achats_mois=Coalesce(Subquery(achats, output_field=IntegerField()), Value(0)),
+        nb_tickets_valides=Coalesce(Subquery(valides, output_field=IntegerField()), Value(0)),
+    )
+
+
+def page_clients(perimetre, terme, page, par_page, max_mensuel):
+    """(clients de la page annotés + limite_atteinte, a_suivante), dans l'ordre de l'index"""
+    ids, a_suivante = chercher(perimetre, terme, page, par_page)
+    if not ids:
+        return [], a_suivante
+    qs = avec_eligibilite(
+        clients_du_perimetre(perimetre).filter(pk__in=ids).select_related('agence'),
+        timezone.localdate(),
+    )
+    par_id = {c.pk: c for c in qs}
+    clients = [par_id[pk] for pk in ids if pk in par_id]
+    for c in clients:
+        c.limite_atteinte = c.nb_achats_mois >= max_mensuel
+    return clients, a_suivante
@@ -1,3 +1,235 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.models import Agence, Direction, Utilisateur
+from apps.tickets.models import PorteMonnaieTicket, SequenceTicket, Ticket
+from . import selection_clients
+from .models import StatistiqueJournaliere, TransactionTicket
+
+
+class GenerationTicketsTests(TransactionTestCase):
+    """Numérotation sans trou : une vente qui échoue ne consomme aucun numéro"""
+
+    def setUp(self):
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        self.agence = Agence.objects.create(
+            nom='Agence Centre', code='AC', adresse='Avenue Kwame Nkrumah',
+            ville='Ouagadougou', telephone='+22625000000', direction=direction,
+        )
+        self.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client',
+            type_utilisateur='CLIENT', agence=self.agence,
+        )
+
+    def vendre(self, nombre_tickets):
+        vente = TransactionTicket.objects.create(
+            numero_transaction=f'VENTE-{TransactionTicket.objects.count() + 1}',
+            client=self.client_lonab, agence=self.agence, nombre_tickets=nombre_tickets,
+        )
+        return vente, vente.completer()
+
+    def test_echec_insertion_rend_la_plage(self):
+        vente, _ = self.vendre(3)
+        periode = vente.date_transaction.strftime('%Y%m')
+
+        with mock.patch.object(Ticket.objects, 'bulk_create', side_effect=DatabaseError('insertion refusée')):
+            with self.assertRaises(DatabaseError):
+                self.vendre(4)
+
+        self.assertEqual(SequenceTicket.objects.get(periode=periode).dernier_numero, 3)
+        self.assertEqual(PorteMonnaieTicket.objects.get(utilisateur=self.client_lonab).disponibles, 3)
+        # La vente en échec n'est pas restée « terminée » sans tickets
+        self.assertFalse(TransactionTicket.objects.filter(statut='TERMINEE', tickets_genere__isnull=True).exists())
+
+        _, tickets = self.vendre(2)
+        self.assertEqual([t.numero_ticket for t in tickets], [f'{periode}-00004', f'{periode}-00005'])
+
+
+class StatistiqueJournaliereTests(TestCase):
+    """Une ligne par (date, restaurant, agence, caissier), même sous incréments simultanés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        cls.agence = Agence.objects.create(
+            nom='Agence Centre', code='AC', adresse='Avenue Kwame Nkrumah',
+            ville='Ouagadougou', telephone='+22625000000', direction=direction,
+        )
+        cls.jour = timezone.localdate()
+
+    def test_ligne_unique_colonnes_vides_comprises(self):
+        StatistiqueJournaliere.objects.create(date=self.jour, agence=self.agence, tickets_vendus=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StatistiqueJournaliere.objects.create(date=self.jour, agence=self.agence, tickets_vendus=1)
+
+    def test_premier_increment_concurrent(self):
+        StatistiqueJournaliere.incrementer(self.jour, agence_id=self.agence.pk, tickets_vendus=1)
+
+        # L'UPDATE ne voit pas encore la ligne qu'une autre transaction vient de créer
+        update = QuerySet.update
+        appels = []
+
+        def update_en_retard(queryset, **valeurs):
+            appels.append(valeurs)
+            return 0 if len(appels) == 1 else update(queryset, **valeurs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_en_retard):
+            StatistiqueJournaliere.incrementer(self.jour, agence_id=self.agence.pk, tickets_vendus=2)
+
+        ligne = StatistiqueJournaliere.objects.get()
+        self.assertEqual(ligne.tickets_vendus, 3)
+
+
+class RemboursementTests(TestCase):
+    """Remboursement : statut réclamé en base, statistiques décomptées une seule fois"""
+
+    @classmethod
+    def setUpTestData(cls):
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        cls.agence = Agence.objects.create(
+            nom='Agence Centre', code='AC', adresse='Avenue Kwame Nkrumah',
+            ville='Ouagadougou', telephone='+22625000000', direction=direction,
+        )
+        cls.client_lonab = Utilisateur.objects.create_user(
+            'client@lonab.bf', 'secret', prenom='Mariam', nom='Client',
+            type_utilisateur='CLIENT', agence=cls.agence,
+        )
+
+    def setUp(self):
+        self.vente = TransactionTicket.objects.create(client=self.client_lonab, agence=self.agence, nombre_tickets=4)
+        self.vente.completer()
+
+    def vendus(self):
+        return StatistiqueJournaliere.objects.get(agence=self.agence).tickets_vendus
+
+    def test_remboursements_simultanes(self):
+        autre_copie = TransactionTicket.objects.get(pk=self.vente.pk)  # lue avant le premier remboursement
+        self.vente.rembourser()
+        with self.assertRaises(ValidationError):
+            autre_copie.rembourser()
+
+        self.assertEqual(self.vendus(), 0)
+        self.assertEqual(TransactionTicket.objects.get(pk=self.vente.pk).statut, 'REMBOURSE')
+        self.assertEqual(PorteMonnaieTicket.objects.get(utilisateur=self.client_lonab).annules, 4)
+
+    def test_ticket_consomme_rien_ne_change(self):
+        Ticket.objects.filter(pk=self.vente.tickets_genere.first().pk).update(statut='CONSOMME')
+        with self.assertRaises(ValidationError):
+            self.vente.rembourser()
+
+        self.assertEqual(self.vendus(), 4)
+        self.assertEqual(TransactionTicket.objects.get(pk=self.vente.pk).statut, 'TERMINEE')
+
+
+class SelectionClientsTests(TestCase):
+    """Sélecteur de client de la vente : index par agence, invalidation, éligibilité"""
+
+    @classmethod
+    def setUpTestData(cls):
+        direction = Direction.objects.create(nom='Direction Générale', code='DG')
+        cls.centre, cls.nord = [
+            Agence.objects.create(
+                nom=f'Agence {nom}', code=code, adresse='Avenue Kwame Nkrumah',
+                ville='Ouagadougou', telephone='+22625000000', direction=direction,
+            )
+            for nom, code in (('Centre', 'AC'), ('Nord', 'AN'))
+        ]
+        cls.caissier = Utilisateur.objects.create_user(
+            'caissier@lonab.bf', 'secret', prenom='Issa', nom='Caissier',
+            type_utilisateur='CAISSIER', agence=cls.centre,
+        )
+        cls.zoe = cls.creer_client('Zoé', 'Ouédraogo', cls.centre, matricule='MAT-0042')
+        cls.ali = cls.creer_client('Ali', 'Traoré', cls.centre)
+        cls.awa = cls.creer_client('Awa', 'Ouattara', cls.nord)
+
+    @classmethod
+    def creer_client(cls, prenom, nom, agence, **champs):
+        return Utilisateur.objects.create_user(
+            f'{prenom.lower()}.{nom.lower()}@lonab.bf', 'secret', prenom=prenom, nom=nom,
+            type_utilisateur='CLIENT', agence=agence, **champs,
+        )
+
+    def setUp(self):
+        cache.clear()
+        selection_clients._index.clear()
+
+    def ids(self, perimetre, terme, **kwargs):
+        return selection_clients.chercher(perimetre, terme, **kwargs)
+
+    def test_recherche_pliee_dans_l_agence(self):
+        self.assertEqual(self.ids(self.centre.pk, 'oued'), ([self.zoe.pk], False))
+        self.assertEqual(self.ids(self.centre.pk, 'MAT-0042'), ([self.zoe.pk], False))
+        self.assertEqual(self.ids(self.centre.pk, 'ouat'), ([], False))  # cliente d'une autre agence
+        self.assertEqual(self.ids(selection_clients.TOUTES, 'ouat'), ([self.awa.pk], False))
+        # Tri par nom, pagination sans compter le reste
+        self.assertEqual(self.ids(self.centre.pk, ''), ([self.zoe.pk, self.ali.pk], False))
+        self.assertEqual(self.ids(self.centre.pk, '', par_page=1), ([self.zoe.pk], True))
+        self.assertEqual(self.ids(self.centre.pk, '', page=2, par_page=1), ([self.ali.pk], False))
+
+    def test_index_garde_en_memoire(self):
+        self.ids(self.centre.pk, 'oued')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids(self.centre.pk, 'traore'), ([self.ali.pk], False))
+
+    def test_invalidation_par_agence(self):
+        self.ids(self.centre.pk, '')
+        self.ids(self.nord.pk, '')
+        index_nord = selection_clients._index[self.nord.pk]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moussa = self.creer_client('Moussa', 'Sawadogo', self.centre)
+        self.assertNotIn(self.centre.pk, selection_clients._index)
+        self.assertIs(selection_clients._index[self.nord.pk], index_nord)
+        self.assertEqual(self.ids(self.centre.pk, 'sawa'), ([moussa.pk], False))
+
+    def test_jeton_relu_apres_delai(self):
+        """Un autre processus a invalidé l'agence : reconstruction au plus DELAI_VERIFICATION plus tard"""
+        self.ids(self.centre.pk, '')
+        Utilisateur.objects.filter(pk=self.ali.pk).update(est_actif=False)  # sans signal
+        cache.set(selection_clients._cle_version(self.centre.pk), 'autre-processus', None)
+        self.assertEqual(self.ids(self.centre.pk, 'traore'), ([self.ali.pk], False))
+
+        plus_tard = selection_clients.time.monotonic() + selection_clients.DELAI_VERIFICATION
+        with mock.patch.object(selection_clients.time, 'monotonic', return_value=plus_tard):
+            self.assertEqual(self.ids(self.centre.pk, 'traore'), ([], False))
+
+    def test_entree_perimee_ecartee(self):
+        self.ids(self.centre.pk, '')
+        # Client déplacé sans passer par les signaux : l'index du centre le garde encore
+        Utilisateur.objects.filter(pk=self.ali.pk).update(agence=self.nord)
+        clients, _ = selection_clients.page_clients(self.centre.pk, 'traore', 1, 20, max_mensuel=1)
+        self.assertEqual(clients, [])
+
+    def test_eligibilite(self):
+        vente = TransactionTicket.objects.create(client=self.zoe, agence=self.centre, nombre_tickets=3)
+        vente.completer()
+
+        self.ids(self.centre.pk, '')
+        with self.assertNumQueries(1):  # index déjà en mémoire : une requête, éligibilité comprise
+            clients, _ = selection_clients.page_clients(self.centre.pk, '', 1, 20, max_mensuel=1)
+        zoe, ali = clients
+        self.assertEqual((zoe.nb_achats_mois, zoe.nb_tickets_valides, zoe.limite_atteinte), (1, 3, True))
+        self.assertEqual((ali.nb_achats_mois, ali.nb_tickets_valides, ali.limite_atteinte), (0, 0, False))
+
+        clients, _ = selection_clients.page_clients(self.centre.pk, 'oued', 1, 20, max_mensuel=2)
+        self.assertFalse(clients[0].limite_atteinte)
+
+    def test_vue_recherche(self):
+        self.client.force_login(self.caissier)
+        reponse = self.client.get(reverse('transactions:caissier_recherche_clients'), {'q': 'oued'})
+        self.assertEqual(reponse.status_code, 200)
+        resultats = reponse.json()['resultats']
+        self.assertEqual([(r['id'], r['initiales'], r['eligible']) for r in resultats], [(self.zoe.pk, 'ZO', True)])
+
+        reponse = self.client.get(reverse('transactions:caissier_recherche_clients'), {'page': 'x'})
+        self.assertEqual(reponse.status_code, 400)
+
+        self.client.force_login(self.zoe)
+        self.assertEqual(self.client.get(reverse('transactions:caissier_recherche_clients')).status_code, 403)
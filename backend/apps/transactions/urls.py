@@ -9,6 +9,8 @@ app_name = 'transactions'
 urlpatterns = [
     # ── Admin ──────────────────────────────────────────────────
     path('', views.admin_transactions, name='admin_transactions'),
+    path('export/', views.export_transactions, name='export_transactions'),
+    path('export/consommations/', views.export_consommations, name='export_consommations'),
     path('<int:pk>/', views.transaction_detail, name='transaction_detail'),
     path('stats/', views.admin_stats, name='transaction_stats'),
 
@@ -16,6 +18,7 @@ urlpatterns = [
     path('caissier/vente/', views.caissier_confirmer_vente, name='caissier_confirmer_vente'),
     path('caissier/historique/', views.caissier_historique, name='caissier_historique'),
     path('caissier/clients/', views.caissier_clients, name='caissier_clients'),
+    path('caissier/clients/recherche/', views.caissier_recherche_clients, name='caissier_recherche_clients'),
     path('caissier/clients/<int:pk>/', views.caissier_client_detail, name='caissier_client_detail'),
     path('caissier/transaction/<int:pk>/rembourser/', views.rembourser_transaction, name='rembourser'),
 
@@ -5,15 +5,17 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Sum, Count
-from django.core.paginator import Paginator
+from django.db.models import Sum, Count
 from django.utils import timezone
-from django.conf import settings
 from dateutil.relativedelta import relativedelta
-from .models import TransactionTicket, LogConsommation
+from .models import TransactionTicket, LogConsommation, StatistiqueJournaliere
 
 from apps.accounts.models import Utilisateur, Agence
-from apps.settings.models import ParametresSysteme
+from apps.accounts.recherche import filtre_recherche
+from apps.settings.exportation import exporter, format_demande
+from apps.settings.pagination import paginer_par_curseur
+from apps.settings.parametres import valeurs_vente
+from apps.tickets.models import PorteMonnaieTicket
 
 
 def _debut_fin_mois(date=None):
@@ -23,72 +25,103 @@ def _debut_fin_mois(date=None):
     return debut, fin
 
 
-def _get_params():
-    """Charge les paramètres depuis la DB, fallback settings.py."""
-    try:
-        p = ParametresSysteme.charger()
-        return {
-            'prix_ticket': int(p.prix_ticket),
-            'subvention':  int(p.subvention_ticket),
-            'min_tickets': p.tickets_min_par_transaction,
-            'max_tickets': p.tickets_max_par_transaction,
-            'max_mensuel': p.transactions_max_par_mois,
-        }
-    except Exception:
-        return {
-            'prix_ticket': getattr(settings, 'TICKET_PRICE', 500),
-            'subvention':  getattr(settings, 'TICKET_SUBSIDY', 1500),
-            'min_tickets': getattr(settings, 'MIN_TICKETS_PER_TRANSACTION', 1),
-            'max_tickets': getattr(settings, 'MAX_TICKETS_PER_TRANSACTION', 20),
-            'max_mensuel': getattr(settings, 'MAX_TRANSACTIONS_PER_MONTH', 1),
-        }
-
-
-# ═══════════════════════════════════════════════════════════════
-# ADMIN
-# ═══════════════════════════════════════════════════════════════
-@login_required
-def admin_transactions(request):
-    if not request.user.est_admin:
-        return redirect('accounts:dashboard')
-
-    qs = TransactionTicket.objects.select_related('client', 'caissier', 'agence')
 
-    if search := request.GET.get('search'):
-        qs = qs.filter(
-            Q(numero_transaction__icontains=search) |
-            Q(client__prenom__icontains=search) |
-            Q(client__nom__icontains=search) |
-            Q(client__matricule__icontains=search)
-        )
-    if statut := request.GET.get('statut'):
-        qs = qs.filter(statut=statut)
-    if type_t := request.GET.get('type'):
-        qs = qs.filter(type_transaction=type_t)
-    if agence_id := request.GET.get('agence'):
-        qs = qs.filter(agence_id=agence_id)
-    if mois := request.GET.get('mois'):
+def _filtrer_periode_mois(qs, champ, params):
+    """Filtres communs mois (AAAA-MM), date_debut et date_fin (AAAA-MM-JJ) sur `champ`"""
+    if mois := params.get('mois'):
         try:
             annee, m = mois.split('-')
-            qs = qs.filter(date_transaction__year=annee, date_transaction__month=m)
+            qs = qs.filter(**{f'{champ}__year': annee, f'{champ}__month': m})
         except ValueError:
             pass
 
     # Filtres période (date_debut / date_fin)
-    if date_debut := request.GET.get('date_debut'):
+    if date_debut := params.get('date_debut'):
         try:
             from datetime import date as dt
             y, m, d = date_debut.split('-')
-            qs = qs.filter(date_transaction__date__gte=dt(int(y), int(m), int(d)))
+            qs = qs.filter(**{f'{champ}__date__gte': dt(int(y), int(m), int(d))})
         except Exception:
             pass
-    if date_fin := request.GET.get('date_fin'):
+    if date_fin := params.get('date_fin'):
         try:
             from datetime import date as dt
             y, m, d = date_fin.split('-')
-            qs = qs.filter(date_transaction__date__lte=dt(int(y), int(m), int(d)))
+            qs = qs.filter(**{f'{champ}__date__lte': dt(int(y), int(m), int(d))})
         except Exception:
             pass
+    return qs
+
+
+def filtrer_transactions(params):
+    """Transactions filtrées comme la liste admin (search, statut, type, agence, mois, période)"""
+    qs = TransactionTicket.objects.select_related('client', 'caissier', 'agence')
+
+    if search := params.get('search'):
+        qs = qs.filter(filtre_recherche(search, 'client__', numero='numero_transaction'))
+    if statut := params.get('statut'):
+        qs = qs.filter(statut=statut)
+    if type_t := params.get('type'):
+        qs = qs.filter(type_transaction=type_t)
+    if agence_id := params.get('agence'):
+        qs = qs.filter(agence_id=agence_id)
+    return _filtrer_periode_mois(qs, 'date_transaction', params)
+
+
+def filtrer_consommations(params):
+    """Journal des consommations : search (client), agence, restaurant, mois, période"""
+    qs = LogConsommation.objects.select_related('ticket', 'client', 'restaurant', 'agence', 'valide_par', 'menu_consomme')
+
+    if search := params.get('search'):
+        qs = qs.filter(filtre_recherche(search, 'client__', numero='ticket__numero_ticket'))
+    if agence_id := params.get('agence'):
+        qs = qs.filter(agence_id=agence_id)
+    if restaurant_id := params.get('restaurant'):
+        qs = qs.filter(restaurant_id=restaurant_id)
+    return _filtrer_periode_mois(qs, 'date_consommation', params)
+
+
+def _date_locale(valeur):
+    return timezone.localtime(valeur).strftime('%d/%m/%Y %H:%M') if valeur else ''
+
+
+COLONNES_EXPORT_TRANSACTIONS = [
+    ('Numéro',        lambda t: t.numero_transaction),
+    ('Type',          lambda t: t.get_type_transaction_display()),
+    ('Client',        lambda t: t.client.get_full_name() if t.client else ''),
+    ('Matricule',     lambda t: (t.client.matricule or '') if t.client else ''),
+    ('Agence',        lambda t: t.agence.nom if t.agence else ''),
+    ('Caissier',      lambda t: t.caissier.get_full_name() if t.caissier else ''),
+    ('Tickets',       lambda t: t.nombre_tickets),
+    ('Montant total', lambda t: float(t.montant_total or 0)),
+    ('Subvention',    lambda t: float(t.subvention_totale or 0)),
+    ('Montant payé',  lambda t: float(t.montant_paye or 0)),
+    ('Mode',          lambda t: t.get_mode_paiement_display()),
+    ('Statut',        lambda t: t.get_statut_display()),
+    ('Date',          lambda t: _date_locale(t.date_transaction)),
+]
+
+COLONNES_EXPORT_CONSOMMATIONS = [
+    ('N° Ticket',  lambda c: c.ticket.numero_ticket),
+    ('Client',     lambda c: c.client.get_full_name()),
+    ('Matricule',  lambda c: c.client.matricule or ''),
+    ('Agence',     lambda c: c.agence.nom if c.agence else ''),
+    ('Restaurant', lambda c: c.restaurant.nom),
+    ('Menu',       lambda c: c.menu_consomme.nom if c.menu_consomme else ''),
+    ('Validé par', lambda c: c.valide_par.get_full_name() if c.valide_par else ''),
+    ('Date',       lambda c: _date_locale(c.date_consommation)),
+]
+
+
+# ═══════════════════════════════════════════════════════════════
+# ADMIN
+# ═══════════════════════════════════════════════════════════════
+@login_required
+def admin_transactions(request):
+    if not request.user.est_admin:
+        return redirect('accounts:dashboard')
+
+    qs = filtrer_transactions(request.GET)
 
     totaux = qs.aggregate(
         total_montant=Sum('montant_total'),
@@ -96,10 +129,8 @@ def admin_transactions(request):
         nb_transactions=Count('id'),
     )
 
-    paginator = Paginator(qs.order_by('-date_transaction'), 10)
-    page_obj  = paginator.get_page(request.GET.get('page', 1))
+    page_obj = paginer_par_curseur(request, qs, 'date_transaction', 10)
 
-    from apps.accounts.models import Agence
     return render(request, 'transactions/admin_transactions.html', {
         'transactions': page_obj,
         'page_obj':     page_obj,
@@ -109,6 +140,24 @@ def admin_transactions(request):
         'types':        TransactionTicket.TYPE_TRANSACTION_CHOICES,
     })
 
+@login_required
+def export_transactions(request):
+    """Export complet (CSV ou XLSX via ?format=) des transactions filtrées comme la liste admin"""
+    if not request.user.est_admin:
+        return redirect('accounts:dashboard')
+    return exporter(filtrer_transactions(request.GET), COLONNES_EXPORT_TRANSACTIONS, 'transactions',
+                    format_demande(request), titre='Transactions', par_cle=True)
+
+
+@login_required
+def export_consommations(request):
+    """Export du journal des consommations (mêmes filtres de période, plus agence/restaurant)"""
+    if not request.user.est_admin:
+        return redirect('accounts:dashboard')
+    return exporter(filtrer_consommations(request.GET), COLONNES_EXPORT_CONSOMMATIONS, 'consommations',
+                    format_demande(request), titre='Consommations', par_cle=True)
+
+
 @login_required
 def transaction_detail(request, pk):
     t = get_object_or_404(TransactionTicket, pk=pk)
@@ -144,13 +193,10 @@ def admin_stats(request):
         'consommations_mois': LogConsommation.objects.filter(
             date_consommation__date__gte=debut_mois).count(),
     }
-    ventes_jour = []
-    for i in range(29, -1, -1):
-        j = aujourd_hui - timezone.timedelta(days=i)
-        nb = TransactionTicket.objects.filter(
-            statut='TERMINEE', date_transaction__date=j
-        ).aggregate(t=Sum('nombre_tickets'))['t'] or 0
-        ventes_jour.append({'date': j.strftime('%d/%m'), 'tickets': nb})
+    ventes_jour = [
+        {'date': ligne['date'].strftime('%d/%m'), 'tickets': ligne['tickets_vendus']}
+        for ligne in StatistiqueJournaliere.serie(30, 'tickets_vendus', fin=aujourd_hui)
+    ]
     return render(request, 'transactions/admin_stats.html', {
         'stats': stats, 'ventes_jour': ventes_jour,
     })
@@ -166,8 +212,7 @@ def caissier_confirmer_vente(request):
     if not (request.user.est_caissier or request.user.est_admin):
         return JsonResponse({'error': 'Permission refusée'}, status=403)
     try:
-        from apps.accounts.models import Utilisateur
-        params = _get_params()
+        params = valeurs_vente()
 
         client     = get_object_or_404(Utilisateur, pk=request.POST.get('client_id'))
         nb_tickets = int(request.POST.get('nombre_tickets', 0))
@@ -206,9 +251,9 @@ def caissier_confirmer_vente(request):
             subvention_totale=nb_tickets * params['subvention'],
             mode_paiement='ESPECES',
             notes=request.POST.get('notes', ''),
-            statut='TERMINEE',
         )
-        transaction.generer_tickets()
+        # Statut TERMINEE et tickets dans la même transaction : pas de vente terminée sans tickets
+        transaction.completer()
 
         return JsonResponse({
             'success':        True,
@@ -221,16 +266,51 @@ def caissier_confirmer_vente(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+@login_required
+def caissier_recherche_clients(request):
+    """Sélecteur de client de la vente : page JSON, agence du caissier, éligibilité incluse."""
+    if not (request.user.est_caissier or request.user.est_admin):
+        return JsonResponse({'error': 'Permission refusée'}, status=403)
+    from .selection_clients import PAR_PAGE, PAR_PAGE_MAX, TOUTES, page_clients
+
+    perimetre = request.user.agence_id
+    if perimetre is None:
+        if not request.user.est_admin:
+            return JsonResponse({'error': 'Aucune agence rattachée à votre compte'}, status=400)
+        perimetre = TOUTES
+    try:
+        page     = max(1, int(request.GET.get('page', 1)))
+        par_page = min(PAR_PAGE_MAX, max(1, int(request.GET.get('par_page', PAR_PAGE))))
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres de pagination invalides'}, status=400)
+
+    max_mensuel = valeurs_vente()['max_mensuel']
+    clients, a_suivante = page_clients(perimetre, request.GET.get('q', ''), page, par_page, max_mensuel)
+    return JsonResponse({
+        'resultats': [{
+            'id':              c.id,
+            'nom':             c.get_full_name(),
+            'initiales':       f"{c.prenom[:1]}{c.nom[:1]}".upper(),
+            'matricule':       c.matricule or '',
+            'email':           c.email,
+            'agence':          c.agence.nom if c.agence else '',
+            'nb_achats_mois':  c.nb_achats_mois,
+            'limite_atteinte': c.limite_atteinte,
+            'tickets_valides': c.nb_tickets_valides,
+            'eligible':        not c.limite_atteinte,
+        } for c in clients],
+        'page':        page,
+        'a_suivante':  a_suivante,
+        'max_mensuel': max_mensuel,
+    })
+
 @login_required
 def caissier_historique(request):
     if not (request.user.est_caissier or request.user.est_admin):
         return redirect('accounts:dashboard')
     qs = TransactionTicket.objects.filter(caissier=request.user).select_related('client', 'agence')
     if search := request.GET.get('search'):
-        qs = qs.filter(
-            Q(numero_transaction__icontains=search) |
-            Q(client__prenom__icontains=search) | Q(client__nom__icontains=search)
-        )
+        qs = qs.filter(filtre_recherche(search, 'client__', numero='numero_transaction'))
     if statut := request.GET.get('statut'):
         qs = qs.filter(statut=statut)
     if mois := request.GET.get('mois'):
@@ -239,8 +319,7 @@ def caissier_historique(request):
             qs = qs.filter(date_transaction__year=annee, date_transaction__month=m)
         except ValueError:
             pass
-    paginator = Paginator(qs.order_by('-date_transaction'), 10)
-    page_obj  = paginator.get_page(request.GET.get('page', 1))
+    page_obj = paginer_par_curseur(request, qs, 'date_transaction', 10)
     return render(request, 'transactions/caissier_historique.html', {
         'transactions': page_obj,
         'page_obj':     page_obj,
@@ -251,17 +330,13 @@ def caissier_historique(request):
 def caissier_clients(request):
     if not (request.user.est_caissier or request.user.est_admin):
         return redirect('accounts:dashboard')
-    from apps.accounts.models import Utilisateur
     # Clients de la même agence que le caissier uniquement
     qs = Utilisateur.objects.filter(
         type_utilisateur='CLIENT', est_actif=True,
         agence=request.user.agence,
     ).select_related('agence', 'direction')
     if search := request.GET.get('search'):
-        qs = qs.filter(
-            Q(prenom__icontains=search) | Q(nom__icontains=search) |
-            Q(matricule__icontains=search) | Q(email__icontains=search)
-        )
+        qs = qs.filter(filtre_recherche(search))
     from django.core.paginator import Paginator
     paginator = Paginator(qs.order_by('nom', 'prenom'), 10)
     page_obj  = paginator.get_page(request.GET.get('page', 1))
@@ -275,14 +350,14 @@ def caissier_clients(request):
 def caissier_client_detail(request, pk):
     if not (request.user.est_caissier or request.user.est_admin):
         return redirect('accounts:dashboard')
-    from apps.accounts.models import Utilisateur
-    params = _get_params()
+    params = valeurs_vente()
     client = get_object_or_404(Utilisateur, pk=pk, type_utilisateur='CLIENT')
     aujourd_hui = timezone.now().date()
     debut_mois, fin_mois = _debut_fin_mois(aujourd_hui)
     tickets_valides = client.tickets.filter(
         statut='DISPONIBLE', valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui
     )
+    solde = PorteMonnaieTicket.solde(client, aujourd_hui)
     transactions = TransactionTicket.objects.filter(client=client).order_by('-date_transaction')[:10]
     nb_transactions_mois = TransactionTicket.objects.filter(
         client=client, type_transaction='ACHAT', statut='TERMINEE',
@@ -291,7 +366,7 @@ def caissier_client_detail(request, pk):
     return render(request, 'transactions/caissier_client_detail.html', {
         'client':               client,
         'tickets_valides':      tickets_valides,
-        'nb_tickets_valides':   tickets_valides.count(),
+        'nb_tickets_valides':   solde.disponibles,
         'transactions':         transactions,
         'nb_transactions_mois': nb_transactions_mois,
         'peut_acheter':         nb_transactions_mois < params['max_mensuel'],
@@ -324,12 +399,9 @@ def client_historique(request):
     transactions = TransactionTicket.objects.filter(
         client=request.user
     ).order_by('-date_transaction')
-    tickets_valides = request.user.tickets.filter(
-        statut='DISPONIBLE', valide_de__lte=aujourd_hui, valide_jusqua__gte=aujourd_hui
-    ).count()
-    tickets_consommes_mois = request.user.tickets.filter(
-        statut='CONSOMME', date_consommation__date__gte=debut_mois
-    ).count()
+    solde = PorteMonnaieTicket.solde(request.user, aujourd_hui)
+    tickets_valides = solde.disponibles
+    tickets_consommes_mois = solde.consommes
     return render(request, 'transactions/client_historique.html', {
         'transactions':           transactions,
         'tickets_valides':        tickets_valides,
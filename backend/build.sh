@@ -1,4 +1,5 @@
 #!/usr/bin/env bash
 pip install -r requirements.txt
 python manage.py collectstatic --noinput
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py createcachetable
\ No newline at end of file
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Point d'entrée du serveur web (Procfile : uvicorn). Le flux des notifications
+(notifs:flux_notifs) n'est ouvert que sous ASGI ; entre plusieurs processus il
+passe par Redis (NOTIFICATIONS_BUS, voir settings.py).
 """
 
 import os
@@ -0,0 +1,16 @@
+"""
+Application Celery du projet — tâches de fond (emails, rapports, expiration des tickets).
+
+Lancer un worker :  celery -A config worker -l info
+Tâches périodiques :  celery -A config beat -l info   (CELERY_BEAT_SCHEDULE)
+Sans worker (développement), CELERY_TASK_ALWAYS_EAGER exécute les tâches sur place.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('config')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
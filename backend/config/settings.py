@@ -3,6 +3,8 @@ from pathlib import Path
 from datetime import timedelta
 from decouple import config
 import dj_database_url
+from celery.schedules import crontab
+from django.core.exceptions import ImproperlyConfigured
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +82,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.notifs.context_processors.notifications',
             ],
         },
     },
@@ -119,6 +122,16 @@ DATABASES = {
 #     )
 # }
 
+# Cache partagé par tous les processus (workers web, Celery) : jetons de version
+# des paramètres et des index, verrous des tâches planifiées, compteurs.
+# CACHE_URL='redis://localhost:6379/2' en production ; sinon table en base
+# (python manage.py createcachetable, voir build.sh).
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_partage'}}
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.Utilisateur'
 
@@ -203,6 +216,8 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Fichiers privés (rapports PDF) : hors MEDIA_ROOT, servis seulement par les vues qui vérifient les droits
+PRIVATE_MEDIA_ROOT = config('PRIVATE_MEDIA_ROOT', default=str(BASE_DIR / 'prive'))
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -266,9 +281,49 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='grzk ccyd omdh hwtl')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='leandrebenilde07@gmail.com')
+# Secondes : un serveur SMTP injoignable ne bloque ni un worker ni une requête
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+
+# File de tâches (Celery) — les emails partent hors de la requête.
+# En production (DEBUG=False) les tâches vont au broker : CELERY_BROKER_URL='redis://localhost:6379/1'
+# et un worker lancé (voir Procfile). En développement, sans worker, elles s'exécutent sur place.
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=DEBUG, cast=bool)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://' if CELERY_TASK_ALWAYS_EAGER else '')
+if not CELERY_TASK_ALWAYS_EAGER and CELERY_BROKER_URL.split('://')[0] in ('', 'memory'):
+    # Un broker en mémoire garde les tâches dans le processus web : ni worker ni beat ne les verraient
+    raise ImproperlyConfigured(
+        "CELERY_BROKER_URL doit désigner un broker partagé (ex. redis://localhost:6379/1) "
+        "quand les tâches ne s'exécutent pas sur place (DEBUG=False)"
+    )
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TIMEZONE = TIME_ZONE
+EMAIL_MAX_RETRIES = config('EMAIL_MAX_RETRIES', default=5, cast=int)
+
+# Tâches périodiques (celery -A config beat)
+CELERY_BEAT_SCHEDULE = {
+    # DISPONIBLE → EXPIRE pour les tickets dont la validité est terminée
+    'expirer-tickets': {
+        'task': 'apps.tickets.tasks.expirer_tickets',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    # Codes QR hors rétention et images orphelines
+    'purger-codes-qr': {
+        'task': 'apps.tickets.tasks.purger_codes_qr',
+        'schedule': crontab(hour=0, minute=20),
+    },
+}
 
 # Application Specific Settings
 QR_CODE_EXPIRY_MINUTES = config('QR_CODE_EXPIRY_MINUTES', default=3, cast=int)
+# Format des codes émis : 2 = jeton signé (apps/tickets/jetons_qr.py), 1 = ancien sha256 ; les deux sont acceptés au scanner
+QR_CODE_TOKEN_VERSION = config('QR_CODE_TOKEN_VERSION', default=2, cast=int)
+# Rétention des codes QR : expirés sans avoir servi / utilisés (jours, voir apps/tickets/purge_qr.py)
+QR_CODE_RETENTION_DAYS = config('QR_CODE_RETENTION_DAYS', default=7, cast=int)
+QR_CODE_USED_RETENTION_DAYS = config('QR_CODE_USED_RETENTION_DAYS', default=90, cast=int)
+# Scanner hors ligne : scans acceptés par envoi de synchronisation (apps/restaurants/hors_ligne.py)
+OFFLINE_SYNC_MAX_SCANS = config('OFFLINE_SYNC_MAX_SCANS', default=500, cast=int)
 MIN_TICKETS_PER_TRANSACTION = config('MIN_TICKETS_PER_TRANSACTION', default=1, cast=int)
 MAX_TICKETS_PER_TRANSACTION = config('MAX_TICKETS_PER_TRANSACTION', default=20, cast=int)
 MAX_TRANSACTIONS_PER_MONTH = config('MAX_TRANSACTIONS_PER_MONTH', default=1, cast=int)
@@ -276,6 +331,42 @@ TICKET_PRICE = config('TICKET_PRICE', default=500, cast=int)
 TICKET_FULL_PRICE = config('TICKET_FULL_PRICE', default=2000, cast=int)
 TICKET_SUBSIDY = config('TICKET_SUBSIDY', default=1500, cast=int)
 
+# Objectifs de latence du scanner restaurant (millisecondes)
+SCAN_LATENCY_TARGET_P50_MS = config('SCAN_LATENCY_TARGET_P50_MS', default=50, cast=int)
+SCAN_LATENCY_TARGET_P99_MS = config('SCAN_LATENCY_TARGET_P99_MS', default=250, cast=int)
+
+# Durée de mise en cache des rapports par agence (secondes)
+REPORTS_CACHE_TIMEOUT = config('REPORTS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Durée de mise en cache des pastilles de comptage des listes (secondes, 0 = pas de cache)
+FACET_COUNTS_CACHE_TIMEOUT = config('FACET_COUNTS_CACHE_TIMEOUT', default=30, cast=int)
+
+# Durée de conservation des rapports PDF générés en tâche de fond (heures)
+REPORT_FILES_TTL_HOURS = config('REPORT_FILES_TTL_HOURS', default=24, cast=int)
+# Au-delà (minutes), une tâche encore en attente ou en cours est tenue pour perdue et relancée
+REPORT_TASK_TIMEOUT_MINUTES = config('REPORT_TASK_TIMEOUT_MINUTES', default=30, cast=int)
+
+# Délai max. avant qu'un processus voie des paramètres système modifiés ailleurs (secondes)
+SYSTEM_PARAMS_REFRESH_SECONDS = config('SYSTEM_PARAMS_REFRESH_SECONDS', default=5, cast=int)
+
+# Délai max. avant qu'un processus voie un client ajouté / modifié dans le sélecteur de la vente (secondes)
+CLIENT_INDEX_REFRESH_SECONDS = config('CLIENT_INDEX_REFRESH_SECONDS', default=5, cast=int)
+
+# Tickets passés au statut EXPIRE par transaction lors de l'expiration quotidienne
+TICKET_EXPIRY_BATCH_SIZE = config('TICKET_EXPIRY_BATCH_SIZE', default=1000, cast=int)
+
+# Notifications en direct (flux SSE, servi uniquement sous ASGI : voir Procfile).
+# Les notifications sont créées par les workers web et Celery : le bus Redis les
+# relaie à tous les processus dès qu'une URL Redis est connue (NOTIFICATIONS_REDIS_URL,
+# sinon CACHE_URL). Sans Redis, BusMemoire ne sert que les flux du processus qui
+# crée la notification ; les autres navigateurs reviennent à l'interrogation de api_notifs.
+NOTIFICATIONS_REDIS_URL = config('NOTIFICATIONS_REDIS_URL', default=CACHE_URL if CACHE_URL.startswith('redis') else '')
+NOTIFICATIONS_BUS = config(
+    'NOTIFICATIONS_BUS',
+    default='apps.notifs.flux.BusRedis' if NOTIFICATIONS_REDIS_URL else 'apps.notifs.flux.BusMemoire',
+)
+NOTIFICATIONS_STREAM_KEEPALIVE = config('NOTIFICATIONS_STREAM_KEEPALIVE', default=25, cast=int)
+
 COMPANY_NAME = config('COMPANY_NAME', default='LONAB')
 MUTUELLE_NAME = config('MUTUELLE_NAME', default='MUTRALO')
 
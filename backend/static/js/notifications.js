@@ -0,0 +1,88 @@
+// ============================================
+// NOTIFICATIONS EN DIRECT (navbar)
+// Flux SSE quand le serveur est en ASGI ; sinon interrogation périodique de l'API.
+// ============================================
+
+(function () {
+    const dropdown = document.getElementById('notificationDropdown');
+    if (!dropdown) return;
+
+    const urlFlux = dropdown.dataset.urlFlux;
+    const urlApi = dropdown.dataset.urlApi;
+    const urlListe = dropdown.dataset.urlListe;
+    const DELAI_POLLING = 60000;
+
+    function echapper(texte) {
+        const d = document.createElement('div');
+        d.textContent = texte == null ? '' : texte;
+        return d.innerHTML;
+    }
+
+    function depuis(iso) {
+        const secondes = Math.max(0, (Date.now() - new Date(iso).getTime()) / 1000);
+        if (secondes < 60) return "à l'instant";
+        if (secondes < 3600) return Math.floor(secondes / 60) + ' min';
+        if (secondes < 86400) return Math.floor(secondes / 3600) + ' h';
+        return Math.floor(secondes / 86400) + ' j';
+    }
+
+    function afficherEtat(etat) {
+        const bouton = dropdown.querySelector('.navbar-icon');
+        let badge = bouton.querySelector('.notification-badge');
+        if (etat.count > 0) {
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'notification-badge';
+                bouton.appendChild(badge);
+            }
+            badge.textContent = etat.count;
+        } else if (badge) {
+            badge.remove();
+        }
+
+        const menu = dropdown.querySelector('.dropdown-menu');
+        let html = '<div class="dropdown-item" style="font-weight:600;color:var(--text-primary);">Notifications</div>'
+                 + '<div class="dropdown-divider"></div>';
+        if (etat.notifs.length) {
+            etat.notifs.forEach(n => {
+                html += '<a href="#" class="dropdown-item"><i class="fas fa-info-circle"></i><div>'
+                      + '<div style="font-weight:500;">' + echapper(n.titre) + '</div>'
+                      + '<div style="font-size:11px;color:var(--text-muted);">' + depuis(n.cree_le) + '</div>'
+                      + '</div></a>';
+            });
+            html += '<div class="dropdown-divider"></div>'
+                  + '<a href="' + urlListe + '" class="dropdown-item" style="text-align:center;color:var(--primary-green);">Voir tout</a>';
+        } else {
+            html += '<div class="dropdown-item" style="color:var(--text-muted);text-align:center;">Aucune notification</div>';
+        }
+        menu.innerHTML = html;
+    }
+
+    function interroger() {
+        fetch(urlApi, { credentials: 'same-origin', headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(r => r.ok ? r.json() : null)
+            .then(etat => { if (etat) afficherEtat(etat); })
+            .catch(() => {});
+    }
+
+    function demarrerPolling() {
+        setInterval(() => { if (!document.hidden) interroger(); }, DELAI_POLLING);
+    }
+
+    if (!window.EventSource || !urlFlux) {
+        demarrerPolling();
+        return;
+    }
+
+    const source = new EventSource(urlFlux);
+    source.addEventListener('etat', e => afficherEtat(JSON.parse(e.data)));
+    source.addEventListener('nouvelle', e => {
+        const n = JSON.parse(e.data);
+        if (typeof showToast === 'function') showToast(n.titre, 'info', 4500);
+    });
+    source.onerror = () => {
+        // 204 (serveur WSGI) ou refus : le navigateur ne se reconnecte pas
+        if (source.readyState === EventSource.CLOSED) demarrerPolling();
+    };
+    window.addEventListener('beforeunload', () => source.close());
+}());